@@ -7,13 +7,16 @@ if Settings.allowed_chats == []:
     raise octobot.DontLoadPlugin("All chats are allowed")
 
 
-@octobot.MessageHandler(priority=-1)
+def is_disallowed(update: telegram.Update):
+    return update.effective_chat.type == "supergroup" and update.effective_chat.id not in Settings.allowed_chats
+
+
+@octobot.MessageHandler(priority=-1, update_filter=is_disallowed)
 def check_allowed(bot, ctx):
-    if ctx.chat.type == "supergroup" and ctx.chat.id not in Settings.allowed_chats:
-        try:
-            ctx.reply(Settings.disallowed_chat_reason)
-            ctx.chat.leave()
-        except telegram.error.Unauthorized:
-            pass
-        finally:
-            raise octobot.StopHandling
+    try:
+        ctx.reply(Settings.disallowed_chat_reason)
+        ctx.chat.leave()
+    except telegram.error.Unauthorized:
+        pass
+    finally:
+        raise octobot.StopHandling
@@ -1,8 +1,34 @@
-import octobot
-import octobot.localization
-import gettext
+import hashlib
 import json
 import os
+from concurrent.futures import ThreadPoolExecutor
+
+import octobot
+import octobot.localization
+
+# Hash of language code to sha1 of last published command list, "" is the default list
+COMMANDS_HASH_KEY = "bot_commands_hash:{bot_id}"
+MAX_PUBLISH_THREADS = 8
+
+
+def command_lists(command_list) -> dict:
+    """
+    :return: Dictionary of Bot API language code ("" for default list) to translated command list
+    """
+    lists = {"": command_list}
+    for language in octobot.localization.AVAILABLE_LOCALES:
+        translation = octobot.localization.get_translation(language)
+        lists[language.split("-")[0]] = [[command, translation.gettext(command_desc)]
+                                         for command, command_desc in command_list]
+    return lists
+
+
+def publish_commands(bot: octobot.OctoBot, language_code: str, commands: list):
+    inf.logger.info("Setting command list for language %s", language_code or "default")
+    if language_code:
+        bot.set_my_commands(commands, language_code=language_code)
+    else:
+        bot.set_my_commands(commands)
 
 
 def send_commands(bot: octobot.OctoBot):
@@ -17,20 +43,31 @@ def send_commands(bot: octobot.OctoBot):
         os.makedirs("public", exist_ok=True)
         with open("public/commands.json", "w") as f:
             json.dump(command_list, f)
-    else:
-        bot.set_my_commands(command_list)
-        for language in octobot.localization.AVAILABLE_LOCALES:
-            command_list_locale = []
-            gt = gettext.translation("messages", localedir="locales", languages=[
-                language], fallback=True)
-
-            for (command, command_desc) in command_list:
-                command_list_locale.append([command, gt.gettext(command_desc)])
-                inf.logger.debug("%s -> %s", command_desc,
-                                 gt.gettext(command_desc))
-            language = language.split("-")[0]
-            inf.logger.info("Setting command list for language %s", language)
-            bot.set_my_commands(command_list_locale, language_code=language)
+        return
+    redis = octobot.Database.redis
+    hash_key = COMMANDS_HASH_KEY.format(bot_id=bot.id)
+    published = redis.hgetall(hash_key) if redis is not None else {}
+    changed = {}
+    for language_code, commands in command_lists(command_list).items():
+        commands_hash = hashlib.sha1(json.dumps(commands).encode()).hexdigest()
+        if published.get(language_code.encode()) != commands_hash.encode():
+            changed[language_code] = (commands, commands_hash)
+    inf.logger.info("Command lists changed for %s languages", len(changed))
+    if not changed:
+        return
+    with ThreadPoolExecutor(min(MAX_PUBLISH_THREADS, len(changed)), thread_name_prefix="CommandPublisher") as executor:
+        futures = {language_code: executor.submit(publish_commands, bot, language_code, commands)
+                   for language_code, (commands, _) in changed.items()}
+    new_hashes = {}
+    for language_code, future in futures.items():
+        try:
+            future.result()
+        except Exception:
+            inf.logger.error("Failed to set command list for language %s", language_code or "default", exc_info=True)
+        else:
+            new_hashes[language_code] = changed[language_code][1]
+    if new_hashes and redis is not None:
+        redis.hset(hash_key, mapping=new_hashes)
 
 
 inf = octobot.PluginInfo("Command list copier", after_load=send_commands)
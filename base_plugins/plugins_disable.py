@@ -71,9 +71,11 @@ def disable_plugin(bot: octobot.OctoBot, ctx: octobot.Context):
         send_disableable_plugins_reply(ctx)
     elif ctx.query == "*":
         octobot.Database.redis.sadd(f"plugins_disabled{ctx.chat.id}", *PLUGINS.keys())
+        octobot.Database.invalidate_disabled_plugins(ctx.chat.id)
         return ctx.reply(ctx.localize("All disable-able plugins were disabled."))
     elif ctx.query in PLUGINS:
         octobot.Database.redis.sadd(f"plugins_disabled{ctx.chat.id}", ctx.query)
+        octobot.Database.invalidate_disabled_plugins(ctx.chat.id)
         return ctx.reply(ctx.localize("{plugin_desc} (<code>{plugin_id}</code>) was disabled.").format(
             plugin_desc=PLUGINS[ctx.query],
             plugin_id=ctx.query
@@ -89,9 +91,11 @@ def enable_plugin(bot: octobot.OctoBot, ctx: octobot.Context):
         send_disableable_plugins_reply(ctx)
     elif ctx.query == "*":
         octobot.Database.redis.delete(f"plugins_disabled{ctx.chat.id}")
+        octobot.Database.invalidate_disabled_plugins(ctx.chat.id)
         return ctx.reply(ctx.localize("All disable-able plugins were enabled."))
     elif ctx.query in PLUGINS:
         octobot.Database.redis.srem(f"plugins_disabled{ctx.chat.id}", ctx.query)
+        octobot.Database.invalidate_disabled_plugins(ctx.chat.id)
         return ctx.reply(ctx.localize("{plugin_desc} (<code>{plugin_id}</code>) was enabled.").format(
             plugin_desc=PLUGINS[ctx.query],
             plugin_id=ctx.query
@@ -2,9 +2,8 @@ import html
 import os
 import subprocess
 
-import telegram
-
 import octobot
+import octobot.localization
 
 inf = octobot.PluginInfo("Bot update",
                          handler_kwargs={
@@ -21,11 +20,12 @@ if octobot.is_docker:
     inf.state_description = "Running inside Docker"
 
 def reload(bot: octobot.OctoBot, ctx):
-    msg: telegram.Message = ctx.reply("Reloading...")
+    ctx.reply("Reloading...")
     msg_res = []
     for plugin in bot.discover_plugins()["load_order"]:
         res = bot.load_plugin(plugin)
         msg_res.append(f"{plugin} - {res}")
+    octobot.localization.load_translations()
     bot.update_handlers()
     ctx.edit("Reload complete. Plugin statuses:\n" + "\n".join(msg_res))
 
@@ -1,11 +1,19 @@
+import json
 import logging
 
-import requests
-
+import os
+import signal
+import socket
 import threading
-from queue import Queue, Empty
 
 import octobot.enums
+from octobot.dispatcher import AsyncDispatcher, Dispatcher
+from octobot.offsets import UpdateOffsetTracker
+from octobot.prefork import PreforkDispatcher
+from octobot.sendqueue import SendQueue
+from octobot.streamqueue import StreamConsumer, StreamPublisher
+from octobot import httpclient, tracing
+from octobot.webhook import WebhookServer
 import fakeredis
 try:
     import preimport
@@ -19,28 +27,47 @@ import sys
 import time
 
 import telegram
+import telegram.ext
 import octobot
 from settings import Settings
 import logging
 
 logger = logging.getLogger("Bot")
 
+ALLOWED_UPDATES = ["message", "edited_message", "inline_query", "callback_query", "chosen_inline_result",
+                   "chat_member", "my_chat_member"]
+
+
+def update_loop(bot, queue, stop_event: threading.Event, offsets: UpdateOffsetTracker, raw_updates=False):
+    resume = Settings.updates.resume and offsets.load() is not None
+    bot.deleteWebhook(drop_pending_updates=not resume)
 
-def update_loop(bot, queue):
-    update_id = None
-    bot.deleteWebhook(drop_pending_updates=True)
+    def dispatch(update: telegram.Update):
+        # Callback data cache is local to process that sent the keyboard, so updates that are handled elsewhere
+        # are passed without resolving it
+        if not raw_updates:
+            bot.insert_callback_data(update)
+        logger.debug(update)
+        queue.put((bot, update))
+
+    if Settings.updates.resume:
+        for data in offsets.load_backlog():
+            dispatch(telegram.Update.de_json(json.loads(data), bot))
+    # Updates are stored unresolved, callback data is resolved by dispatch
+    get_updates = super(telegram.ext.ExtBot, bot).get_updates
     conflict_count = 0
     try:
-        while True:
+        while not stop_event.is_set():
             try:
                 logger.debug("Fetching updates...")
-                for update in bot.get_updates(update_id, timeout=15 if Settings.production else 1,
-                                              allowed_updates=["message", "edited_message",
-                                                               "inline_query", "callback_query",
-                                                               "chosen_inline_result"]):
-                    update_id = update.update_id + 1
-                    logger.debug(update)
-                    queue.put((bot, update))
+                updates = [update for update in get_updates(offsets.fetch_offset(),
+                                                            timeout=15 if Settings.production else 1,
+                                                            allowed_updates=ALLOWED_UPDATES)
+                           if offsets.received(update.update_id)]
+                # Next getUpdates confirms these to Telegram
+                offsets.persist({update.update_id: update.to_json() for update in updates})
+                for update in updates:
+                    dispatch(update)
                 conflict_count = 0
             except (telegram.error.TimedOut, telegram.error.NetworkError):
                 time.sleep(1)
@@ -58,22 +85,22 @@ def update_loop(bot, queue):
         return
 
 
-def update_handler(upd_queue: Queue, stop_event: threading.Event):
-    stop_running = False
-    while not stop_running:
-        try:
-            qupdate = upd_queue.get_nowait()
-        except Empty:
-            time.sleep(0.2)
-        else:
-            bot = qupdate[0]
-            update: telegram.Update = qupdate[1]
-            try:
-                bot.handle_update(bot, update)
-            except octobot.Halt:
-                stop_event.set()
-        stop_running = stop_event.is_set()
-    logger.info("Stop event is set, exiting, exiting...")
+def webhook_loop(bot, queue, stop_event: threading.Event):
+    bot.set_webhook(Settings.webhook.url, allowed_updates=ALLOWED_UPDATES,
+                    max_connections=Settings.webhook.max_connections,
+                    secret_token=Settings.webhook.secret_token or None)
+    server = WebhookServer((Settings.webhook.listen, Settings.webhook.port), bot, queue,
+                           secret_token=Settings.webhook.secret_token, path=Settings.webhook.path)
+    server_thread = threading.Thread(target=server.serve_forever, name="WebhookServer", daemon=True)
+    server_thread.start()
+    logger.info("Webhook server listening on %s:%s", Settings.webhook.listen, Settings.webhook.port)
+    try:
+        stop_event.wait()
+    except KeyboardInterrupt:
+        logger.info("Webhook server - stopping.")
+    finally:
+        server.shutdown()
+        server.server_close()
 
 
 STATES_EMOJIS = {
@@ -98,40 +125,142 @@ def create_startup_msg(bot):
     return msg
 
 
-def create_threads():
-    threads = []
-    queue = Queue()
-    stop_event = threading.Event()
-    for i in range(Settings.threads):
-        thread = threading.Thread(target=update_handler, args=(
-            queue, stop_event), name=f"UpdateHandler{i}")
-        threads.append(thread)
-        thread.start()
-    return threads, queue, stop_event
+def create_send_queue(processes=1):
+    # Global limit is shared between processes that send messages
+    return SendQueue(global_rate=Settings.send_queue.global_rate / processes,
+                     private_rate=Settings.send_queue.private_rate,
+                     group_rate=Settings.send_queue.group_rate, burst=Settings.send_queue.burst,
+                     workers=Settings.send_queue.workers).start()
+
+
+def start_metrics_server(bot, dispatcher):
+    registry = tracing.registry
+    registry.register_gauge("octobot_dispatcher_queue_size", "Updates waiting to be handled",
+                            lambda: [({}, dispatcher.qsize())])
+    if bot.send_queue is not None:
+        registry.register_gauge("octobot_send_queue_size", "Bot API calls waiting to be sent",
+                                lambda: [({}, bot.send_queue.qsize())])
+    registry.register_gauge("octobot_http_active_requests", "Outgoing HTTP requests in flight",
+                            lambda: [({"host": host}, stats["active"])
+                                     for host, stats in httpclient.session.stats().items()])
+    registry.register_gauge("octobot_http_pool_waits", "Outgoing HTTP requests that waited for free connection",
+                            lambda: [({"host": host}, stats["waits"])
+                                     for host, stats in httpclient.session.stats().items()])
+    registry.register_gauge("octobot_bot_api_pool_free", "Free connection slots in Bot API pool",
+                            lambda: [({"host": host}, stats["free"])
+                                     for host, stats in httpclient.pool_stats(bot.request._con_pool).items()])
+    if octobot.Database.local_cache is not None:
+        registry.register_gauge("octobot_local_cache", "Local settings cache statistics",
+                                lambda: [({"stat": stat}, value)
+                                         for stat, value in octobot.Database.local_cache.stats().items()])
+    server = tracing.MetricsServer((Settings.tracing.metrics_listen, Settings.tracing.metrics_port))
+    threading.Thread(target=server.serve_forever, name="MetricsServer", daemon=True).start()
+    logger.info("Metrics server listening on %s:%s", Settings.tracing.metrics_listen, Settings.tracing.metrics_port)
+    return server
+
+
+def create_dispatcher(stop_event, on_handled=None):
+    if Settings.execution_mode == "asyncio":
+        logger.info("Using asyncio execution mode")
+        return AsyncDispatcher(Settings.async_concurrency, Settings.threads, stop_event=stop_event,
+                               on_handled=on_handled).start()
+    return Dispatcher(Settings.threads, stop_event=stop_event, on_handled=on_handled).start()
+
+
+def prefork_workers():
+    if not Settings.prefork.enabled or Settings.stream_queue.enabled:
+        return 0
+    if isinstance(octobot.Database.redis, fakeredis.FakeRedis):
+        logger.error("Prefork mode needs Redis shared between processes, falling back to threads")
+        return 0
+    return Settings.prefork.workers or os.cpu_count() or 1
+
+
+def create_prefork_dispatcher(bot, workers, stop_event, on_handled=None):
+    def after_fork():
+        httpclient.session.reset_pools()
+        bot._request = httpclient.create_bot_request()
+        octobot.Database.start_invalidation_listener()
+        if Settings.send_queue.enabled:
+            bot.send_queue = create_send_queue(workers)
+
+    return PreforkDispatcher(bot, workers, lambda handled: create_dispatcher(threading.Event(), handled),
+                             after_fork=after_fork, stop_event=stop_event, on_handled=on_handled).start()
+
+
+def create_stream_consumer(bot):
+    return StreamConsumer(octobot.Database.redis, bot, f"{socket.gethostname()}:{os.getpid()}",
+                          partitions=Settings.stream_queue.partitions, prefix=Settings.stream_queue.prefix,
+                          lease_ttl=Settings.stream_queue.lease_ttl, prefetch=Settings.stream_queue.prefetch,
+                          max_deliveries=Settings.stream_queue.max_deliveries)
 
 
 def main():
     if Settings.telegram_base_url != "https://api.telegram.org/bot":
-        r = requests.get(
+        r = octobot.httpclient.session.get(
             f"https://api.telegram.org/bot{Settings.telegram_token}/logOut")
         logger.info("Using local bot API, logout result: %s", r.text)
     bot = octobot.OctoBot(sys.argv[1:], Settings.telegram_token, base_url=Settings.telegram_base_url,
-                          base_file_url=Settings.telegram_base_file_url)
+                          base_file_url=Settings.telegram_base_file_url, request=httpclient.create_bot_request())
     bot.send_message(Settings.owner, create_startup_msg(bot))
     logger.info("Creating update handle threads...")
     if Settings.telegram_base_file_url_force:
         logger.warning("Forcefully overriding base url")
         bot.base_file_url = Settings.telegram_base_file_url
-    threads, queue, stop_event = create_threads()
+    # Nothing may start threads before prefork workers are forked, they would not exist in workers
+    # and locks they hold would stay locked there
+    workers = prefork_workers()
+    if not workers:
+        octobot.Database.start_invalidation_listener()
+    if Settings.send_queue.enabled and not workers:
+        bot.send_queue = create_send_queue()
+    offsets = UpdateOffsetTracker(octobot.Database.redis, bot.id, Settings.updates.offset_save_interval)
+    fetched = None if Settings.webhook.enabled else lambda update: offsets.done(update.update_id)
+    stop_event = threading.Event()
+    signal.signal(signal.SIGTERM, lambda signum, frame: stop_event.set())
+    stream_role = Settings.stream_queue.role if Settings.stream_queue.enabled else None
+    dispatcher = consumer = None
+    if stream_role in ("worker", "all"):
+        consumer = create_stream_consumer(bot)
+        dispatcher = create_dispatcher(stop_event, consumer.ack)
+        consumer.start(dispatcher, stop_event)
+        logger.info("Consuming updates from Redis stream %s", Settings.stream_queue.prefix)
+    if stream_role in ("fetcher", "all"):
+        queue = StreamPublisher(octobot.Database.redis, Settings.stream_queue.partitions, Settings.stream_queue.prefix,
+                                Settings.stream_queue.max_length, stop_event=stop_event, on_handled=fetched)
+        logger.info("Publishing updates to Redis stream %s", Settings.stream_queue.prefix)
+    elif stream_role == "worker":
+        queue = None
+    elif workers:
+        queue = dispatcher = create_prefork_dispatcher(bot, workers, stop_event, fetched)
+        octobot.Database.start_invalidation_listener()
+    else:
+        queue = dispatcher = create_dispatcher(stop_event, fetched)
+    if Settings.tracing.metrics_enabled:
+        start_metrics_server(bot, dispatcher or queue)
     logger.debug("API endpoint: %s", bot.base_url)
     logger.debug("API file endpoint: %s", bot.base_file_url)
-    logger.info("Starting update loop.")
-    update_loop(bot, queue)
-    logger.info("Stopping...")
+    if queue is None:
+        logger.info("Not fetching updates, stream queue role is worker.")
+        try:
+            stop_event.wait()
+        except KeyboardInterrupt:
+            stop_event.set()
+    elif Settings.webhook.enabled:
+        logger.info("Starting webhook server.")
+        webhook_loop(bot, queue, stop_event)
+    else:
+        logger.info("Starting update loop.")
+        update_loop(bot, queue, stop_event, offsets, raw_updates=stream_role is not None or workers > 0)
     stop_event.set()
-    for thread in threads:
-        logger.debug("Joining thread %s", thread)
-        thread.join()
+    if dispatcher is not None:
+        logger.info("Stopping, waiting for %s queued updates...", dispatcher.qsize())
+        dispatcher.stop(Settings.updates.drain_timeout or None)
+    if consumer is not None:
+        consumer.stop()
+    offsets.save()
+    if bot.send_queue is not None:
+        bot.send_queue.stop()
     logger.info("Bye!")
     sys.exit()
 
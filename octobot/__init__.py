@@ -1,7 +1,8 @@
+import functools
 import os
 import subprocess
 
-from octobot.database import Database
+from octobot.database import Database, CachePolicy
 from octobot.localization import localizable
 from octobot.enums import PluginStates
 from octobot.exceptions import *
@@ -26,7 +27,7 @@ def supergroup_only(function):
 
     def wrapper(bot, context):
         if (isinstance(context, octobot.CallbackContext) or type(context) == octobot.MessageContext) and context.chat.type == "supergroup":
-            function(bot, context)
+            return function(bot, context)
         else:
             context.reply(context.localize(
                 "This command can be used only in supergroups."))
@@ -34,11 +35,21 @@ def supergroup_only(function):
     return wrapper
 
 
-try:
-    if not is_docker:
-        __version__ = subprocess.check_output('git describe --dirty',
-                                              shell=True).decode('utf-8').replace("\n", "")
-    elif os.path.exists(".git-version"):
-        __version__ = open(".git-version").read().replace("\n", "")
-except Exception:
-    __version__ = "Unknown"
+@functools.lru_cache(maxsize=None)
+def _get_version():
+    try:
+        if not is_docker:
+            return subprocess.check_output('git describe --dirty',
+                                           shell=True).decode('utf-8').replace("\n", "")
+        elif os.path.exists(".git-version"):
+            return open(".git-version").read().replace("\n", "")
+    except Exception:
+        pass
+    return "Unknown"
+
+
+def __getattr__(name):
+    # __version__ runs git, so it is resolved on first access instead of import
+    if name == "__version__":
+        return _get_version()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,66 @@
+import asyncio
+import contextvars
+import functools
+import inspect
+import logging
+
+logger = logging.getLogger("AsyncIO")
+
+
+async def to_thread(function, *args, **kwargs):
+    """
+    Runs blocking function in event loop executor and waits for the result without blocking the loop.
+    Use it in coroutine handlers for things that don't have async version, like Bot API calls.
+    Context variables are copied into the thread, same as :func:`asyncio.to_thread` does.
+
+    :param function: Function to run
+    :type function: callable
+    :return: Function result
+    """
+    loop = asyncio.get_running_loop()
+    context = contextvars.copy_context()
+    return await loop.run_in_executor(None, functools.partial(context.run, function, *args, **kwargs))
+
+
+async def maybe_await(value):
+    """
+    Awaits value if it is awaitable, returns it as is otherwise. Handlers can return coroutines
+    if they were defined with `async def`
+    """
+    if inspect.isawaitable(value):
+        return await value
+    return value
+
+
+def catch_exceptions(value, on_exception):
+    """
+    Handlers that catch exceptions of function they call with `try` only see synchronous errors: coroutine handler
+    raises when it is awaited, after handler returned. If `value` is a coroutine, it gets wrapped so exceptions raised
+    while awaiting it are passed to `on_exception` (called in executor, it can do blocking calls) too.
+
+    :param value: Function result
+    :param on_exception: Function called with exception
+    :type on_exception: callable
+    :return: `value`, or wrapped coroutine
+    """
+    if not inspect.isawaitable(value):
+        return value
+
+    async def wrapper():
+        try:
+            return await value
+        except Exception as e:
+            return await to_thread(on_exception, e)
+
+    return wrapper()
+
+
+def run_sync(value):
+    """
+    Synchronous counterpart of :func:`maybe_await`, used when bot runs in threads mode and coroutine handler was called.
+    Coroutine gets executed in fresh event loop in current thread.
+    """
+    if inspect.iscoroutine(value):
+        logger.debug("Running coroutine %s outside of asyncio mode", value)
+        return asyncio.run(value)
+    return value
@@ -6,7 +6,7 @@ from octobot.classes.context import Context, CallbackContext, MessageContext, Ch
 import logging
 from dataclasses import dataclass, field
 from enum import Enum
-from typing import Any, Callable, Optional, Dict
+from typing import Any, Callable, Optional, Dict, List
 
 
 class UpdateType(Enum):
@@ -43,8 +43,16 @@ class PluginInfo():
     :param module: Plugin module. Dont pass anything to that argument, used by loader and handlers
     :param can_disable: If plugin can be disabled using /disable_plugin. All plugins located in base_plugins cant be disabled no matter if variable set to false or not.
     :type can_disable: `bool`
+    :param requires: Plugins (in module format, ex. `plugins.test`) this plugin depends on. Plugin gets disabled if
+        any of them is not loaded, and its `after_load` runs after theirs
+    :type requires: list, optional
+    :param load_after: Plugins this plugin has to be placed after if they are loaded: their handlers are registered
+        and their `after_load` functions run before this plugin's ones
+    :type load_after: list, optional
     :var logger: Logger, generated by PluginInfo. Not an argument, a variable
     :type logger: `logging.Logger`
+    :var plugin_mask: Bit of plugin in per-chat disabled plugins masks, set by loader
+    :type plugin_mask: `int`
     """
     name: str
     reply_kwargs: dict = field(default_factory=dict)
@@ -56,6 +64,9 @@ class PluginInfo():
     last_warning: str = None
     module = None
     can_disable: bool = True
+    requires: List[str] = field(default_factory=list)
+    load_after: List[str] = field(default_factory=list)
+    plugin_mask: int = field(default=0, init=False)
 
     def __post_init__(self):
         self.logger = logging.getLogger(self.name)
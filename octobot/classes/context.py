@@ -1,7 +1,6 @@
 from uuid import uuid4
 from settings import Settings
-from octobot.utils import add_photo_to_text
-import gettext
+from octobot.utils import add_photo_to_text, lazy_property
 import html
 import logging
 import re
@@ -9,6 +8,8 @@ import shlex
 import warnings
 from functools import wraps
 import time
+import typing
+from concurrent.futures import Future
 
 import babel
 import telegram
@@ -17,7 +18,9 @@ from telegram import InputMediaPhoto
 
 import octobot
 import octobot.exceptions
-from octobot import database
+from octobot import database, ratelimit
+from octobot.aio import to_thread
+from octobot.sendqueue import Priority
 
 Database = database.Database
 
@@ -46,6 +49,11 @@ def pluginfo_kwargs(field_name):
     return decorator
 
 
+def _log_send_error(future: Future):
+    if future.exception() is not None:
+        logger.warning("Bot API call failed", exc_info=future.exception())
+
+
 class Context:
     """
     Context class. It provides, well, context.
@@ -62,6 +70,10 @@ class Context:
     :vartype chat_db: :class:`octobot.database.RedisData`
     :var locale: User/Chat locale
     :vartype locale: :class:`babel.Locale`
+    :var gettext: gettext function of translation for context locale
+    :vartype gettext: callable
+    :var ngettext: ngettext function of translation for context locale
+    :vartype ngettext: callable
     :var update_type: DEPRECATED: Type of update
     :vartype update_type: :class:`octobot.UpdateType`
     :var query: Command query
@@ -72,6 +84,8 @@ class Context:
     :vartype reply_to_message: :class:`octobot.Context`, optional
     :var update: Original update
     :vartype update: :class:`telegram.Update`
+    :var preloaded: Values fetched from database before context creation
+    :vartype preloaded: :class:`octobot.database.UpdatePreload`
     """
     _plugin = "unknown"
     _handler = "unknown"
@@ -79,40 +93,71 @@ class Context:
     text = None
     replied = False
     called_command = None
+    ratelimit_state = ratelimit.UNCHECKED
     user: telegram.User
     chat: telegram.Chat
     _update_type = 'unknown'
+    _update_field = None
 
-    def __init__(self, update: telegram.Update, bot: "octobot.OctoBot", message: telegram.Message = None):
+    def __init__(self, update: telegram.Update, bot: "octobot.OctoBot", message: telegram.Message = None,
+                 preload: database.UpdatePreload = None):
         if Context == type(self):
             raise RuntimeError(
                 "Calling Context class directly! Please use Context.create_context instead...")
-        self.locale_str = "en"
         self.bot = bot
         self.update = update
-        self.locale_str = octobot.localization.get_chat_locale(self.update)
+        if preload is None:
+            preload = Database.preload_update(update)
+        self.preloaded = preload
+        self.user = update.effective_user
+        self.chat = update.effective_chat
+        if self.text is None:
+            self.text = ''
+
+    # Attributes below are computed on first access, most handlers don't need all of them
+
+    @lazy_property
+    def locale_str(self) -> str:
+        return octobot.localization.get_chat_locale(self.update, self.preloaded)
+
+    @lazy_property
+    def locale(self) -> babel.Locale:
         if "_" in self.locale_str:
             loc_sep = "_"
         else:
             loc_sep = "-"
-        self.locale = babel.Locale.parse(self.locale_str, sep=loc_sep)
-        self.user = update.effective_user
-        if self.user is not None:
-            self.user_db = Database[self.user.id]
-        else:
-            self.user_db = None
-        self.chat = update.effective_chat
-        if self.chat is None and self.user is not None:
-            self.chat_db = Database[self.user.id]
+        return babel.Locale.parse(self.locale_str, sep=loc_sep)
+
+    @lazy_property
+    def gettext(self):
+        return octobot.localization.get_translation(self.locale_str).gettext
+
+    @lazy_property
+    def ngettext(self):
+        return octobot.localization.get_translation(self.locale_str).ngettext
+
+    @lazy_property
+    def user_db(self) -> typing.Optional[database.RedisData]:
+        if self.user is None:
+            return None
+        return Database[self.user.id]
+
+    @lazy_property
+    def chat_db(self) -> typing.Optional[database.RedisData]:
         if self.chat is not None:
-            self.chat_db = Database[self.chat.id]
-        if self.text is None:
-            self.text = ''
-        self.query = " ".join(self.text.split(" ")[1:])
+            return Database[self.chat.id]
+        return self.user_db
+
+    @lazy_property
+    def query(self) -> str:
+        return " ".join(self.text.split(" ")[1:])
+
+    @lazy_property
+    def args(self) -> typing.List[str]:
         try:
-            self.args = shlex.split(self.query)
+            return shlex.split(self.query)
         except ValueError:
-            self.args = self.query.split(" ")
+            return self.query.split(" ")
 
     @property
     def update_type(self):
@@ -151,6 +196,10 @@ class Context:
         :type editable: :class:`bool`, optional
         :param inline_description: Description for inline mode, optional, defaults to first 400 symbols of `text`
         :type inline_description: :class:`str`
+
+        :return: For messages, future with sent :class:`telegram.Message`. Reply is sent without waiting for it,
+            call `result()` of the future if you need the message. Failed replies are logged
+        :rtype: :class:`concurrent.futures.Future`, optional
         """
         self.replied = True
         if photo_url and not photo_primary:
@@ -168,6 +217,12 @@ class Context:
                            title, to_pm, failed, editable, inline_description, photo_primary,
                            file_url)
 
+    async def areply(self, *args, **kwargs):
+        """
+        Awaitable version of :meth:`reply`, for coroutine handlers. Takes same arguments.
+        """
+        return await to_thread(self.reply, *args, **kwargs)
+
     def _reply(self, text, photo_url=None, reply_to_previous=False, reply_markup=None, parse_mode=None,
                no_preview=False,
                title=None, to_pm=False, failed=False, editable=True, inline_description=None, photo_primary=False,
@@ -186,6 +241,8 @@ class Context:
         :type reply_markup: :class:`telegram.ReplyMarkup`, optional
         :param parse_mode: Parse mode of messages. Become 'html' if photo_url is passed. Available values are `markdown`, `html` and None
         :type parse_mode: :class:`str`, optional
+
+        .. note:: Edit is sent without waiting for it, failed edits are logged
         """
         if photo_url and not photo_primary:
             if parse_mode is None or parse_mode.lower() != "html":
@@ -194,9 +251,51 @@ class Context:
             text = add_photo_to_text(text, photo_url)
         return self._edit(text, photo_url, reply_markup, parse_mode, photo_primary)
 
+    async def aedit(self, *args, **kwargs):
+        """
+        Awaitable version of :meth:`edit`, for coroutine handlers. Takes same arguments.
+        """
+        return await to_thread(self.edit, *args, **kwargs)
+
     def _edit(self, text=None, photo_url=None, reply_markup=None, parse_mode=None, photo_primary=False):
         raise RuntimeError(f"Override _edit in {type(self)}!")
 
+    def _send_nowait(self, chat_id, priority: Priority, function, /, *args, **kwargs) -> Future:
+        """
+        Makes Bot API call through bot send queue without waiting for it. Errors are logged
+        """
+        future = self.bot.call_queued(chat_id, priority, function, *args, **kwargs)
+        future.add_done_callback(_log_send_error)
+        return future
+
+    def _send_with_fallback(self, chat_id, priority: Priority, function, kwargs: dict,
+                            fallback: typing.Callable[[], typing.Tuple[typing.Callable, dict]]) -> Future:
+        """
+        Makes Bot API call through bot send queue without waiting for it. If call fails with
+        :class:`telegram.error.TelegramError`, makes call returned by `fallback` instead. Errors are logged
+
+        :return: Future with result of the call that succeeded
+        """
+        result = Future()
+
+        def copy_result(future: Future):
+            if future.exception() is not None:
+                result.set_exception(future.exception())
+            else:
+                result.set_result(future.result())
+
+        def sent(future: Future):
+            if isinstance(future.exception(), telegram.error.TelegramError):
+                fallback_function, fallback_kwargs = fallback()
+                self.bot.call_queued(chat_id, priority, fallback_function, **fallback_kwargs).add_done_callback(
+                    copy_result)
+            else:
+                copy_result(future)
+
+        result.add_done_callback(_log_send_error)
+        self.bot.call_queued(chat_id, priority, function, **kwargs).add_done_callback(sent)
+        return result
+
     def localize(self, text: str) -> str:
         """
         Localize string according to user-set localization
@@ -206,10 +305,7 @@ class Context:
         :return: Localized string
         :rtype: :class:`str`
         """
-        gt = gettext.translation("messages", localedir="locales", languages=[
-                                 self.locale_str], fallback=True)
-
-        return gt.gettext(text)
+        return self.gettext(text)
 
     def nlocalize(self, singular: str, plural: str, n: int) -> str:
         """
@@ -224,26 +320,25 @@ class Context:
         :return: Localized string
         :rtype: :class:`str`
         """
-        gt = gettext.translation("messages", localedir="locales", languages=[
-                                 self.locale_str], fallback=True)
-
-        return gt.ngettext(singular, plural, n)
+        return self.ngettext(singular, plural, n)
 
     @staticmethod
-    def create_context(update, bot, message=None):
+    def create_context(update, bot, message=None, preload=None):
         if message is None and update.message is not None:
             message = update.message
+        if preload is None:
+            preload = Database.preload_update(update)
 
         if update.inline_query:
-            return InlineQueryContext(update, bot, message)
+            return InlineQueryContext(update, bot, message, preload)
         elif update.callback_query:
-            return CallbackContext(update, bot, message)
+            return CallbackContext(update, bot, message, preload)
         elif message:
-            return MessageContext(update, bot, message)
+            return MessageContext(update, bot, message, preload)
         elif update.edited_message:
-            return EditedMessageContext(update, bot, message)
+            return EditedMessageContext(update, bot, message, preload)
         elif update.chosen_inline_result:
-            return ChosenInlineResultContext(update, bot, message)
+            return ChosenInlineResultContext(update, bot, message, preload)
         else:
             raise octobot.exceptions.UnknownUpdate(
                 "Failed to determine update type for update %s", update.to_dict())
@@ -253,11 +348,13 @@ class InlineQueryContext(Context):
     """
     Context for inline queries
     """
+    _update_field = "inline_query"
 
-    def __init__(self, update: telegram.Update, bot: "octobot.OctoBot", message: telegram.Message = None):
+    def __init__(self, update: telegram.Update, bot: "octobot.OctoBot", message: telegram.Message = None,
+                 preload: database.UpdatePreload = None):
         self.text = update.inline_query.query
         self._update_type = octobot.UpdateType.inline_query
-        super(InlineQueryContext, self).__init__(update, bot, message)
+        super(InlineQueryContext, self).__init__(update, bot, message, preload)
 
     def _reply(self, text, photo_url=None, reply_to_previous=False, reply_markup=None, parse_mode=None,
                no_preview=False,
@@ -275,16 +372,18 @@ class InlineQueryContext(Context):
                                                    input_message_content=inline_content,
                                                    reply_markup=reply_markup,
                                                    thumb_url=photo_url)
-        self.update.inline_query.answer(
-            [result], cache_time=(360 if Settings.production else 0))
+        self._send_nowait(None, Priority.urgent, self.update.inline_query.answer,
+                          [result], cache_time=(360 if Settings.production else 0))
 
 
 class CallbackContext(Context):
     """
     Context for callbacks
     """
+    _update_field = "callback_query"
 
-    def __init__(self, update: telegram.Update, bot: "octobot.OctoBot", message: telegram.Message = None):
+    def __init__(self, update: telegram.Update, bot: "octobot.OctoBot", message: telegram.Message = None,
+                 preload: database.UpdatePreload = None):
         self.callback_data = update.callback_query.data
         self.text = ''
         if isinstance(self.callback_data, str):
@@ -293,17 +392,19 @@ class CallbackContext(Context):
             self.callback_data = octobot.InvalidCallback
         logger.debug("text: %s" % self.text)
         self._update_type = octobot.UpdateType.button_press
-        super(CallbackContext, self).__init__(update, bot, message)
+        super(CallbackContext, self).__init__(update, bot, message, preload)
 
     def _reply(self, text, photo_url=None, reply_to_previous=False, reply_markup=None, parse_mode=None,
                no_preview=False,
                title=None, to_pm=False, failed=False, editable=True, inline_description=None, photo_primary=False,
                file_url=None):
-        self.update.callback_query.answer(text)
+        self._send_nowait(None, Priority.urgent, self.update.callback_query.answer, text)
 
     def _edit(self, text=None, photo_url=None, reply_markup=None, parse_mode=None, photo_primary=False):
         kwargs = dict(parse_mode=parse_mode,
                       reply_markup=reply_markup)
+        message = self.update.callback_query.message
+        chat_id = message.chat_id if message is not None else None
         if photo_url is not None and photo_primary:
             kwargs = dict(
                 media=InputMediaPhoto(media=photo_url[0], caption=text,
@@ -317,26 +418,30 @@ class CallbackContext(Context):
                              self.update.callback_query.chat_instance)
                 kwargs["chat_id"] = self.update.callback_query.message.chat_id
                 kwargs["message_id"] = self.update.callback_query.message.message_id
-            try:
-                self.bot.edit_message_media(**kwargs)
-            except telegram.error.TelegramError:
+
+            def edit_failed(future: Future):
+                if not isinstance(future.exception(), telegram.error.TelegramError):
+                    return
+                fallback_text = text
                 if parse_mode.lower() != 'html':
-                    text = html.escape(text)
-                text = f'<b><a href="{photo_url[0]}">Link to image</a></b>\n\n' + text
+                    fallback_text = html.escape(fallback_text)
+                fallback_text = f'<b><a href="{photo_url[0]}">Link to image</a></b>\n\n' + fallback_text
                 kwargs["media"] = InputMediaPhoto(
-                    media=Settings.no_image, caption=text, parse_mode=parse_mode)
-                self.bot.edit_message_media(**kwargs)
+                    media=Settings.no_image, caption=fallback_text, parse_mode=parse_mode)
+                self._send_nowait(chat_id, Priority.normal, self.bot.edit_message_media, **kwargs)
+
+            self.bot.call_queued(chat_id, Priority.normal, self.bot.edit_message_media,
+                                 **kwargs).add_done_callback(edit_failed)
         elif text is not None and not photo_primary:
-            self.update.callback_query.edit_message_text(
-                text=text, **kwargs
-            )
+            self._send_nowait(chat_id, Priority.normal, self.update.callback_query.edit_message_text,
+                              text=text, **kwargs)
         elif text is not None and photo_primary:
-            self.update.callback_query.edit_message_caption(
-                caption=text, **kwargs
-            )
+            self._send_nowait(chat_id, Priority.normal, self.update.callback_query.edit_message_caption,
+                              caption=text, **kwargs)
         elif reply_markup is not None:
             logger.debug("updating reply markup to %s", reply_markup)
-            self.update.callback_query.edit_message_reply_markup(reply_markup)
+            self._send_nowait(chat_id, Priority.normal, self.update.callback_query.edit_message_reply_markup,
+                              reply_markup)
         logger.debug("Delete callback data result: %s",
                      self.bot.callback_data_cache.drop_data(self.update.callback_query))
 
@@ -345,23 +450,25 @@ class MessageContext(Context):
     """
     Context for text messages
     """
+    _update_field = "message"
+    edit_tgt = None
+    _pending_reply: typing.Optional[Future] = None
 
-    def __init__(self, update: telegram.Update, bot: "octobot.OctoBot", message: telegram.Message = None):
+    def __init__(self, update: telegram.Update, bot: "octobot.OctoBot", message: telegram.Message = None,
+                 preload: database.UpdatePreload = None):
         if message.caption is not None:
             self.text = message.caption
         else:
             self.text = message.text
         self._update_type = octobot.UpdateType.message
-        is_reply = message is not None
-        if octobot.Database.redis is not None and not is_reply:
-            octobot.Database.redis.set(
-                octobot.utils.generate_edit_id(update.message), 0)
-            octobot.Database.redis.expire(
-                octobot.utils.generate_edit_id(update.message), 30)
-        if message.reply_to_message:
-            self.reply_to_message = Context.create_context(
-                update, bot, update.message.reply_to_message)
-        super(MessageContext, self).__init__(update, bot, message)
+        self._message = message
+        super(MessageContext, self).__init__(update, bot, message, preload)
+
+    @lazy_property
+    def reply_to_message(self) -> typing.Optional[Context]:
+        if not self._message.reply_to_message:
+            return None
+        return Context.create_context(self.update, self.bot, self._message.reply_to_message, self.preloaded)
 
     def _reply(self, text, photo_url=None, reply_to_previous=False, reply_markup=None, parse_mode=None,
                no_preview=False,
@@ -377,65 +484,84 @@ class MessageContext(Context):
         if to_pm:
             kwargs["chat_id"] = self.user.id
             del kwargs["reply_to_message_id"]
+        chat_id = kwargs["chat_id"]
         if photo_url and photo_primary:
-            try:
-                if "disable_web_page_preview" in kwargs:
-                    del kwargs["disable_web_page_preview"]
-                message = self.bot.send_photo(
-                    caption=text, photo=photo_url[0], **kwargs)
-            except telegram.error.TelegramError:
+            if "disable_web_page_preview" in kwargs:
+                del kwargs["disable_web_page_preview"]
+
+            def photo_failed():
+                fallback_text = text
                 if parse_mode.lower() != 'html':
-                    text = html.escape(text)
-                text = f'<b><a href="{photo_url[0]}">Link to image</a></b>\n\n' + text
-                message = self.bot.send_photo(
-                    caption=text, photo=Settings.no_image, **kwargs)
+                    fallback_text = html.escape(fallback_text)
+                fallback_text = f'<b><a href="{photo_url[0]}">Link to image</a></b>\n\n' + fallback_text
+                return self.bot.send_photo, dict(caption=fallback_text, photo=Settings.no_image, **kwargs)
+
+            future = self._send_with_fallback(chat_id, Priority.normal, self.bot.send_photo,
+                                              dict(caption=text, photo=photo_url[0], **kwargs), photo_failed)
         elif file_url:
             if "disable_web_page_preview" in kwargs:
                 del kwargs["disable_web_page_preview"]
-            try:
-                message = self.bot.send_document(
-                    caption=text, document=file_url, **kwargs)
-            except telegram.error.TelegramError:
-                text = f'<b>Failed to send file. <a href="{photo_url[0]}">Link to file</a></b>\n\n' + text
-                message = self.bot.send_message(text=text, **kwargs)
-        else:
-            message = self.bot.send_message(text=text, **kwargs)
 
-        if octobot.Database.redis is not None and editable:
-            octobot.Database.redis.set(octobot.utils.generate_edit_id(
-                self.update.message), message.message_id)
-            octobot.Database.redis.expire(
-                octobot.utils.generate_edit_id(self.update.message), 30)
-        self.edit_tgt = message.message_id
-        return message
+            def file_failed():
+                fallback_text = f'<b>Failed to send file. <a href="{photo_url[0]}">Link to file</a></b>\n\n' + text
+                return self.bot.send_message, dict(text=fallback_text, **kwargs)
+
+            future = self._send_with_fallback(chat_id, Priority.normal, self.bot.send_document,
+                                              dict(caption=text, document=file_url, **kwargs), file_failed)
+        else:
+            future = self._send_nowait(chat_id, Priority.normal, self.bot.send_message, text=text, **kwargs)
+
+        def sent(future: Future):
+            if future.exception() is not None:
+                return
+            message = future.result()
+            if octobot.Database.redis is not None and editable:
+                octobot.Database.redis.set(octobot.utils.generate_edit_id(
+                    self.update.message), message.message_id, ex=30)
+            self.edit_tgt = message.message_id
+
+        # Registered before anything else can wait for the reply, so edit target is known when they run
+        future.add_done_callback(sent)
+        self._pending_reply = future
+        return future
 
     def _edit(self, text=None, photo_url=None, reply_markup=None, parse_mode=None, photo_primary=False):
+        pending_reply = self._pending_reply
+        if pending_reply is not None and not pending_reply.done():
+            # Edit of reply that is not sent yet
+            pending_reply.add_done_callback(
+                lambda future: self._edit(text, photo_url, reply_markup, parse_mode, photo_primary))
+            return
         if self.edit_tgt is not None:
             if text is not None:
-                return self.bot.edit_message_text(chat_id=self.update.message.chat.id, message_id=self.edit_tgt,
-                                                  text=text, parse_mode=parse_mode, reply_markup=reply_markup)
+                self._send_nowait(self.update.message.chat.id, Priority.normal, self.bot.edit_message_text,
+                                  chat_id=self.update.message.chat.id, message_id=self.edit_tgt,
+                                  text=text, parse_mode=parse_mode, reply_markup=reply_markup)
             elif reply_markup is not None:
-                return self.bot.edit_message_reply_markup(chat_id=self.update.message.chat.id, message_id=self.edit_tgt,
-                                                          reply_markup=reply_markup)
+                self._send_nowait(self.update.message.chat.id, Priority.normal, self.bot.edit_message_reply_markup,
+                                  chat_id=self.update.message.chat.id, message_id=self.edit_tgt,
+                                  reply_markup=reply_markup)
 
 
 class EditedMessageContext(MessageContext):
     """
     Context for edited text messages
     """
+    _update_field = "edited_message"
+    reply_to_message = None
 
-    def __init__(self, update: telegram.Update, bot: "octobot.OctoBot", message: telegram.Message = None):
+    def __init__(self, update: telegram.Update, bot: "octobot.OctoBot", message: telegram.Message = None,
+                 preload: database.UpdatePreload = None):
         self.update = update
         self.update.message = self.update.edited_message
-        if octobot.Database.redis.exists(octobot.utils.generate_edit_id(self.update.message)):
-            self.edit_tgt = int(octobot.Database.redis.get(
-                octobot.utils.generate_edit_id(self.update.message)))
+        if preload is None:
+            preload = Database.preload_update(update)
+        if preload.edit_target is not None:
+            self.edit_tgt = preload.edit_target
             if self.edit_tgt == 0:
                 logger.debug(
                     "Not handling update %s cause invalid edit target", update.update_id)
                 raise octobot.StopHandling
-            octobot.Database.redis.delete(
-                octobot.utils.generate_edit_id(self.update.message))
             self._update_type = octobot.UpdateType.edited_message
             if update.message.caption is not None:
                 self.text = update.message.caption
@@ -447,7 +573,7 @@ class EditedMessageContext(MessageContext):
             raise octobot.StopHandling
         logger.debug("edit target = %s", self.edit_tgt)
         # super(EditedMessageContext, self).__init__(update, bot, message)
-        Context.__init__(self, update, bot, message)
+        Context.__init__(self, update, bot, message, preload)
 
     def _reply(self, text, photo_url=None, reply_to_previous=False, reply_markup=None, parse_mode=None,
                no_preview=False,
@@ -460,8 +586,10 @@ class ChosenInlineResultContext(Context):
     """
     Context for chosen inline query result messages
     """
+    _update_field = "chosen_inline_result"
 
-    def __init__(self, update: telegram.Update, bot: "octobot.OctoBot", message: telegram.Message = None):
+    def __init__(self, update: telegram.Update, bot: "octobot.OctoBot", message: telegram.Message = None,
+                 preload: database.UpdatePreload = None):
         self._update_type = octobot.UpdateType.chosen_inline_result
         self.text = update.chosen_inline_result.query
-        super(ChosenInlineResultContext, self).__init__(update, bot, message)
+        super(ChosenInlineResultContext, self).__init__(update, bot, message, preload)
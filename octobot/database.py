@@ -2,30 +2,163 @@ import json
 import logging
 import os
 import pickle
+import struct
 import sys
+import threading
+import time
+import zlib
+from concurrent.futures import Future
+from dataclasses import dataclass, field
 from functools import wraps
+from typing import Dict, Optional, Set, Tuple
+from urllib.parse import urlparse
 
+import cachetools
 import fakeredis
+import fakeredis.aioredis
 import redis
+import redis.asyncio
 import requests
+import requests.structures
+import telegram
 
+from octobot import httpclient
+from octobot.aio import to_thread
 from settings import Settings
 
 logger = logging.getLogger("Redis")
 
+INVALIDATE_CHANNEL = "octobot:local_cache_invalidate"
+# Deletes lock only if it still holds our token
+COMPARE_AND_DELETE_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+
+def compare_and_delete(script, key: str, value) -> bool:
+    """
+    Atomically deletes key if it holds `value`, so lock that expired and was taken by someone else is not released
+
+    :param script: :data:`COMPARE_AND_DELETE_SCRIPT` registered with :meth:`redis.Redis.register_script`
+    :param key: Key to delete
+    :type key: :class:`str`
+    :param value: Expected value
+    :return: If key was deleted
+    :rtype: :class:`bool`
+    """
+    try:
+        return bool(script(keys=[key], args=[value]))
+    except ImportError:
+        # FakeRedis without scripting support, it is local to this process anyway
+        redis_db = script.registered_client
+        return redis_db.get(key) == (value.encode() if isinstance(value, str) else value) and bool(redis_db.delete(key))
+
+
+class LocalCache:
+    """
+    In-process LRU cache with TTL in front of Redis hash fields. Missing fields are cached too.
+    Entries are invalidated by messages in :data:`INVALIDATE_CHANNEL`, so multiple bot processes stay coherent.
+
+    :param maxsize: Maximum amount of cached fields
+    :type maxsize: :class:`int`
+    :param ttl: Time in seconds after which entry is re-read from Redis
+    :type ttl: :class:`int`
+    :var hits: Amount of lookups served from memory
+    :var misses: Amount of lookups that went to Redis
+    """
+    #: Returned by :meth:`get` for fields that are not cached
+    MISSING = object()
+
+    def __init__(self, maxsize: int, ttl: int):
+        self._cache = cachetools.TTLCache(maxsize=maxsize, ttl=ttl)
+        # Generation of last invalidation of field, to not cache values read before it
+        self._invalidated = cachetools.TTLCache(maxsize=maxsize, ttl=ttl)
+        self._generation = 0
+        self._cleared_generation = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, hashmap_name, key):
+        """
+        :return: Cached value, or :data:`MISSING` if field is not cached
+        """
+        with self._lock:
+            value = self._cache.get((hashmap_name, key), self.MISSING)
+            if value is self.MISSING:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return value
+
+    def set(self, hashmap_name, key, value):
+        with self._lock:
+            self._cache[(hashmap_name, key)] = value
+
+    @property
+    def generation(self) -> int:
+        """
+        Current invalidation generation, take it before reading value from Redis and pass to :meth:`fill`
+        """
+        return self._generation
+
+    def fill(self, hashmap_name, key, value, generation: int):
+        """
+        Caches value read from Redis, unless field was invalidated after `generation` was taken:
+        value read before invalidation may be already outdated
+        """
+        with self._lock:
+            if self._cleared_generation > generation or self._invalidated.get((hashmap_name, key), -1) > generation:
+                return
+            self._cache[(hashmap_name, key)] = value
+
+    def invalidate(self, hashmap_name, key):
+        with self._lock:
+            self._generation += 1
+            self._invalidated[(hashmap_name, key)] = self._generation
+            self._cache.pop((hashmap_name, key), None)
+
+    def clear(self):
+        with self._lock:
+            self._generation += 1
+            self._cleared_generation = self._generation
+            self._cache.clear()
+
+    def stats(self) -> dict:
+        """
+        :return: Dictionary with hits, misses and size of cache
+        """
+        return {"hits": self.hits, "misses": self.misses, "size": len(self._cache)}
+
+    def handle_invalidate_message(self, message):
+        try:
+            hashmap_name, key = json.loads(message["data"])
+        except (ValueError, TypeError):
+            logger.warning("Invalid cache invalidation message: %s", message)
+            return
+        self.invalidate(hashmap_name, key)
+
 
 class RedisData:
     """
     Redis chat/user data class. Can be accessed like dictionary.
     """
 
-    def __init__(self, redis_db, chat_id):
+    def __init__(self, redis_db, chat_id, local_cache: LocalCache = None):
         self._redis = redis_db
         self.chat_id = chat_id
+        self._local_cache = local_cache
 
     @property
     def hashmap_name(self):
-        return f"settings:{self.chat_id}"
+        return self.create_hashmap_name(self.chat_id)
+
+    @staticmethod
+    def create_hashmap_name(chat_id):
+        return f"settings:{chat_id}"
 
     def get(self, key, default=None, dont_decode=False):
         """
@@ -40,14 +173,24 @@ class RedisData:
         """
         if self._redis is None:
             return default
+        return self._decode(self._hget(key), default, dont_decode)
+
+    async def aget(self, key, default=None, dont_decode=False):
+        """
+        Awaitable version of :meth:`get`, uses :attr:`_Database.aredis`, so it does not block event loop
+        """
+        if self._redis is None:
+            return default
+        return self._decode(await self._ahget(key), default, dont_decode)
+
+    @staticmethod
+    def _decode(res, default, dont_decode):
+        if res is None:
+            return default
+        elif dont_decode:
+            return res
         else:
-            res = self._redis.hget(self.hashmap_name, key)
-            if res is None:
-                return default
-            elif dont_decode:
-                return res
-            else:
-                return res.decode()
+            return res.decode()
 
     def __getitem__(self, item):
         return self.get(item)
@@ -66,25 +209,277 @@ class RedisData:
         if self._redis is None:
             raise DatabaseNotAvailable
         else:
-            return self._redis.hset(self.hashmap_name, key, value)
+            res = self._redis.hset(self.hashmap_name, key, value)
+            if self._local_cache is not None:
+                self._local_cache.invalidate(self.hashmap_name, key)
+                self._redis.publish(INVALIDATE_CHANNEL, json.dumps([self.hashmap_name, key]))
+            return res
+
+    async def aset(self, key, value):
+        """
+        Awaitable version of :meth:`set`, uses :attr:`_Database.aredis`, so it does not block event loop
+        """
+        if self._redis is None:
+            raise DatabaseNotAvailable
+        aredis = Database.aredis
+        res = await aredis.hset(self.hashmap_name, key, value)
+        if self._local_cache is not None:
+            self._local_cache.invalidate(self.hashmap_name, key)
+            await aredis.publish(INVALIDATE_CHANNEL, json.dumps([self.hashmap_name, key]))
+        return res
 
     def __setitem__(self, key, value):
         return self.set(key, value)
 
     def __contains__(self, key):
+        if self._local_cache is not None:
+            return self._hget(key) is not None
         return self._redis.hexists(self.hashmap_name, key)
 
+    def _hget(self, key):
+        if self._local_cache is None:
+            return self._redis.hget(self.hashmap_name, key)
+        res = self._local_cache.get(self.hashmap_name, key)
+        if res is LocalCache.MISSING:
+            generation = self._local_cache.generation
+            res = self._redis.hget(self.hashmap_name, key)
+            self._local_cache.fill(self.hashmap_name, key, res, generation)
+        return res
+
+    async def _ahget(self, key):
+        if self._local_cache is None:
+            return await Database.aredis.hget(self.hashmap_name, key)
+        res = self._local_cache.get(self.hashmap_name, key)
+        if res is LocalCache.MISSING:
+            generation = self._local_cache.generation
+            res = await Database.aredis.hget(self.hashmap_name, key)
+            self._local_cache.fill(self.hashmap_name, key, res, generation)
+        return res
+
+
+def generate_edit_id(message):
+    return f"emsg:{message.chat.id}:{message.message_id}"
+
+
+@dataclass
+class UpdatePreload:
+    """
+    Values core needs for every update, fetched from Redis in one round trip by :meth:`_Database.preload_update`
+
+    :var chat_locale: Locale set for chat, None if not set
+    :var user_locale: Locale set for user, None if not set
+    :var disabled_mask: Bitmask of plugins disabled in chat (see :meth:`_Database.plugin_bit`),
+        only for supergroup messages
+    :var edit_target: ID of message that edited message should edit, None if there is nothing to edit
+    """
+    chat_locale: Optional[str] = None
+    user_locale: Optional[str] = None
+    disabled_mask: int = 0
+    edit_target: Optional[int] = None
+
 
 def request_create_id(request_type, request_args, request_kwargs):
     return f"request_cache:{request_type}:{json.dumps(request_args)}:{json.dumps(request_kwargs)}"
 
 
+CACHED_RESPONSE_MAGIC = b"OBR1"
+CACHED_RESPONSE_HEADER = struct.Struct(">4sBI")
+CACHED_RESPONSE_COMPRESSED = 1
+# Content-Encoding/Length are not kept on purpose, body is stored already decoded
+CACHED_RESPONSE_HEADERS = ("Content-Type", "Date", "ETag", "Last-Modified", "Cache-Control", "Expires", "Location")
+
+
+def encode_cached_response(resp: requests.Response, compress_min_size: int = 1024) -> bytes:
+    """
+    Packs response into compact cache record: magic, flags, metadata length, JSON metadata
+    (status, url, encoding and selected headers) and body, zlib-compressed if that makes it smaller.
+
+    :param resp: Response to pack
+    :type resp: :class:`requests.Response`
+    :param compress_min_size: Bodies smaller than that are stored uncompressed
+    :type compress_min_size: :class:`int`, optional
+    :rtype: :class:`bytes`
+    """
+    body = resp.content
+    flags = 0
+    if len(body) >= compress_min_size:
+        compressed = zlib.compress(body, 1)
+        if len(compressed) < len(body):
+            body = compressed
+            flags |= CACHED_RESPONSE_COMPRESSED
+    metadata = json.dumps({
+        "status": resp.status_code,
+        "reason": resp.reason,
+        "url": resp.url,
+        "encoding": resp.encoding,
+        "cached_at": time.time(),
+        "headers": {header: resp.headers[header] for header in CACHED_RESPONSE_HEADERS if header in resp.headers}
+    }).encode()
+    return CACHED_RESPONSE_HEADER.pack(CACHED_RESPONSE_MAGIC, flags, len(metadata)) + metadata + body
+
+
+def decode_cached_response(record: bytes) -> Optional[requests.Response]:
+    """
+    Rebuilds response from record created by :func:`encode_cached_response`.
+    Time when response was cached is available in `cached_at` attribute of response
+
+    :param record: Cache record
+    :type record: :class:`bytes`
+    :return: Response, or None if record is not in known format
+    :rtype: :class:`requests.Response`
+    """
+    if not record.startswith(CACHED_RESPONSE_MAGIC):
+        return None
+    _, flags, metadata_length = CACHED_RESPONSE_HEADER.unpack_from(record)
+    metadata_end = CACHED_RESPONSE_HEADER.size + metadata_length
+    metadata = json.loads(record[CACHED_RESPONSE_HEADER.size:metadata_end])
+    body = record[metadata_end:]
+    if flags & CACHED_RESPONSE_COMPRESSED:
+        body = zlib.decompress(body)
+    resp = requests.Response()
+    resp.status_code = metadata["status"]
+    resp.reason = metadata["reason"]
+    resp.url = metadata["url"]
+    resp.encoding = metadata["encoding"]
+    resp.headers = requests.structures.CaseInsensitiveDict(metadata["headers"])
+    resp._content = body
+    resp._content_consumed = True
+    resp.cached_at = metadata.get("cached_at", 0)
+    return resp
+
+
+@dataclass
+class CachePolicy:
+    """
+    Caching policy for :meth:`_Database.get_cache`/:meth:`_Database.post_cache`.
+    Can be passed per call with `cache_policy` keyword argument or registered per host with
+    :meth:`_Database.set_cache_policy`
+
+    :param ttl: Time in seconds response is considered fresh
+    :type ttl: :class:`int`
+    :param stale_ttl: Time in seconds after `ttl` during which stale response is returned while fresh one is fetched
+        in background (stale-while-revalidate). Defaults to 0
+    :type stale_ttl: :class:`int`, optional
+    :param negative_ttl: Time in seconds to cache negative responses (status in `negative_statuses` or empty body),
+        0 disables negative caching. Defaults to 0
+    :type negative_ttl: :class:`int`, optional
+    :param negative_statuses: Status codes that are considered negative result, defaults to 404
+    :type negative_statuses: :class:`tuple`, optional
+    """
+    ttl: int = 60
+    stale_ttl: int = 0
+    negative_ttl: int = 0
+    negative_statuses: Tuple[int, ...] = (404,)
+
+    def is_negative(self, resp: requests.Response) -> bool:
+        return resp.status_code in self.negative_statuses or (resp.ok and len(resp.content) == 0)
+
+    def is_cacheable(self, resp: requests.Response) -> bool:
+        if self.is_negative(resp):
+            return self.negative_ttl > 0
+        return resp.status_code == requests.codes.ok
+
+    def fresh_ttl(self, resp: requests.Response) -> int:
+        return self.negative_ttl if self.is_negative(resp) else self.ttl
+
+    def expire_ttl(self, resp: requests.Response) -> int:
+        return self.negative_ttl if self.is_negative(resp) else self.ttl + self.stale_ttl
+
+
+DEFAULT_CACHE_POLICY = CachePolicy()
+
+
+class SingleFlight:
+    """
+    Makes sure only one call for key is running at the time, concurrent callers with same key wait for it
+    and get its result instead of doing the same work again.
+
+    In-process callers wait on the in-flight call directly. If redis is given, leader additionally takes short lock
+    in redis, so other processes can wait for the result to appear (see `check` argument of :meth:`do`)
+    instead of also calling function.
+
+    :param redis_db: Redis connection for cross-process lock
+    :type redis_db: :class:`redis.Redis`, optional
+    :param lock_ttl: Lock lifetime in seconds, also the longest time other processes wait for result
+    :type lock_ttl: :class:`int`, optional
+    :param poll_interval: How often other processes check for result, in seconds
+    :type poll_interval: :class:`float`, optional
+    """
+
+    def __init__(self, redis_db: redis.Redis = None, lock_ttl: int = 10, poll_interval: float = 0.05):
+        self.redis = redis_db
+        self._release_script = redis_db.register_script(COMPARE_AND_DELETE_SCRIPT) if redis_db is not None else None
+        self.lock_ttl = lock_ttl
+        self.poll_interval = poll_interval
+        self._inflight: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+
+    def __contains__(self, key):
+        return key in self._inflight
+
+    def do(self, key: str, function, *args, check=None):
+        """
+        Calls function with args, unless call with same key is already in flight
+
+        :param key: Call key
+        :type key: :class:`str`
+        :param function: Function to call
+        :param check: Function that returns result stored by call in other process or None if there is no result yet.
+            Without it only in-process calls are coalesced
+        :return: Function result
+        """
+        with self._lock:
+            future = self._inflight.get(key)
+            leader = future is None
+            if leader:
+                future = self._inflight[key] = Future()
+        if not leader:
+            logger.debug("Waiting for in-flight call %s", key)
+            return future.result()
+        try:
+            res = self._call(key, function, args, check)
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(res)
+            return res
+        finally:
+            with self._lock:
+                del self._inflight[key]
+
+    def _call(self, key, function, args, check):
+        if self.redis is None or check is None:
+            return function(*args)
+        lock_name = "singleflight:" + key
+        token = os.urandom(16)
+        if self.redis.set(lock_name, token, nx=True, ex=self.lock_ttl):
+            try:
+                return function(*args)
+            finally:
+                # Lock might have expired and been taken by someone else meanwhile
+                compare_and_delete(self._release_script, lock_name, token)
+        logger.debug("Call %s is in flight in other process, waiting for result", key)
+        deadline = time.monotonic() + self.lock_ttl
+        while time.monotonic() < deadline:
+            res = check()
+            if res is not None:
+                return res
+            if not self.redis.exists(lock_name):
+                break
+            time.sleep(self.poll_interval)
+        res = check()
+        if res is not None:
+            return res
+        return function(*args)
+
+
 def http_cache(rtype):
     def decorator(_):
-        def cache(*args, **request_kwargs):
+        def cache(*args, cache_policy: CachePolicy = None, **request_kwargs):
             self = args[0]
             return self.cache_requests(request_type=rtype, request_args=args[1:],
-                                       request_kwargs=request_kwargs)
+                                       request_kwargs=request_kwargs, cache_policy=cache_policy)
 
         return cache
 
@@ -99,11 +494,14 @@ class _Database:
     Database[chat_id] to get :class:`RedisData` for chat_id
     """
     redis: redis.Redis
+    _aredis: redis.asyncio.Redis = None
+    _fake_server: fakeredis.FakeServer = None
+    _invalidation_pid: int = None
+    local_cache: LocalCache = None
 
     def __init__(self):
-        self.request_session = requests.Session()
-        self.request_session.headers.update(
-            {"User-Agent": Settings.user_agent})
+        self.cache_policies: Dict[str, CachePolicy] = {}
+        self.request_session = httpclient.session
         if not os.environ.get("ob_testing", False):
             self.redis = redis.Redis(
                 host=Settings.redis["host"], port=Settings.redis["port"], db=Settings.redis["db"])
@@ -112,12 +510,105 @@ class _Database:
             except (redis.exceptions.ConnectionError, redis.exceptions.TimeoutError):
                 logger.error(
                     "Error: Redis is not available. That might break the bot in some places.")
-                self.redis = fakeredis.FakeRedis()
+                self._fake_server = fakeredis.FakeServer()
+                self.redis = fakeredis.FakeRedis(server=self._fake_server)
             else:
                 logger.info("Redis connection successful")
         else:
             logger.info("Testing environment - using fakeredis")
-            self.redis = fakeredis.FakeRedis()
+            self._fake_server = fakeredis.FakeServer()
+            self.redis = fakeredis.FakeRedis(server=self._fake_server)
+        self.singleflight = SingleFlight(self.redis, lock_ttl=Settings.http_cache.lock_ttl)
+        self.plugin_ids: Dict[str, int] = {}
+        self._plugin_ids_lock = threading.Lock()
+        if Settings.redis.local_cache:
+            self.local_cache = LocalCache(maxsize=Settings.redis.local_cache_size,
+                                          ttl=Settings.redis.local_cache_ttl)
+
+    def start_invalidation_listener(self):
+        """
+        Subscribes to local cache invalidation messages from other processes. Starts listener thread, so in prefork
+        mode call it after forking, once in every process. Calls after first one in same process do nothing.
+        Until it is called, local cache is only invalidated by this process.
+        """
+        if self.local_cache is None or self._invalidation_pid == os.getpid():
+            return
+        self._invalidation_pid = os.getpid()
+        self.local_cache.clear()
+        if self._fake_server is not None:
+            # FakeRedis lives inside this process, there is nobody else to hear from
+            return
+        pubsub = self.redis.pubsub(ignore_subscribe_messages=True)
+        pubsub.subscribe(**{INVALIDATE_CHANNEL: self.local_cache.handle_invalidate_message})
+        self._invalidation_thread = pubsub.run_in_thread(sleep_time=1, daemon=True,
+                                                         exception_handler=self._invalidation_listener_failed)
+
+    def invalidate_local_cache(self, hashmap_name, key):
+        """
+        Drops entry from local cache of this and all other bot processes
+
+        :param hashmap_name: Name of cached hashmap
+        :param key: Key in hashmap, must be JSON serializable
+        """
+        if self.local_cache is None:
+            return
+        self.local_cache.invalidate(hashmap_name, key)
+        self.redis.publish(INVALIDATE_CHANNEL, json.dumps([hashmap_name, key]))
+
+    def plugin_bit(self, plugin_name: str) -> int:
+        """
+        Gives plugin small integer ID, stable for lifetime of the process, and returns bit of that ID
+        in disabled plugins masks
+
+        :param plugin_name: Plugin name in module format (ex. `plugins.test`)
+        :type plugin_name: :class:`str`
+        :rtype: :class:`int`
+        """
+        with self._plugin_ids_lock:
+            plugin_id = self.plugin_ids.get(plugin_name)
+            if plugin_id is None:
+                plugin_id = self.plugin_ids[plugin_name] = len(self.plugin_ids)
+                if self.local_cache is not None:
+                    # Cached masks were built without this plugin
+                    self.local_cache.clear()
+        return 1 << plugin_id
+
+    def disabled_plugins_mask(self, disabled_plugins: Set[bytes]) -> int:
+        """
+        :param disabled_plugins: Plugin names as stored in `plugins_disabled` sets
+        :return: Bitmask of plugins, names that don't have ID are skipped
+        :rtype: :class:`int`
+        """
+        mask = 0
+        for plugin_name in disabled_plugins:
+            plugin_id = self.plugin_ids.get(plugin_name.decode())
+            if plugin_id is not None:
+                mask |= 1 << plugin_id
+        return mask
+
+    def invalidate_disabled_plugins(self, chat_id: int):
+        """
+        Drops cached disabled plugins mask of chat, call after changing `plugins_disabled` set of chat
+        """
+        self.invalidate_local_cache(f"plugins_disabled{chat_id}", "mask")
+
+    def _invalidation_listener_failed(self, exc, pubsub, thread):
+        logger.error("Local cache invalidation listener failed, clearing local cache", exc_info=exc)
+        self.local_cache.clear()
+        time.sleep(1)
+
+    @property
+    def aredis(self) -> redis.asyncio.Redis:
+        """
+        asyncio Redis client pointing to the same database as :attr:`redis`. Use it from coroutine handlers.
+        """
+        if self._aredis is None:
+            if self._fake_server is not None:
+                self._aredis = fakeredis.aioredis.FakeRedis(server=self._fake_server)
+            else:
+                self._aredis = redis.asyncio.Redis(
+                    host=Settings.redis["host"], port=Settings.redis["port"], db=Settings.redis["db"])
+        return self._aredis
 
     @http_cache("GET")
     def get_cache(self, *args, **request_kwargs) -> requests.Response:
@@ -127,9 +618,80 @@ class _Database:
     def post_cache(self, *args, **request_kwargs) -> requests.Response:
         ...
 
+    async def aget_cache(self, *args, **request_kwargs) -> requests.Response:
+        """
+        Awaitable version of :meth:`get_cache`
+        """
+        return await to_thread(self.get_cache, *args, **request_kwargs)
+
+    async def apost_cache(self, *args, **request_kwargs) -> requests.Response:
+        """
+        Awaitable version of :meth:`post_cache`
+        """
+        return await to_thread(self.post_cache, *args, **request_kwargs)
+
     def __getitem__(self, item):
         item = int(item)
-        return RedisData(self.redis, item)
+        return RedisData(self.redis, item, self.local_cache)
+
+    def preload_update(self, update: telegram.Update) -> UpdatePreload:
+        """
+        Fetches everything core needs to handle update (locales, disabled plugins, edit target) in one pipelined
+        round trip. Edit target key is consumed on fetch.
+
+        :param update: Update to preload values for
+        :type update: :class:`telegram.Update`
+        :rtype: :class:`UpdatePreload`
+        """
+        preload = UpdatePreload()
+        if self.redis is None:
+            return preload
+        chat = update.effective_chat
+        user = update.effective_user
+        fields = []
+        pipe = self.redis.pipeline(transaction=False)
+        for field_name, target in (("chat_locale", chat), ("user_locale", user)):
+            if target is None:
+                continue
+            hashmap_name = RedisData.create_hashmap_name(target.id)
+            cached = LocalCache.MISSING if self.local_cache is None else self.local_cache.get(hashmap_name, "locale")
+            if cached is LocalCache.MISSING:
+                pipe.hget(hashmap_name, "locale")
+                fields.append((field_name, hashmap_name))
+            elif cached is not None:
+                setattr(preload, field_name, cached.decode())
+        if update.effective_message is not None and chat.type == "supergroup":
+            disabled_key = f"plugins_disabled{chat.id}"
+            cached = LocalCache.MISSING if self.local_cache is None else self.local_cache.get(disabled_key, "mask")
+            if cached is LocalCache.MISSING:
+                pipe.smembers(disabled_key)
+                fields.append(("disabled_mask", disabled_key))
+            else:
+                preload.disabled_mask = cached
+        if update.edited_message is not None:
+            edit_id = generate_edit_id(update.edited_message)
+            pipe.get(edit_id)
+            pipe.delete(edit_id)
+            fields += [("edit_target", None), (None, None)]
+        if not fields:
+            return preload
+        generation = self.local_cache.generation if self.local_cache is not None else 0
+        for (field_name, hashmap_name), value in zip(fields, pipe.execute()):
+            if field_name == "disabled_mask":
+                preload.disabled_mask = self.disabled_plugins_mask(value)
+                if self.local_cache is not None:
+                    self.local_cache.fill(hashmap_name, "mask", preload.disabled_mask, generation)
+                continue
+            if hashmap_name is not None and self.local_cache is not None:
+                self.local_cache.fill(hashmap_name, "locale", value, generation)
+            if field_name is None or value is None:
+                continue
+            elif field_name == "edit_target":
+                value = int(value)
+            else:
+                value = value.decode()
+            setattr(preload, field_name, value)
+        return preload
 
     def _do_request(self, request_type, args, kwargs):
         req = requests.Request(request_type, *args, **kwargs)
@@ -137,28 +699,70 @@ class _Database:
         resp = self.request_session.send(prepped)
         return resp
 
-    def cache_requests(self, request_type, request_args, request_kwargs):
+    def set_cache_policy(self, host: str, policy: CachePolicy):
+        """
+        Sets default cache policy for cached requests to host
+
+        :param host: Host name, like `graphql.anilist.co`
+        :type host: :class:`str`
+        :param policy: Cache policy
+        :type policy: :class:`CachePolicy`
+        """
+        self.cache_policies[host] = policy
+
+    def get_cache_policy(self, request_args, request_kwargs) -> CachePolicy:
+        url = request_args[0] if len(request_args) > 0 else request_kwargs.get("url", "")
+        return self.cache_policies.get(urlparse(url).hostname, DEFAULT_CACHE_POLICY)
+
+    def _fetch_and_cache(self, db_entry, request_type, request_args, request_kwargs, policy: CachePolicy):
+        req = self._do_request(
+            request_type, request_args, request_kwargs)
+        if policy.is_cacheable(req):
+            if len(req.content) > Settings.http_cache.max_body_size:
+                logger.debug("Response body is too big (%s bytes), not caching", len(req.content))
+            else:
+                logger.debug("Status code is %s, saving to redis", req.status_code)
+                self.redis.set(db_entry, encode_cached_response(req, Settings.http_cache.compress_min_size),
+                               ex=policy.expire_ttl(req))
+        return req
+
+    def _revalidate(self, db_entry, *args):
+        try:
+            self.singleflight.do(db_entry, self._fetch_and_cache, db_entry, *args)
+        except Exception:
+            logger.warning("Failed to revalidate %s", db_entry, exc_info=True)
+
+    def _get_cached(self, db_entry) -> Optional[requests.Response]:
+        record = self.redis.get(db_entry)
+        if record is None:
+            return None
+        return decode_cached_response(record)
+
+    def cache_requests(self, request_type, request_args, request_kwargs, cache_policy: CachePolicy = None):
         logger.debug(request_type)
         if self.redis is None:
             logger.warning("DB not available, requests are not cached, beware")
             r = self._do_request(request_type, request_args, request_kwargs)
             return r
         else:
+            if cache_policy is None:
+                cache_policy = self.get_cache_policy(request_args, request_kwargs)
             db_entry = request_create_id(
                 request_type, request_args, request_kwargs)
             logger.debug("Searching for request ID %s", db_entry)
-            if self.redis.exists(db_entry) == 1:
-                logger.debug("Using cached result")
-                req = self.redis.get(db_entry)
-                return pickle.loads(req)
-            else:
-                req = self._do_request(
-                    request_type, request_args, request_kwargs)
-                if req.status_code == requests.codes.ok:
-                    logger.debug("Status code is 200, saving to redis")
-                    self.redis.set(db_entry, pickle.dumps(req))
-                    self.redis.expire(db_entry, 60)
+            req = self._get_cached(db_entry)
+            if req is not None:
+                if time.time() - req.cached_at < cache_policy.fresh_ttl(req):
+                    logger.debug("Using cached result")
+                    return req
+                elif db_entry not in self.singleflight:
+                    logger.debug("Using stale result, revalidating in background")
+                    threading.Thread(target=self._revalidate, name="CacheRevalidate", daemon=True,
+                                     args=(db_entry, request_type, request_args, request_kwargs,
+                                           cache_policy)).start()
                 return req
+            return self.singleflight.do(db_entry, self._fetch_and_cache, db_entry, request_type, request_args,
+                                        request_kwargs, cache_policy, check=lambda: self._get_cached(db_entry))
 
     def cache(self, ttl=120):
         def inner(function):
@@ -0,0 +1,239 @@
+import asyncio
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from queue import Queue
+from typing import Callable
+
+import telegram
+
+import octobot.exceptions
+
+logger = logging.getLogger("Dispatcher")
+
+_STOP = object()
+
+
+def shard_key(update: telegram.Update) -> int:
+    """
+    Key used to pick worker for the update. Updates with same key always end up in the same worker.
+
+    :param update: Update to get key for
+    :type update: :class:`telegram.Update`
+    :return: Chat ID, user ID (for inline queries) or update ID if update has neither
+    :rtype: :class:`int`
+    """
+    if update.effective_chat is not None:
+        return update.effective_chat.id
+    elif update.effective_user is not None:
+        return update.effective_user.id
+    return update.update_id
+
+
+class Dispatcher:
+    """
+    Sharded update dispatcher. Every worker thread has its own queue and blocks on it,
+    updates are routed to workers by chat ID, so updates from one chat are handled in order
+    while updates from different chats are handled in parallel.
+
+    :param workers: Amount of worker threads
+    :type workers: :class:`int`
+    :param stop_event: Event that gets set when some handler raises :exc:`octobot.Halt`
+    :type stop_event: :class:`threading.Event`, optional
+    :param on_handled: Function called with every update after it is handled, successfully or not
+    :type on_handled: callable, optional
+    """
+
+    def __init__(self, workers: int, stop_event: threading.Event = None,
+                 on_handled: Callable[[telegram.Update], None] = None):
+        if workers < 1:
+            raise ValueError("Dispatcher needs at least one worker")
+        if stop_event is None:
+            stop_event = threading.Event()
+        self.stop_event = stop_event
+        self.on_handled = on_handled
+        self.queues = [Queue() for _ in range(workers)]
+        self.threads = []
+        self._abandoned = False
+
+    def start(self):
+        """
+        Starts worker threads
+        """
+        for i, queue in enumerate(self.queues):
+            # Daemon threads let process exit if handler is still running after drain deadline
+            thread = threading.Thread(target=self._worker, args=(queue,),
+                                      name=f"UpdateHandler{i}", daemon=True)
+            self.threads.append(thread)
+            thread.start()
+        return self
+
+    def put(self, item):
+        """
+        Puts update into the queue of worker responsible for update chat. Never blocks.
+
+        :param item: Tuple of bot and update, same as the one update_loop used to put into :class:`queue.Queue`
+        :type item: :class:`tuple`
+        """
+        update: telegram.Update = item[1]
+        self.queues[shard_key(update) % len(self.queues)].put((item, time.monotonic()))
+
+    def qsize(self):
+        """
+        :return: Total amount of updates waiting to be handled
+        :rtype: :class:`int`
+        """
+        return sum(queue.qsize() for queue in self.queues)
+
+    def _worker(self, queue: Queue):
+        while True:
+            qupdate = queue.get()
+            try:
+                if qupdate is _STOP:
+                    break
+                if self._abandoned:
+                    continue
+                (bot, update), queued_at = qupdate
+                try:
+                    bot.handle_update(bot, update, queued_at=queued_at)
+                except octobot.exceptions.Halt:
+                    logger.info("Got Halt, setting stop event")
+                    self.stop_event.set()
+                except Exception:
+                    logger.error("Unhandled exception while handling update %s",
+                                 update.update_id, exc_info=True)
+                if self.on_handled is not None:
+                    self.on_handled(update)
+            finally:
+                queue.task_done()
+        logger.info("Stop event is set, exiting...")
+
+    def stop(self, timeout: float = None):
+        """
+        Stops worker threads. Updates that are already queued are handled before workers exit.
+
+        :param timeout: Drain deadline in seconds. Updates that are still queued after it are dropped without
+            calling `on_handled`, and handlers that are still running are left to daemon threads
+        :type timeout: :class:`float`, optional
+        """
+        self.stop_event.set()
+        for queue in self.queues:
+            queue.put(_STOP)
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        for thread in self.threads:
+            logger.debug("Joining thread %s", thread)
+            thread.join(max(0.0, deadline - time.monotonic()) if deadline is not None else None)
+        if any(thread.is_alive() for thread in self.threads):
+            self._abandoned = True
+            logger.warning("Updates were not handled in %ss, dropping %s queued updates", timeout, self.qsize())
+        self.threads = []
+
+
+class AsyncDispatcher:
+    """
+    asyncio counterpart of :class:`Dispatcher`. Runs event loop in separate thread, with `concurrency` worker
+    tasks each owning a shard of chats. Updates are handled by :meth:`octobot.OctoBot.handle_update_async`,
+    synchronous handlers are executed in thread pool with `executor_threads` threads.
+
+    :param concurrency: Amount of updates that can be handled at the same time
+    :type concurrency: :class:`int`
+    :param executor_threads: Size of thread pool for synchronous handlers
+    :type executor_threads: :class:`int`
+    :param stop_event: Event that gets set when some handler raises :exc:`octobot.Halt`
+    :type stop_event: :class:`threading.Event`, optional
+    :param on_handled: Function called with every update after it is handled, successfully or not
+    :type on_handled: callable, optional
+    """
+
+    def __init__(self, concurrency: int, executor_threads: int, stop_event: threading.Event = None,
+                 on_handled: Callable[[telegram.Update], None] = None):
+        if concurrency < 1:
+            raise ValueError("Dispatcher needs at least one worker")
+        if stop_event is None:
+            stop_event = threading.Event()
+        self.stop_event = stop_event
+        self.on_handled = on_handled
+        self.concurrency = concurrency
+        self.executor = ThreadPoolExecutor(executor_threads, thread_name_prefix="UpdateHandler")
+        self.loop = asyncio.new_event_loop()
+        self.loop.set_default_executor(self.executor)
+        self.queues = []
+        self.tasks = []
+        self.thread = None
+        self._ready = threading.Event()
+
+    def start(self):
+        """
+        Starts event loop thread
+        """
+        self.thread = threading.Thread(target=self._run_loop, name="AsyncDispatcher", daemon=True)
+        self.thread.start()
+        self._ready.wait()
+        return self
+
+    def _run_loop(self):
+        asyncio.set_event_loop(self.loop)
+        self.queues = [asyncio.Queue() for _ in range(self.concurrency)]
+        self.tasks = [self.loop.create_task(self._worker(queue)) for queue in self.queues]
+        self._ready.set()
+        self.loop.run_forever()
+        self.loop.close()
+
+    def put(self, item):
+        """
+        Puts update into the queue of worker responsible for update chat. Thread-safe and never blocks.
+
+        :param item: Tuple of bot and update
+        :type item: :class:`tuple`
+        """
+        queue = self.queues[shard_key(item[1]) % self.concurrency]
+        self.loop.call_soon_threadsafe(queue.put_nowait, (item, time.monotonic()))
+
+    def qsize(self):
+        """
+        :return: Total amount of updates waiting to be handled
+        :rtype: :class:`int`
+        """
+        return sum(queue.qsize() for queue in self.queues)
+
+    async def _worker(self, queue: asyncio.Queue):
+        while True:
+            qupdate = await queue.get()
+            if qupdate is _STOP:
+                break
+            (bot, update), queued_at = qupdate
+            try:
+                await bot.handle_update_async(bot, update, queued_at=queued_at)
+            except octobot.exceptions.Halt:
+                logger.info("Got Halt, setting stop event")
+                self.stop_event.set()
+            except Exception:
+                logger.error("Unhandled exception while handling update %s",
+                             update.update_id, exc_info=True)
+            if self.on_handled is not None:
+                self.on_handled(update)
+
+    def stop(self, timeout: float = None):
+        """
+        Stops worker tasks and event loop. Updates that are already queued are handled before workers exit.
+
+        :param timeout: Drain deadline in seconds. Worker tasks that are still running after it are cancelled,
+            synchronous handlers that are still running are left to executor threads
+        :type timeout: :class:`float`, optional
+        """
+        self.stop_event.set()
+        for queue in self.queues:
+            self.loop.call_soon_threadsafe(queue.put_nowait, _STOP)
+        drained = True
+        try:
+            asyncio.run_coroutine_threadsafe(asyncio.wait_for(self._wait_tasks(), timeout), self.loop).result()
+        except asyncio.TimeoutError:
+            drained = False
+            logger.warning("Updates were not handled in %ss, dropping %s queued updates", timeout, self.qsize())
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        self.executor.shutdown(wait=drained, cancel_futures=not drained)
+
+    async def _wait_tasks(self):
+        await asyncio.gather(*self.tasks)
@@ -14,6 +14,9 @@ class BaseFilter(BaseHandler):
             return self & func
         elif isinstance(func, BaseHandler) and 'handler' in self.allowed_types:
             self.function = func.handle_update
+            self.update_types = func.update_types
+            self.commands_only = func.commands_only
+            self.wants = func.wants
             return self
         elif callable(func) and 'function' in self.allowed_types:
             self.function = func
@@ -27,7 +30,7 @@ class BaseFilter(BaseHandler):
 
     def handle_update(self, bot, context):
         if self.validate(bot, context):
-            self.function(bot, context)
+            return self.function(bot, context)
 
     def __and__(self, other):
         return AndFilter(self, other)
@@ -62,6 +65,21 @@ class LogicalBaseFilter(BaseFilter):
 
 
 class AndFilter(LogicalBaseFilter):
+    @property
+    def update_types(self):
+        update_types = None
+        for filter in self.filters:
+            if filter.update_types is not None:
+                update_types = filter.update_types if update_types is None else update_types & filter.update_types
+        return update_types
+
+    @property
+    def commands_only(self):
+        return any(filter.commands_only for filter in self.filters)
+
+    def wants(self, update):
+        return all(filter.wants(update) for filter in self.filters)
+
     def validate(self, bot, context):
         for filter in self.filters:
             if not filter.validate(bot, context):
@@ -70,6 +88,19 @@ class AndFilter(LogicalBaseFilter):
 
 
 class OrFilter(LogicalBaseFilter):
+    @property
+    def update_types(self):
+        if any(filter.update_types is None for filter in self.filters):
+            return None
+        return frozenset().union(*(filter.update_types for filter in self.filters))
+
+    @property
+    def commands_only(self):
+        return all(filter.commands_only for filter in self.filters)
+
+    def wants(self, update):
+        return any(filter.wants(update) for filter in self.filters)
+
     def validate(self, bot, context):
         for filter in self.filters:
             if filter.validate(bot, context):
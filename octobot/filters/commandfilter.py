@@ -1,6 +1,7 @@
 from settings import Settings
-from typing import Union
+from typing import Optional, Union
 import octobot
+from octobot import ratelimit
 from .basefilters import BaseFilter
 import logging
 import warnings
@@ -33,48 +34,78 @@ class CommandFilter(BaseFilter):
                           "Use Not(ContextFilter(InlineQueryContext)) instead.",
                           DeprecationWarning, 2)
 
-    def check_command(self, bot, context):
+    def match_command(self, bot, context) -> Optional[str]:
+        """
+        Checks if context text calls one of filter commands, without side effects
+
+        :return: Called command without prefix, or None if text does not call any of filter commands
+        :rtype: :class:`str`, optional
+        """
         if isinstance(context, octobot.InlineQueryContext):
             if not self.inline_support:
-                return False
+                return None
             prefix = ''
         else:
             prefix = self.prefix
         incmd = context.text
-        ratelimit_enabled = Settings.ratelimit.enabled and type(
-            context) == octobot.MessageContext
-        if ratelimit_enabled:
-            admin = octobot.check_permissions(chat=context.chat, user=context.user,
-                                              permissions_to_check={"is_admin"})[
-                0] and context.chat.type == "supergroup"
-            rl_state = octobot.Database.redis.get(
-                f"ratelimit_state:{context.chat.id}")
-            if rl_state == b"user_abuse" and \
-                    not admin:
-                return False
         if incmd.startswith(prefix):
+            has_word_swap = incmd.count("/") >= 2
+            mention = "@" + bot.me.username
             for command_base in self.command:
                 command = prefix + command_base
-                state_only_command = incmd == command or incmd.startswith(
-                    command + " ")
-                state_word_swap = len(incmd.split(
-                    "/")) > 2 and incmd.startswith(command)
-                state_mention_command = incmd.startswith(
-                    command + "@" + bot.me.username)
+                if not incmd.startswith(command):
+                    continue
+                rest = incmd[len(command):]
+                state_only_command = rest == "" or rest[0] == " "
+                state_word_swap = has_word_swap
+                state_mention_command = rest.startswith(mention)
                 if state_only_command or state_word_swap or state_mention_command:
-                    context.called_command = command_base
-                    logger.info("%s called %s using, ctx type is %s",
-                                context.user.name, context.called_command, type(context))
-                    if ratelimit_enabled:
-                        if admin and Settings.ratelimit.adm_abuse_leave:
-                            key = f"ratelimit_adm:{context.chat.id}"
-                        else:
-                            key = f"ratelimit:{context.chat.id}"
-                        octobot.Database.redis.incr(key)
-                        octobot.Database.redis.expire(
-                            key, Settings.ratelimit.messages_timeframe)
-                    return True
-        return False
+                    return command_base
+        return None
+
+    def check_command(self, bot, context):
+        command_base = self.match_command(bot, context)
+        if command_base is None:
+            return False
+        context.called_command = command_base
+        logger.info("%s called %s using, ctx type is %s",
+                    context.user.name, context.called_command, type(context))
+        if Settings.ratelimit.enabled and type(context) == octobot.MessageContext:
+            admin = octobot.check_permissions(chat=context.chat, user=context.user,
+                                              permissions_to_check={"is_admin"})[
+                0] and context.chat.type == "supergroup"
+            state, changed, allowed = ratelimit.limiter.hit(context.chat.id, context.user.id, command_base, admin)
+            context.ratelimit_state = state
+            self._notify_ratelimit(context, state, changed, admin)
+            if not allowed:
+                logger.info("%s is over ratelimit", context.user.name)
+                return False
+        return True
+
+    @staticmethod
+    def _notify_ratelimit(context, state, changed, admin):
+        """
+        Tells chat that it was blocked by ratelimit. Leaves chats blocked for admin abuse and stops handling
+        of the update if user is not allowed to use commands
+        """
+        if state == ratelimit.ADMIN_ABUSE:
+            if changed:
+                logger.info("Banning chat %s", context.chat.id)
+            context.reply(context.localize("This chat is permanently blocked in the bot due to command abuse.\n"
+                                           "Please contact bot admin at {support_url} to get your chat unbanned.").format(
+                support_url=Settings.support_url))
+            context.chat.leave()
+            raise octobot.StopHandling
+        if state == ratelimit.USER_ABUSE and changed:
+            logger.info("Ratelimiting chat %s", context.chat.id)
+            if context.chat.type != "private":
+                context.reply(context.localize("Users in this chat now temporarily not allowed to use bot commands.\n"
+                                               "NOTE: This restriction doesn't apply to admins."))
+                if not admin:
+                    raise octobot.StopHandling
+            else:
+                context.reply(context.localize("You are now temporarily not allowed to use this bot."))
+                raise octobot.StopHandling
 
     def validate(self, bot: "octobot.OctoBot", context: "octobot.Context"):
         if isinstance(context, octobot.CallbackContext):
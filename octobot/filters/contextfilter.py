@@ -7,6 +7,7 @@ class ContextFilter(BaseFilter):
         if not issubclass(contextType, Context):
             raise TypeError(f"{contextType} is not a subclass of Context!")
         self.contextType = contextType
+        self.update_types = frozenset({contextType._update_field}) if contextType._update_field else None
         super(ContextFilter, self).__init__(*args, **kwargs)
 
     def validate(self, bot, context):
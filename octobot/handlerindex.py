@@ -0,0 +1,169 @@
+import logging
+import typing
+
+import telegram
+
+import octobot
+from octobot.filters import AndFilter, CommandFilter
+from octobot.handlers import BaseHandler
+
+logger = logging.getLogger("HandlerIndex")
+
+UPDATE_FIELDS = ("message", "edited_message", "inline_query", "callback_query", "chosen_inline_result")
+
+
+def get_command_filter(handler: BaseHandler) -> typing.Optional[CommandFilter]:
+    """
+    Finds command filter that must match for handler to do anything
+
+    :param handler: Handler to check
+    :return: :class:`CommandFilter` or None if handler is not bound to commands
+    """
+    if isinstance(handler, CommandFilter):
+        return handler
+    elif isinstance(handler, AndFilter):
+        for filter in handler.filters:
+            if isinstance(filter, CommandFilter):
+                return filter
+    return None
+
+
+def handler_label(handler: BaseHandler) -> str:
+    """
+    Short handler name for metrics and logs
+
+    :param handler: Handler
+    :return: First command of handler, or name of handler function if handler is not bound to commands
+    """
+    command_filter = get_command_filter(handler)
+    if command_filter is not None and command_filter.command:
+        return command_filter.command[0]
+    return getattr(getattr(handler, "function", None), "__name__", type(handler).__name__)
+
+
+class CommandTrie:
+    """
+    Prefix tree of commands. Every node is a dict of next character to node, handlers whose command ends on node
+    are stored under `None` key.
+    """
+
+    def __init__(self):
+        self.root = {}
+
+    def add(self, command: str, handler_id: int):
+        node = self.root
+        for char in command:
+            node = node.setdefault(char, {})
+        node.setdefault(None, []).append(handler_id)
+
+    def match(self, text: str) -> typing.List[int]:
+        """
+        :param text: Message text
+        :return: IDs of handlers which command is prefix of `text`
+        """
+        matches = []
+        node = self.root
+        for char in text:
+            node = node.get(char)
+            if node is None:
+                break
+            if None in node:
+                matches += node[None]
+        return matches
+
+
+def update_field(update: telegram.Update) -> typing.Optional[str]:
+    """
+    :return: Name of update field that contains update payload, like `message`, None for unknown update types
+    """
+    for field in UPDATE_FIELDS:
+        if getattr(update, field) is not None:
+            return field
+    return None
+
+
+class HandlerIndex:
+    """
+    Precompiled dispatch index, built by :meth:`octobot.OctoBot.update_handlers`.
+    Command handlers are put into command prefix trees, so update reaches only handlers whose command can match,
+    everything else is kept in list of generic handlers that run for every update (except `commands_only` ones,
+    which run only if some command matched).
+
+    Index also works as pre-dispatch classifier: :meth:`is_relevant` tells from raw update if any handler can
+    react to it, so plain chat messages are dropped before context is created if no generic handler wants them
+    (see :meth:`octobot.handlers.BaseHandler.wants`).
+
+    :param handlers: Handlers dictionary, priority -> list of handlers
+    :type handlers: :class:`dict`
+    """
+
+    def __init__(self, handlers: typing.Dict[int, typing.List[BaseHandler]]):
+        self.handlers = []
+        self.generic = []
+        self.command_generic = []
+        self.message_trie = CommandTrie()
+        self.inline_trie = CommandTrie()
+        # Generic handlers by update field they can react to, checked with BaseHandler.wants in is_relevant
+        self.field_handlers: typing.Dict[str, typing.List[BaseHandler]] = {field: [] for field in UPDATE_FIELDS}
+        for priority in sorted(handlers.keys()):
+            for handler in handlers[priority]:
+                handler_id = len(self.handlers)
+                self.handlers.append(handler)
+                command_filter = get_command_filter(handler)
+                if command_filter is None:
+                    if handler.commands_only:
+                        self.command_generic.append(handler_id)
+                        continue
+                    self.generic.append(handler_id)
+                    for field in handler.update_types or UPDATE_FIELDS:
+                        self.field_handlers.setdefault(field, []).append(handler)
+                    continue
+                for command in command_filter.command:
+                    self.message_trie.add(command_filter.prefix + command, handler_id)
+                    if command_filter.inline_support:
+                        self.inline_trie.add(command, handler_id)
+        self.all_generic = sorted(self.generic + self.command_generic)
+        logger.debug("Indexed %s handlers, %s of them are generic, generic handlers react to %s", len(self.handlers),
+                     len(self.all_generic), [field for field, field_handlers in self.field_handlers.items()
+                                             if field_handlers])
+
+    def is_relevant(self, update: telegram.Update) -> bool:
+        """
+        Checks if any handler can react to update, without creating context
+
+        :param update: Update to check
+        :type update: :class:`telegram.Update`
+        :return: False if update can be dropped
+        :rtype: :class:`bool`
+        """
+        field = update_field(update)
+        # Buttons are routed by callback data after context is created
+        if field is None or field == "callback_query":
+            return True
+        if any(handler.wants(update) for handler in self.field_handlers[field]):
+            return True
+        if field == "inline_query":
+            return bool(self.inline_trie.match(update.inline_query.query))
+        message = update.message or update.edited_message
+        if message is not None:
+            text = message.caption if message.caption is not None else message.text
+            return bool(text and self.message_trie.match(text))
+        return False
+
+    def get_handlers(self, context: "octobot.Context") -> typing.List[BaseHandler]:
+        """
+        Gets handlers that can be interested in context, in the order they should run
+
+        :param context: Update context
+        :type context: :class:`octobot.Context`
+        :return: List of handlers
+        """
+        if isinstance(context, octobot.CallbackContext):
+            return self.handlers
+        elif isinstance(context, octobot.InlineQueryContext):
+            matches = self.inline_trie.match(context.text)
+        else:
+            matches = self.message_trie.match(context.text)
+        if not matches:
+            return [self.handlers[handler_id] for handler_id in self.generic]
+        return [self.handlers[handler_id] for handler_id in sorted(set(matches).union(self.all_generic))]
@@ -2,12 +2,32 @@ from octobot.classes import PluginInfo
 
 
 class BaseHandler:
-    """Base class for all handlers"""
+    """
+    Base class for all handlers
+
+    :var update_types: Update fields (like `message`) handler can react to, None if handler can react to any update.
+        Updates no handler can react to are dropped before context is created
+    :var commands_only: If handler only needs updates that match some command
+    """
     plugin = {"plugin_info": PluginInfo("unknown")}
+    update_types = None
+    commands_only = False
 
     def __init__(self, priority=0):
         self.priority = priority
 
+    def wants(self, update) -> bool:
+        """
+        Cheap check of raw update, made before context is created. Generic handler that returns False does not make
+        update relevant for dispatch, so it can be dropped if no other handler wants it
+
+        :param update: Update to check
+        :type update: :class:`telegram.Update`
+        :return: False if handler does nothing with the update
+        :rtype: :class:`bool`
+        """
+        return True
+
     def handle_update(self, bot, update):
         raise RuntimeError("handle_update in handler not overridden!")
 
@@ -1,6 +1,7 @@
 from octobot.enums import PluginStates
 from octobot.handlers import BaseHandler
 import octobot
+from octobot.aio import catch_exceptions
 import octobot.utils
 
 
@@ -13,6 +14,7 @@ class InlineButtonHandler(BaseHandler):
 
     :param prefix: Prefix. Please end it with some non-letter symbol, like `:`
     """
+    update_types = frozenset({"callback_query"})
 
     def __init__(self, prefix, *args, **kwargs):
         super(type(self),
@@ -25,6 +27,7 @@ class InlineButtonHandler(BaseHandler):
         if isinstance(context, octobot.CallbackContext):
             if context.text.startswith(self.prefix):
                 try:
-                    self.function(bot, context)
+                    return catch_exceptions(self.function(bot, context),
+                                            lambda e: octobot.handle_exception(bot, context, e))
                 except Exception as e:
                     octobot.handle_exception(bot, context, e)
@@ -1,12 +1,14 @@
 from octobot.enums import PluginStates
 from octobot.handlers import BaseHandler
 import octobot
+from octobot.aio import catch_exceptions
 class ChosenInlineResultHandler(BaseHandler):
     """
     Inline query chosen result handler
 
     :param result_id: Prefix for ChosenInlineResult.id to match against
     """
+    update_types = frozenset({"chosen_inline_result"})
     def __init__(self, prefix, *args, **kwargs):
         super(ChosenInlineResultHandler, self).__init__(*args, **kwargs)
         self.prefix = prefix
@@ -17,6 +19,7 @@ class ChosenInlineResultHandler(BaseHandler):
         if isinstance(context, octobot.ChosenInlineResultContext):
             if context.update.chosen_inline_result.result_id.startswith(self.prefix):
                 try:
-                    self.function(bot, context)
+                    return catch_exceptions(self.function(bot, context),
+                                            lambda e: octobot.handle_exception(bot, context, e))
                 except Exception as e:
                     octobot.handle_exception(bot, context, e)
@@ -1,12 +1,14 @@
 from octobot.enums import PluginStates
 from octobot.handlers import BaseHandler
 import octobot
+from octobot.aio import catch_exceptions
 class InlineQueryHandler(BaseHandler):
     """
     Inline query click handler
 
     :param prefix: Prefix to match with
     """
+    update_types = frozenset({"inline_query"})
     def __init__(self, prefix, *args, **kwargs):
         super(InlineQueryHandler, self).__init__(*args, **kwargs)
         self.prefix = prefix
@@ -17,6 +19,7 @@ class InlineQueryHandler(BaseHandler):
         if isinstance(context, octobot.InlineQueryContext):
             if context.text.startswith(self.prefix):
                 try:
-                    self.function(bot, context)
+                    return catch_exceptions(self.function(bot, context),
+                                            lambda e: octobot.handle_exception(bot, context, e))
                 except Exception as e:
                     octobot.handle_exception(bot, context, e)
@@ -6,8 +6,23 @@ from octobot.handlers import BaseHandler
 class MessageHandler(BaseHandler):
     """
     Calls function on every message. Simple enough.
+
+    :param commands_only: Call function only on messages that match some command, defaults to False
+    :type commands_only: :class:`bool`, optional
+    :param update_filter: Cheap check of raw :class:`telegram.Update`, function is called only on messages it returns
+        True for. Messages that no handler wants are dropped before context is created
+    :type update_filter: :class:`callable`, optional
     """
+    update_types = frozenset({"message"})
+
+    def __init__(self, priority=0, commands_only=False, update_filter=None):
+        super(MessageHandler, self).__init__(priority)
+        self.commands_only = commands_only
+        self.update_filter = update_filter
+
+    def wants(self, update):
+        return self.update_filter is None or self.update_filter(update)
 
     def handle_update(self, bot, context):
-        if context.update.message:
-            self.function(bot, context)
+        if context.update.message and self.wants(context.update):
+            return self.function(bot, context)
@@ -0,0 +1,175 @@
+import logging
+import threading
+from collections import defaultdict
+from typing import Dict, Tuple, Union
+from urllib.parse import urlparse
+
+import requests
+import requests.adapters
+import telegram.utils.request
+
+from octobot import tracing
+from settings import Settings
+
+logger = logging.getLogger("HTTPClient")
+
+Timeout = Union[float, Tuple[float, float]]
+
+
+def pool_stats(pool_manager) -> Dict[str, dict]:
+    """
+    Gets connection pool usage of urllib3 pool manager
+
+    :param pool_manager: urllib3 (or PTB vendored urllib3) :class:`PoolManager`
+    :return: Dictionary of host to dictionary with amount of free pool slots (connections not checked out),
+        pool size, connections opened and requests made
+    :rtype: :class:`dict`
+    """
+    stats = {}
+    for key in list(pool_manager.pools.keys()):
+        pool = pool_manager.pools.get(key)
+        if pool is None:
+            continue
+        stats[pool.host] = {
+            "free": pool.pool.qsize() if pool.pool is not None else 0,
+            "pool_size": pool.pool.maxsize if pool.pool is not None else 0,
+            "connections": pool.num_connections,
+            "requests": pool.num_requests
+        }
+    return stats
+
+
+class PooledSession(requests.Session):
+    """
+    :class:`requests.Session` with bounded connection pool per host, default timeouts and in-flight
+    request accounting. Requests above pool size wait for free connection for up to connect timeout and raise
+    :class:`requests.exceptions.ConnectionError` if none is freed. Waits are counted, so undersized pool shows up
+    in :meth:`stats`.
+
+    :param pool_size: Maximum amount of connections per host
+    :type pool_size: :class:`int`
+    :param timeout: Default timeout for requests that do not set one, seconds or (connect, read) tuple
+    :type timeout: :class:`float` or :class:`tuple`
+    """
+
+    def __init__(self, pool_size: int, timeout: Timeout):
+        super(PooledSession, self).__init__()
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self.host_timeouts: Dict[str, Timeout] = {}
+        self.host_pool_sizes: Dict[str, int] = {}
+        self.active = defaultdict(int)
+        self.peak = defaultdict(int)
+        self.waits = defaultdict(int)
+        self._slots: Dict[str, threading.BoundedSemaphore] = {}
+        self._lock = threading.Lock()
+        self._mount_adapter(None, pool_size)
+
+    def configure_host(self, host: str, pool_size: int = None, timeout: Timeout = None):
+        """
+        Overrides pool size and/or default timeout for single host
+
+        :param host: Host name, like `api.urbandictionary.com`
+        :type host: :class:`str`
+        :param pool_size: Maximum amount of connections to the host
+        :type pool_size: :class:`int`, optional
+        :param timeout: Default timeout for requests to the host
+        :type timeout: :class:`float` or :class:`tuple`, optional
+        """
+        if pool_size is not None:
+            self.host_pool_sizes[host] = pool_size
+            self._mount_adapter(host, pool_size)
+        if timeout is not None:
+            self.host_timeouts[host] = timeout
+
+    def _mount_adapter(self, host, pool_size: int):
+        if host is None:
+            adapter = requests.adapters.HTTPAdapter(pool_connections=16, pool_maxsize=pool_size, pool_block=True)
+            self.mount("https://", adapter)
+            self.mount("http://", adapter)
+        else:
+            adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, pool_block=True)
+            with self._lock:
+                self._slots.pop(host, None)
+            self.mount(f"https://{host}/", adapter)
+            self.mount(f"http://{host}/", adapter)
+
+    def reset_pools(self):
+        """
+        Replaces connection pools with empty ones. Call in forked process, kept-alive connections of parent process
+        must not be shared with it
+        """
+        self._mount_adapter(None, self.pool_size)
+        for host, pool_size in self.host_pool_sizes.items():
+            self._mount_adapter(host, pool_size)
+        with self._lock:
+            self.active.clear()
+            self._slots.clear()
+
+    def _acquire_slot(self, host: str, timeout: Timeout) -> threading.BoundedSemaphore:
+        with self._lock:
+            slots = self._slots.get(host)
+            if slots is None:
+                slots = self._slots[host] = threading.BoundedSemaphore(self.host_pool_sizes.get(host, self.pool_size))
+        if slots.acquire(blocking=False):
+            return slots
+        with self._lock:
+            self.waits[host] += 1
+        # urllib3 pool blocks without timeout when requests does not pass one, so wait here instead
+        if not slots.acquire(timeout=timeout[0] if isinstance(timeout, tuple) else timeout):
+            raise requests.exceptions.ConnectionError(f"Connection pool of {host} is full")
+        return slots
+
+    def send(self, request, **kwargs):
+        host = urlparse(request.url).hostname
+        if kwargs.get("timeout") is None:
+            kwargs["timeout"] = self.host_timeouts.get(host, self.timeout)
+        slots = self._acquire_slot(host, kwargs["timeout"])
+        with self._lock:
+            self.active[host] += 1
+            self.peak[host] = max(self.peak[host], self.active[host])
+        try:
+            with tracing.measure_external("http", host):
+                return super(PooledSession, self).send(request, **kwargs)
+        finally:
+            with self._lock:
+                self.active[host] -= 1
+            slots.release()
+
+    def stats(self) -> Dict[str, dict]:
+        """
+        :return: Dictionary of host to dictionary with amount of requests in flight, peak amount of requests in flight,
+            amount of requests that had to wait for free connection, and pool size
+        :rtype: :class:`dict`
+        """
+        with self._lock:
+            return {host: {"active": self.active[host], "peak": self.peak[host], "waits": self.waits[host],
+                           "pool_size": self.host_pool_sizes.get(host, self.pool_size)}
+                    for host in self.peak}
+
+
+def default_pool_size() -> int:
+    """
+    :return: Pool size from settings, or amount of threads that can make requests at the same time if it is not set
+    :rtype: :class:`int`
+    """
+    if Settings.http.pool_size > 0:
+        return Settings.http.pool_size
+    workers = Settings.threads
+    if Settings.send_queue.enabled:
+        workers += Settings.send_queue.workers
+    # Update loop uses one more connection for getUpdates
+    return workers + 1
+
+
+def create_bot_request() -> telegram.utils.request.Request:
+    """
+    Creates Bot API transport with connection pool big enough for all workers
+    """
+    return telegram.utils.request.Request(con_pool_size=default_pool_size(),
+                                          connect_timeout=Settings.http.connect_timeout,
+                                          read_timeout=Settings.http.read_timeout)
+
+
+session = PooledSession(default_pool_size(), (Settings.http.connect_timeout, Settings.http.read_timeout))
+session.headers.update({"User-Agent": Settings.user_agent})
@@ -0,0 +1,214 @@
+import abc
+import dataclasses
+import hashlib
+import importlib.util
+import json
+import logging
+import os
+import types
+from typing import Dict, List, Optional, Tuple
+
+import octobot
+from octobot.classes import PluginInfo
+from octobot.dataclass import Suggestion
+from octobot.enums import PluginStates
+from octobot.filters import CommandFilter
+from octobot.handlers import BaseHandler, CommandHandler, InlineButtonHandler
+from octobot.handlers.cataloghandler import CatalogHandler
+
+logger = logging.getLogger("LazyPlugins")
+
+MANIFEST_PATH = ".plugin_manifest.json"
+COMMAND_FIELDS = ("command", "prefix", "inline_support", "description", "long_description", "hidden", "service",
+                  "required_args")
+
+
+def plugin_source_hash(plugin_name: str) -> Optional[str]:
+    """
+    :return: SHA1 of plugin source file, or None if it can't be found
+    """
+    try:
+        spec = importlib.util.find_spec(plugin_name)
+    except (ImportError, ValueError):
+        return None
+    if spec is None or spec.origin is None or not os.path.isfile(spec.origin):
+        return None
+    with open(spec.origin, "rb") as f:
+        return hashlib.sha1(f.read()).hexdigest()
+
+
+def load_manifest(path: str = MANIFEST_PATH) -> dict:
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+    except ValueError:
+        logger.warning("Plugin manifest %s is corrupted, ignoring it", path)
+        return {}
+
+
+def save_manifest(manifest: dict, path: str = MANIFEST_PATH):
+    tmp_path = path + ".tmp"
+    try:
+        with open(tmp_path, "w") as f:
+            json.dump(manifest, f, indent=1)
+        os.replace(tmp_path, path)
+    except OSError:
+        logger.warning("Failed to save plugin manifest to %s", path, exc_info=True)
+
+
+def describe_plugin(plugin: PluginInfo) -> Optional[dict]:
+    """
+    Creates manifest entry for loaded plugin
+
+    :param plugin: Loaded plugin
+    :type plugin: :class:`octobot.PluginInfo`
+    :return: Manifest entry, or None if plugin can't be loaded lazily - it has handlers that have to see
+        every update, exception handlers, after_load function or handler_kwargs
+    :rtype: :class:`dict`
+    """
+    if plugin.module is None or plugin.state != PluginStates.loaded or plugin.after_load is not None \
+            or plugin.handler_kwargs:
+        return None
+    handlers = []
+    for attr in dir(plugin.module):
+        var = getattr(plugin.module, attr)
+        if not isinstance(var, BaseHandler):
+            continue
+        handler_type = type(var).__name__
+        if handler_type not in STUB_TYPES:
+            return None
+        entry = {"attr": attr, "type": handler_type, "priority": var.priority}
+        if isinstance(var, InlineButtonHandler):
+            entry["prefix"] = var.prefix
+        else:
+            for field_name in COMMAND_FIELDS:
+                entry[field_name] = getattr(var, field_name)
+            entry["suggestion"] = dataclasses.asdict(var.suggestion) if var.suggestion is not None else None
+            if isinstance(var, CatalogHandler):
+                entry["query_required"] = var.query_required
+        handlers.append(entry)
+    if not handlers:
+        return None
+    return {"hash": plugin_source_hash(plugin.module.__name__), "name": plugin.name,
+            "can_disable": plugin.can_disable, "requires": plugin.requires, "load_after": plugin.load_after,
+            "handlers": handlers}
+
+
+class LazyHandlerMixin(abc.ABC):
+    """
+    Stand-in for handler of plugin that is not imported yet. Imports plugin when update can reach the real handler,
+    then passes update to it.
+    """
+    plugin_name: str
+    attr: str
+
+    def _setup(self, plugin_name: str, entry: dict):
+        self.plugin_name = plugin_name
+        self.attr = entry["attr"]
+        self.priority = entry["priority"]
+
+    @abc.abstractmethod
+    def callback_matches(self, text: str) -> bool:
+        pass
+
+    def update_matches(self, bot, context) -> bool:
+        return False
+
+    def handle_update(self, bot, context):
+        if isinstance(context, octobot.CallbackContext):
+            if not self.callback_matches(context.text):
+                return
+        elif not self.update_matches(bot, context):
+            return
+        plugin = bot.activate_plugin(self.plugin_name)
+        handler = getattr(plugin.module, self.attr, None) if plugin is not None else None
+        if handler is None:
+            logger.warning("Handler %s disappeared from plugin %s after activation", self.attr, self.plugin_name)
+            return
+        context._plugin = handler.plugin
+        context._handler = handler
+        return handler.handle_update(bot, context)
+
+
+class LazyCommandMixin(LazyHandlerMixin):
+    def _setup(self, plugin_name: str, entry: dict):
+        super(LazyCommandMixin, self)._setup(plugin_name, entry)
+        for field_name in COMMAND_FIELDS:
+            setattr(self, field_name, entry[field_name])
+        self.suggestion = Suggestion(**entry["suggestion"]) if entry["suggestion"] is not None else None
+
+    def callback_matches(self, text: str) -> bool:
+        return any(text.startswith(self.prefix + command) for command in self.command)
+
+    def update_matches(self, bot, context) -> bool:
+        # Handler index matches by prefix, "/testing" must not import plugin that handles "/test"
+        return self.match_command(bot, context) is not None
+
+
+# Constructors of real classes are not called, they emit deprecation warnings and need decorated function
+
+
+class LazyCommandFilter(LazyCommandMixin, CommandFilter):
+    def __init__(self, plugin_name: str, entry: dict):
+        self._setup(plugin_name, entry)
+
+
+class LazyCommandHandler(LazyCommandMixin, CommandHandler):
+    def __init__(self, plugin_name: str, entry: dict):
+        self._setup(plugin_name, entry)
+
+
+class LazyCatalogHandler(LazyCommandMixin, CatalogHandler):
+    def __init__(self, plugin_name: str, entry: dict):
+        self._setup(plugin_name, entry)
+        self.query_required = entry["query_required"]
+
+    def callback_matches(self, text: str) -> bool:
+        # Catalog page buttons are "command:query:offset"
+        return super(LazyCatalogHandler, self).callback_matches(text) or text.startswith(self.command[0] + ":")
+
+
+class LazyInlineButtonHandler(LazyHandlerMixin, InlineButtonHandler):
+    def __init__(self, plugin_name: str, entry: dict):
+        self._setup(plugin_name, entry)
+        self.prefix = entry["prefix"]
+
+    def callback_matches(self, text: str) -> bool:
+        return text.startswith(self.prefix)
+
+
+STUB_TYPES = {
+    "CommandFilter": LazyCommandFilter,
+    "CommandHandler": LazyCommandHandler,
+    "CatalogHandler": LazyCatalogHandler,
+    "InlineButtonHandler": LazyInlineButtonHandler,
+}
+
+
+def create_lazy_plugin(plugin_name: str, entry: dict) -> Tuple[PluginInfo, List[BaseHandler]]:
+    """
+    Creates placeholder plugin info and handler stubs from manifest entry
+
+    :param plugin_name: Plugin name in module format
+    :param entry: Manifest entry created by :func:`describe_plugin`
+    :return: Tuple of plugin info and list of handler stubs
+    """
+    plugin = PluginInfo(entry["name"], state=PluginStates.loaded, can_disable=entry["can_disable"],
+                        requires=entry.get("requires", []), load_after=entry.get("load_after", []))
+    plugin.state_description = "Not imported yet"
+    plugin.module = types.ModuleType(plugin_name)
+    return plugin, [STUB_TYPES[handler["type"]](plugin_name, handler) for handler in entry["handlers"]]
+
+
+def valid_entries(manifest: dict, plugin_names: List[str]) -> Dict[str, dict]:
+    """
+    :return: Manifest entries of plugins from `plugin_names` whose source did not change since manifest was created
+    """
+    entries = {}
+    for plugin_name in plugin_names:
+        entry = manifest.get(plugin_name)
+        if entry is not None and entry["hash"] is not None and entry["hash"] == plugin_source_hash(plugin_name):
+            entries[plugin_name] = entry
+    return entries
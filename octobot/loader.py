@@ -1,7 +1,9 @@
 import base64
+import contextvars
 import os
 import sys
 import threading
+from concurrent.futures import Future, ThreadPoolExecutor
 from glob import glob
 import importlib
 
@@ -14,11 +16,16 @@ import octobot.handlers
 import logging
 
 from octobot import PluginInfo, handle_exception, PluginStates
+from octobot.aio import maybe_await, run_sync, to_thread
+from octobot import lazyplugins, tracing
+from octobot.handlerindex import HandlerIndex, handler_label
+from octobot.sendqueue import Priority, SendQueue
 from octobot.utils import path_to_module, thread_local
 from settings import Settings
 
 logger = logging.getLogger("Loader")
 TEST_RUNNING = "pytest" in sys.modules
+UNMET_REQUIREMENTS = "Required plugin is not loaded"
 
 
 class OctoBot(telegram.ext.ExtBot):
@@ -32,8 +39,13 @@ class OctoBot(telegram.ext.ExtBot):
     """
     plugins = {}
     handlers = {}
+    handler_index = HandlerIndex({})
     error_handlers = []
     test_running = TEST_RUNNING
+    send_queue: SendQueue = None
+    #: Handler stubs of plugins that are registered from manifest but not imported yet
+    lazy_handlers = {}
+    _activation_lock = threading.RLock()
 
     def __init__(self, load_list, *args, **kwargs):
         dry_run = os.environ.get("DRY_RUN", False)
@@ -45,19 +57,44 @@ class OctoBot(telegram.ext.ExtBot):
         if TEST_RUNNING:
             self.me = telegram.User(
                 is_bot=True, username="test_bot", id=4, first_name="Unittest")
-        for plugin in glob("base_plugins/*.py"):
-            logger.info("Loading base plugin %s", plugin)
-            self.load_plugin(path_to_module(plugin))
+        base_plugins = [path_to_module(plugin) for plugin in glob("base_plugins/*.py")]
         if len(load_list) > 0:
             logger.info("LoadList: %s", load_list)
             load_list_actual = []
             for plugin in load_list:
                 load_list_actual.append(path_to_module(plugin))
-            self.load_plugins({"exclude": [], "load_order": load_list_actual})
+            plugins = {"exclude": [], "load_order": load_list_actual}
         else:
             logger.info("LoadList not specified, loading all")
             plugins = self.discover_plugins()
-            self.load_plugins(plugins)
+        plugins["load_order"] = base_plugins + plugins["load_order"]
+        self.load_plugins(plugins, lazy=Settings.lazy_plugins and not TEST_RUNNING)
+
+    def call_queued(self, chat_id, priority: Priority, function, /, *args, **kwargs) -> Future:
+        """
+        Makes Bot API call through :attr:`send_queue`, or right away if send queue is not running.
+        See :meth:`octobot.sendqueue.SendQueue.submit` for arguments.
+
+        :return: Future with result of the call
+        :rtype: :class:`concurrent.futures.Future`
+        """
+        if self.send_queue is not None:
+            # Copying context keeps call attributed to the update trace
+            return self.send_queue.submit(chat_id, priority, contextvars.copy_context().run, function, *args,
+                                          **kwargs)
+        future = Future()
+        try:
+            future.set_result(function(*args, **kwargs))
+        except Exception as e:
+            future.set_exception(e)
+        return future
+
+    def _post(self, endpoint, *args, **kwargs):
+        if endpoint == "getUpdates":
+            # Long polling would drown out real Bot API latency
+            return super(OctoBot, self)._post(endpoint, *args, **kwargs)
+        with tracing.measure_external("bot_api", endpoint):
+            return super(OctoBot, self)._post(endpoint, *args, **kwargs)
 
     @staticmethod
     def discover_plugins():
@@ -79,28 +116,102 @@ class OctoBot(telegram.ext.ExtBot):
         """
         Updates handlers from self.plugins. Usually gets called after :meth:`load_plugins` or :meth:`load_plugin` (if `single_load=True`)
         """
-        self.handlers = {}
-        for plugin in self.plugins.values():
+        levels = self._sort_plugins()
+        self._index_handlers()
+        logger.debug("Running post-load functions...")
+        for level in levels:
+            functions = [self.plugins[plugin_name].after_load for plugin_name in level
+                         if self.plugins[plugin_name].after_load is not None
+                         and self.plugins[plugin_name].state_description != UNMET_REQUIREMENTS]
+            self._run_parallel(functions, self)
+
+    @staticmethod
+    def _run_parallel(functions, *args):
+        """
+        Calls every function from `functions` with `args` in thread pool of `plugin_load_workers` threads,
+        waits for all of them and re-raises first exception
+        """
+        if Settings.plugin_load_workers <= 1 or len(functions) <= 1:
+            return [function(*args) for function in functions]
+        with ThreadPoolExecutor(min(Settings.plugin_load_workers, len(functions)),
+                                thread_name_prefix="PluginLoader") as executor:
+            futures = [executor.submit(function, *args) for function in functions]
+        return [future.result() for future in futures]
+
+    def _sort_plugins(self):
+        """
+        Reorders :attr:`plugins` so plugins come after plugins from their `requires` and `load_after`, keeping
+        original order otherwise, and disables plugins with requirements that are not loaded
+
+        :return: Plugin names grouped in levels, plugins of each level depend only on plugins from previous levels
+        :rtype: list
+        """
+        levels = {}
+        remaining = list(self.plugins)
+        while remaining:
+            progress = False
+            for plugin_name in list(remaining):
+                plugin = self.plugins[plugin_name]
+                dependencies = [dependency for dependency in plugin.requires + plugin.load_after
+                                if dependency in self.plugins and dependency != plugin_name]
+                if all(dependency in levels for dependency in dependencies):
+                    levels[plugin_name] = max((levels[dependency] + 1 for dependency in dependencies), default=0)
+                    remaining.remove(plugin_name)
+                    progress = True
+            if not progress:
+                logger.error("Circular dependencies between plugins %s, ignoring their order", remaining)
+                last_level = max(levels.values(), default=-1) + 1
+                for plugin_name in remaining:
+                    levels[plugin_name] = last_level
+                break
+        grouped = [[] for _ in range(max(levels.values(), default=-1) + 1)]
+        for plugin_name, level in levels.items():
+            grouped[level].append(plugin_name)
+        ordered = {plugin_name: self.plugins[plugin_name] for level in grouped for plugin_name in level}
+        self.plugins.clear()
+        self.plugins.update(ordered)
+        for plugin_name, plugin in ordered.items():
+            if plugin.state not in (PluginStates.loaded, PluginStates.warning):
+                continue
+            for requirement in plugin.requires:
+                if requirement not in ordered or ordered[requirement].state not in (PluginStates.loaded,
+                                                                                    PluginStates.warning):
+                    logger.warning("Disabling plugin %s, required plugin %s is not loaded", plugin_name, requirement)
+                    plugin.state = PluginStates.disabled
+                    plugin.state_description = UNMET_REQUIREMENTS
+                    break
+        return grouped
+
+    def _index_handlers(self):
+        handlers = {}
+        error_handlers = []
+        for plugin_name, plugin in self.plugins.items():
+            plugin.plugin_mask = octobot.Database.plugin_bit(plugin_name)
+            if plugin_name in self.lazy_handlers:
+                for var in self.lazy_handlers[plugin_name]:
+                    var.plugin = plugin
+                    handlers.setdefault(var.priority, []).append(var)
+                continue
             module = plugin["module"]
             for var_name in dir(module):
                 var = getattr(module, var_name)
                 if isinstance(var, octobot.handlers.ExceptionHandler):
-                    self.error_handlers.append(var)
+                    error_handlers.append(var)
                 if isinstance(var, octobot.handlers.BaseHandler):
                     var.plugin = plugin
-                    if var.priority not in self.handlers:
-                        self.handlers[var.priority] = []
+                    if var.priority not in handlers:
+                        handlers[var.priority] = []
                     if type(var).__name__ in plugin.handler_kwargs:
                         for k, v in plugin.handler_kwargs[type(var).__name__].items():
                             setattr(var, k, v)
-                    self.handlers[var.priority].append(var)
+                    handlers[var.priority].append(var)
+        self.handlers = handlers
+        self.error_handlers = error_handlers
+        self.handler_index = HandlerIndex({priority: [handler for handler in priority_handlers
+                                                      if handler.plugin.state != PluginStates.disabled]
+                                           for priority, priority_handlers in handlers.items()})
         logger.info("Handlers update complete, priority levels: %s",
-                    self.handlers.keys())
-        logger.debug("Running post-load functions...")
-        for plugin in self.plugins.values():
-            func = plugin.after_load
-            if func is not None:
-                func(self)
+                    handlers.keys())
 
     def load_plugin(self, plugin_name: str, single_load=False):
         """
@@ -111,7 +222,7 @@ class OctoBot(telegram.ext.ExtBot):
         :param single_load: If plugin is loaded not together with other plugins (e.g. manually loaded from other plugin). Defaults to False
         :type single_load: bool,optional
         """
-        if plugin_name in self.plugins:
+        if plugin_name in self.plugins and self.lazy_handlers.pop(plugin_name, None) is None:
             old_plugin = self.plugins[plugin_name]
         else:
             old_plugin = None
@@ -161,23 +272,85 @@ class OctoBot(telegram.ext.ExtBot):
             self.update_handlers()
         return res
 
-    def load_plugins(self, load_list: dict):
+    def load_plugins(self, load_list: dict, lazy=False):
         """
         Loads plugins using dict generated by :meth:`discover_plugins()`
 
         :param load_list: Load list. Usually generated by :meth:`discover_plugins()`
+        :param lazy: Do not import plugins that are described in plugin manifest and did not change since,
+            register handler stubs instead. Plugin is imported when one of its handlers is hit first time,
+            see :meth:`activate_plugin`. Defaults to False
+        :type lazy: bool,optional
+
+        Plugins are imported one by one, dependencies are only known after import. Then plugins are reordered by
+        `requires` and `load_after` of :class:`octobot.PluginInfo`, and post-load functions of plugins from same
+        dependency level run in parallel, see :meth:`update_handlers`.
         """
+        manifest = lazyplugins.load_manifest() if lazy else {}
+        entries = lazyplugins.valid_entries(manifest, load_list["load_order"])
         for plugin in load_list["load_order"]:
-            self.load_plugin(plugin)
+            if plugin in entries and plugin not in Settings.exclude_plugins:
+                self.plugins[plugin], self.lazy_handlers[plugin] = lazyplugins.create_lazy_plugin(plugin,
+                                                                                                  entries[plugin])
+                logger.info("Registered plugin %s without importing it", plugin)
+            else:
+                self.load_plugin(plugin)
         self.update_handlers()
+        if lazy:
+            logger.info("%s of %s plugins are not imported", len(entries), len(load_list["load_order"]))
+            changed = False
+            for plugin in load_list["load_order"]:
+                if plugin in entries:
+                    continue
+                entry = lazyplugins.describe_plugin(self.plugins[plugin])
+                if manifest.get(plugin) != entry:
+                    changed = True
+                    if entry is None:
+                        manifest.pop(plugin, None)
+                    else:
+                        manifest[plugin] = entry
+            if changed:
+                lazyplugins.save_manifest(manifest)
         return
 
-    def handle_update(self, bot, update: telegram.Update):
-        logger.debug("handling update %s", update.to_dict())
+    def activate_plugin(self, plugin_name: str) -> PluginInfo:
+        """
+        Imports plugin that was registered without importing by :meth:`load_plugins` and replaces its handler stubs
+        with real handlers. Does nothing if plugin is already imported.
+
+        :param plugin_name: Plugin name in module format (ex. `plugins.test`)
+        :type plugin_name: str
+        :return: Plugin info
+        :rtype: :class:`octobot.PluginInfo`
+        """
+        with self._activation_lock:
+            if plugin_name in self.lazy_handlers:
+                logger.info("Activating plugin %s", plugin_name)
+                self.load_plugin(plugin_name)
+                self._index_handlers()
+                plugin = self.plugins[plugin_name]
+                if plugin.after_load is not None:
+                    plugin.after_load(self)
+            return self.plugins.get(plugin_name)
+
+    def _create_context(self, bot, update: telegram.Update):
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("handling update %s", update.to_dict())
         thread_local.current_context = None
+        member_update = update.chat_member or update.my_chat_member
+        if member_update is not None:
+            octobot.permissions.handle_member_update(member_update)
+            return
+        if not self.handler_index.is_relevant(update):
+            tracing.skipped_updates.inc()
+            return
         try:
-            ctx = octobot.Context.create_context(update, bot)
+            with tracing.measure_context():
+                ctx = octobot.Context.create_context(update, bot)
             thread_local.current_context = ctx
+            trace = tracing.current_trace.get()
+            if trace is not None:
+                trace.update_type = type(ctx).__name__
         except octobot.exceptions.UnknownUpdate:
             unknown_thing = "unknown, update dict: %s" % update.to_dict()
             for var_name, var in vars(update).items():
@@ -188,42 +361,97 @@ class OctoBot(telegram.ext.ExtBot):
             return
         except octobot.exceptions.StopHandling:
             return
-        disabled_plugins = []
-        if octobot.Database.redis is not None and update.effective_message is not None and update.effective_chat.type == "supergroup":
-            disabled_plugins = octobot.Database.redis.smembers(
-                f"plugins_disabled{update.effective_chat.id}")
+        return ctx
+
+    def _active_handlers(self, ctx, disabled_mask):
+        for handler in self.handler_index.get_handlers(ctx):
+            if handler.plugin.plugin_mask & disabled_mask or handler.plugin.state == PluginStates.disabled:
+                continue
+            ctx._plugin = handler.plugin
+            ctx._handler = handler
+            yield handler
+
+    @staticmethod
+    def _call_in_context(ctx, function, *args):
+        thread_local.current_context = ctx
+        return function(*args)
+
+    def _handler_failed(self, ctx, e):
+        logger.error(
+            "Handler threw an exception!", exc_info=True)
+        handle_exception(self, ctx, e, notify=False)
+
+    def handle_update(self, bot, update: telegram.Update, queued_at: float = None):
+        """
+        Handles update, recording its timings into :mod:`octobot.tracing` metrics
+
+        :param bot: Bot
+        :param update: Update to handle
+        :type update: :class:`telegram.Update`
+        :param queued_at: :func:`time.monotonic` time when update was queued
+        :type queued_at: :class:`float`, optional
+        """
+        with tracing.trace_update(update.update_id, queued_at, Settings.tracing.slow_update_threshold):
+            return self._handle_update(bot, update)
+
+    def _handle_update(self, bot, update: telegram.Update):
+        ctx = self._create_context(bot, update)
+        if ctx is None:
+            return
+        disabled_mask = ctx.preloaded.disabled_mask
         if isinstance(ctx, octobot.CallbackContext) and isinstance(ctx.callback_data, octobot.Callback):
-            return ctx.callback_data.execute(bot, ctx)
-        for priority in sorted(self.handlers.keys()):
-            handlers = self.handlers[priority]
-            logger.debug(f"handling priority level {priority}")
-            try:
-                for handler in handlers:
-                    if handler.plugin.module.__name__.encode() in disabled_plugins or handler.plugin.state == PluginStates.disabled:
-                        continue
-                    try:
-                        ctx._plugin = handler.plugin
-                        ctx._handler = handler
-                        handler.handle_update(bot, ctx)
-                    except octobot.exceptions.Halt as e:
-                        raise e
-                    except octobot.exceptions.StopHandling as e:
-                        raise e
-                    except octobot.exceptions.PassExceptionToDebugger as e:
-                        raise e
-                    except telegram.error.TimedOut:
-                        pass
-                    except Exception as e:
-                        logger.error(
-                            "Handler threw an exception!", exc_info=True)
-                        handle_exception(self, ctx, e, notify=False)
-            except octobot.exceptions.StopHandling:
-                break
-            except octobot.exceptions.PassExceptionToDebugger as e:
-                raise e.exception
+            return run_sync(ctx.callback_data.execute(bot, ctx))
+        try:
+            for handler in self._active_handlers(ctx, disabled_mask):
+                try:
+                    with tracing.measure_handler(handler.plugin.module.__name__, handler_label(handler)):
+                        run_sync(handler.handle_update(bot, ctx))
+                except (octobot.exceptions.Halt, octobot.exceptions.StopHandling,
+                        octobot.exceptions.PassExceptionToDebugger) as e:
+                    raise e
+                except telegram.error.TimedOut:
+                    pass
+                except Exception as e:
+                    self._handler_failed(ctx, e)
+        except octobot.exceptions.StopHandling:
+            pass
+        except octobot.exceptions.PassExceptionToDebugger as e:
+            raise e.exception
         # if update.inline_query and not ctx.replied:
         #     update.inline_query.answer([], switch_pm_text=ctx.localize("Click here for command list"), switch_pm_parameter="help")
 
+    async def handle_update_async(self, bot, update: telegram.Update, queued_at: float = None):
+        """
+        asyncio version of :meth:`handle_update`. Coroutine handlers are awaited in event loop,
+        synchronous handlers and context creation are executed in thread pool.
+        """
+        with tracing.trace_update(update.update_id, queued_at, Settings.tracing.slow_update_threshold):
+            return await self._handle_update_async(bot, update)
+
+    async def _handle_update_async(self, bot, update: telegram.Update):
+        ctx = await to_thread(self._create_context, bot, update)
+        if ctx is None:
+            return
+        disabled_mask = ctx.preloaded.disabled_mask
+        if isinstance(ctx, octobot.CallbackContext) and isinstance(ctx.callback_data, octobot.Callback):
+            return await maybe_await(await to_thread(self._call_in_context, ctx, ctx.callback_data.execute, bot, ctx))
+        try:
+            for handler in self._active_handlers(ctx, disabled_mask):
+                try:
+                    with tracing.measure_handler(handler.plugin.module.__name__, handler_label(handler)):
+                        await maybe_await(await to_thread(self._call_in_context, ctx, handler.handle_update, bot, ctx))
+                except (octobot.exceptions.Halt, octobot.exceptions.StopHandling,
+                        octobot.exceptions.PassExceptionToDebugger) as e:
+                    raise e
+                except telegram.error.TimedOut:
+                    pass
+                except Exception as e:
+                    await to_thread(self._call_in_context, ctx, self._handler_failed, ctx, e)
+        except octobot.exceptions.StopHandling:
+            pass
+        except octobot.exceptions.PassExceptionToDebugger as e:
+            raise e.exception
+
     def generate_startlink(self, command):
         command = f"b64-{base64.urlsafe_b64encode(command.encode()).decode()}"
         return f"https://t.me/{self.me.username}?start={command}"
@@ -1,8 +1,11 @@
+import gettext
+import logging
 import os
 
 import telegram
 
 from octobot import Database
+from octobot.database import UpdatePreload
 from typing import Union
 import babel
 AVAILABLE_LOCALES = ["en-us"]
@@ -16,6 +19,44 @@ if os.path.exists("locales"):
 #     if locale not in AVAILABLE_LOCALES:
 #         AVAILABLE_LOCALES.append(locale)
 DEFAULT_LOCALE = "en-us"
+logger = logging.getLogger("Localization")
+_translations = {}
+
+
+def _load_translation(locale: str) -> gettext.NullTranslations:
+    # gettext.translation() caches parsed catalogs forever, so .mo files are read directly to make reloads work
+    mofile = gettext.find("messages", localedir="locales", languages=[locale])
+    if mofile is None:
+        return gettext.NullTranslations()
+    with open(mofile, "rb") as f:
+        return gettext.GNUTranslations(f)
+
+
+def load_translations():
+    """
+    Loads compiled catalogs for all locales in AVAILABLE_LOCALES. Gets called on import and on soft reload
+    """
+    global _translations
+    translations = {}
+    for locale in AVAILABLE_LOCALES:
+        translations[locale] = _load_translation(locale)
+    _translations = translations
+    logger.debug("Loaded translations for %s", list(translations.keys()))
+
+
+def get_translation(locale: str) -> gettext.NullTranslations:
+    """
+    Gets translation for locale from process-wide registry. Translation objects are safe to share across threads
+
+    :param locale: Locale string, like `ru` or `en-us`
+    :type locale: str
+    :return: Translation object
+    :rtype: :class:`gettext.NullTranslations`
+    """
+    translation = _translations.get(locale)
+    if translation is None:
+        translation = _translations[locale] = _load_translation(locale)
+    return translation
 
 
 def localizable(string: str) -> str:
@@ -44,9 +85,11 @@ def nlocalizable(singular: str, plural: str, n: int) -> str:
     return singular if n == 1 else plural
 
 
-def get_user_locale(user: telegram.User):
-    user_id = user.id
-    locale = Database[user_id].get("locale", False)
+def get_user_locale(user: telegram.User, preload: UpdatePreload = None):
+    if preload is None:
+        locale = Database[user.id].get("locale", False)
+    else:
+        locale = preload.user_locale
     if not locale:
         locale = user.language_code
         if locale not in AVAILABLE_LOCALES and locale is not None:
@@ -58,14 +101,16 @@ def get_user_locale(user: telegram.User):
     return locale
 
 
-def get_chat_locale(update: telegram.Update):
+def get_chat_locale(update: telegram.Update, preload: UpdatePreload = None):
     if update.effective_chat is None:
-        locale = get_user_locale(update.effective_user)
+        locale = get_user_locale(update.effective_user, preload)
     else:
-        chat_id = update.effective_chat.id
-        locale = Database[chat_id].get("locale", False)
+        if preload is None:
+            locale = Database[update.effective_chat.id].get("locale", False)
+        else:
+            locale = preload.chat_locale
         if not locale:
-            locale = get_user_locale(update.effective_user)
+            locale = get_user_locale(update.effective_user, preload)
     return locale
 
 
@@ -73,3 +118,6 @@ def set_chat_locale(chat_id: Union[int, str], locale: str):
     if locale not in AVAILABLE_LOCALES:
         raise ValueError(f"Unknown locale: {locale}. Valid locales are {AVAILABLE_LOCALES}")
     Database[chat_id].set("locale", locale)
+
+
+load_translations()
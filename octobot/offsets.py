@@ -0,0 +1,166 @@
+import logging
+import threading
+import time
+from typing import Dict, List, Optional
+
+logger = logging.getLogger("UpdateOffsets")
+
+OFFSET_KEY = "update_offset:{bot_id}"
+BACKLOG_KEY = "update_backlog:{bot_id}"
+# Telegram picks random next update ID after a week without updates, so older offset can't be trusted
+OFFSET_TTL = 6 * 24 * 60 * 60
+
+
+class UpdateOffsetTracker:
+    """
+    Tracks which updates were received and which were fully handled, and persists low watermark - ID of first update
+    that is not handled yet - to Redis. Updates are handled out of order by sharded dispatcher, so watermark only moves
+    past update when all updates before it are handled too.
+
+    Received updates are stored in Redis with :meth:`persist` until they are handled, so :meth:`fetch_offset` can
+    confirm them to Telegram and getUpdates keeps long polling while updates are being handled. After crash,
+    :meth:`load_backlog` gives back updates that were received but not handled, and :meth:`received` filters out
+    updates that Telegram sends again.
+
+    :param redis: Redis connection, offset is not persisted if None
+    :type redis: :class:`redis.Redis`, optional
+    :param bot_id: Bot user ID, used in Redis key
+    :type bot_id: :class:`int`
+    :param save_interval: Minimum interval between offset saves, seconds
+    :type save_interval: :class:`float`, optional
+    """
+
+    def __init__(self, redis, bot_id: int, save_interval: float = 1):
+        self.redis = redis
+        self.key = OFFSET_KEY.format(bot_id=bot_id)
+        self.backlog_key = BACKLOG_KEY.format(bot_id=bot_id)
+        self.save_interval = save_interval
+        self.in_flight = set()
+        self.max_received = None
+        self.saved_offset = None
+        self._last_save = 0
+        self._lock = threading.Lock()
+
+    def load(self) -> Optional[int]:
+        """
+        Loads persisted offset, updates before it are treated as handled
+
+        :return: ID of first update that was not handled, or None if there is no saved offset
+        :rtype: :class:`int`
+        """
+        if self.redis is None:
+            return None
+        offset = self.redis.get(self.key)
+        if offset is None:
+            return None
+        offset = int(offset)
+        with self._lock:
+            self.max_received = offset - 1
+            self.saved_offset = offset
+        logger.info("Resuming from update %s", offset)
+        return offset
+
+    def load_backlog(self) -> List[str]:
+        """
+        Loads updates that previous process received but did not handle and registers them as received.
+        Call after :meth:`load` and put them into queue before fetching new updates
+
+        :return: Update JSONs in update ID order
+        :rtype: :class:`list`
+        """
+        if self.redis is None:
+            return []
+        backlog = sorted((int(update_id), data.decode())
+                         for update_id, data in self.redis.hgetall(self.backlog_key).items())
+        with self._lock:
+            for update_id, _ in backlog:
+                self.in_flight.add(update_id)
+                if self.max_received is None or update_id > self.max_received:
+                    self.max_received = update_id
+        if backlog:
+            logger.info("Resuming %s updates that were not handled", len(backlog))
+        return [data for _, data in backlog]
+
+    def watermark(self) -> Optional[int]:
+        """
+        :return: ID of first update that is not handled yet, None if nothing was received
+        """
+        with self._lock:
+            return self._watermark()
+
+    def _watermark(self):
+        if self.in_flight:
+            return min(self.in_flight)
+        return self.max_received + 1 if self.max_received is not None else None
+
+    def fetch_offset(self) -> Optional[int]:
+        """
+        :return: Offset to pass to getUpdates. Right after :meth:`load` it is the saved watermark, later it is
+            ID of update after last received one: received updates are either handled or stored by :meth:`persist`
+        """
+        with self._lock:
+            if self.max_received is None:
+                return None
+            return self.max_received + 1
+
+    def received(self, update_id: int) -> bool:
+        """
+        Registers received update
+
+        :return: False if update was received before and should be skipped
+        :rtype: :class:`bool`
+        """
+        with self._lock:
+            if self.max_received is not None and update_id <= self.max_received:
+                return False
+            self.max_received = update_id
+            self.in_flight.add(update_id)
+            return True
+
+    def persist(self, updates: Dict[int, str]):
+        """
+        Stores received updates until they are handled. Call before next :meth:`fetch_offset`, it confirms them
+        to Telegram
+
+        :param updates: Dictionary of update ID to update JSON
+        :type updates: :class:`dict`
+        """
+        if self.redis is None or not updates:
+            return
+        try:
+            self.redis.pipeline().hset(self.backlog_key, mapping=updates).expire(self.backlog_key, OFFSET_TTL).execute()
+        except Exception:
+            logger.warning("Failed to store received updates", exc_info=True)
+
+    def done(self, update_id: int):
+        """
+        Marks update as handled, drops it from stored updates and saves offset if `save_interval` passed since
+        last save
+        """
+        if self.redis is not None:
+            try:
+                self.redis.hdel(self.backlog_key, update_id)
+            except Exception:
+                logger.warning("Failed to drop handled update %s", update_id, exc_info=True)
+        with self._lock:
+            self.in_flight.discard(update_id)
+            if time.monotonic() - self._last_save < self.save_interval:
+                return
+        self.save()
+
+    def save(self):
+        """
+        Saves current watermark to Redis
+        """
+        with self._lock:
+            offset = self._watermark()
+            if offset is None or offset == self.saved_offset or self.redis is None:
+                return
+            self._last_save = time.monotonic()
+            # Saving under lock keeps older offset from overwriting newer one
+            try:
+                self.redis.set(self.key, offset, ex=OFFSET_TTL)
+            except Exception:
+                logger.warning("Failed to save update offset", exc_info=True)
+            else:
+                self.saved_offset = offset
@@ -28,14 +28,79 @@ def create_db_entry_name(chat: typing.Union[telegram.Chat, int]):
     return f"admcache:{chat}"
 
 
+ADMIN_CACHE_TTL = 240
+ADMIN_CACHE_HASHMAP = "admcache"
+ADMIN_STATUSES = {telegram.ChatMember.ADMINISTRATOR, telegram.ChatMember.CREATOR}
+
+
 def reset_cache(chat: typing.Union[telegram.Chat, int]):
+    if isinstance(chat, telegram.Chat):
+        chat = chat.id
+    Database.invalidate_local_cache(ADMIN_CACHE_HASHMAP, chat)
     return Database.redis.delete(create_db_entry_name(chat))
 
 
+def handle_member_update(member_update: telegram.ChatMemberUpdated):
+    """
+    Resets admin cache of chat if update changes someone's admin status or rights
+
+    :param member_update: `chat_member` or `my_chat_member` update
+    :type member_update: :class:`telegram.ChatMemberUpdated`
+    """
+    if member_update.old_chat_member.status in ADMIN_STATUSES or \
+            member_update.new_chat_member.status in ADMIN_STATUSES:
+        logger.debug("Admin list of %s changed, resetting cache", member_update.chat.id)
+        reset_cache(member_update.chat)
+
+
+def _read_admin_list(db_entry: str) -> typing.Optional[list]:
+    db_res = Database.redis.get(db_entry)
+    if db_res is None:
+        return None
+    return json.loads(db_res.decode())
+
+
+def _fetch_admin_list(chat, chat_id: int, db_entry: str, bot=None) -> list:
+    if bot is None:
+        adm_list_t = chat.get_administrators()
+    else:
+        adm_list_t = bot.get_chat_administrators(chat_id=chat_id)
+    adm_list = [admin.to_dict() for admin in adm_list_t]
+    Database.redis.set(db_entry, json.dumps(adm_list), ex=ADMIN_CACHE_TTL)
+    return adm_list
+
+
+def get_admin_index(chat: typing.Union[telegram.Chat, int], bot=None) -> typing.Dict[int, dict]:
+    """
+    Gets chat administrators indexed by user ID. Index is kept in process memory, admin list in Redis,
+    concurrent misses for same chat share one `getChatAdministrators` call.
+
+    :param chat: Chat or chat ID. If ID is passed, `bot` is required to fetch admin list
+    :type chat: :class:`telegram.Chat` or :class:`int`
+    :param bot: Bot to fetch admin list with
+    :return: Dictionary of user ID to :class:`telegram.ChatMember` dict
+    :rtype: :class:`dict`
+    """
+    chat_id = chat.id if isinstance(chat, telegram.Chat) else chat
+    local_cache = Database.local_cache
+    if local_cache is not None:
+        index = local_cache.get(ADMIN_CACHE_HASHMAP, chat_id)
+        if index is not local_cache.MISSING:
+            return index
+        generation = local_cache.generation
+    db_entry = create_db_entry_name(chat_id)
+    adm_list = _read_admin_list(db_entry)
+    if adm_list is None:
+        adm_list = Database.singleflight.do(db_entry, _fetch_admin_list, chat, chat_id, db_entry, bot,
+                                            check=lambda: _read_admin_list(db_entry))
+    index = {int(member["user"]["id"]): member for member in adm_list}
+    if local_cache is not None:
+        local_cache.fill(ADMIN_CACHE_HASHMAP, chat_id, index, generation)
+    return index
+
+
 def check_perms(chat: typing.Union[telegram.Chat, int], user: typing.Union[telegram.User, int],
                 permissions_to_check: set, bot=None):
-    db_entry = create_db_entry_name(chat)
-
     if isinstance(user, telegram.User):
         user_id = user.id
     else:
@@ -49,32 +114,15 @@ def check_perms(chat: typing.Union[telegram.Chat, int], user: typing.Union[teleg
         return Settings.owner == user_id, permissions_to_check
     if not str(chat_id).startswith("-100"):
         return True, []
-    adm_list = None
-    if Database.redis is not None and Database.redis.exists(db_entry) == 1:
-        db_res = Database.redis.get(db_entry)
-        if db_res is not None: # fix some weird bug that i have 0 idea how it happens
-            adm_list = json.loads(db_res.decode())
-    if adm_list is None:
-        if bot is None:
-            adm_list_t = chat.get_administrators()
-        else:
-            adm_list_t = bot.get_chat_administrators(chat_id=chat_id)
-        adm_list = []
-        for admin in adm_list_t:
-            adm_list.append(admin.to_dict())
-        if Database.redis is not None:
-            Database.redis.set(db_entry, json.dumps(adm_list))
-            Database.redis.expire(db_entry, 240)
-    for member in adm_list:
-        if int(member["user"]["id"]) == int(user_id):
-            if member["status"] == "creator":
-                return True, []
-            if "is_admin" in permissions_to_check:
-                permissions_to_check.remove("is_admin")
-            for user_permission in permissions_to_check.copy():
-                if member[user_permission]:
-                    permissions_to_check.remove(user_permission)
-            break
+    member = get_admin_index(chat, bot).get(int(user_id))
+    if member is not None:
+        if member["status"] == "creator":
+            return True, []
+        if "is_admin" in permissions_to_check:
+            permissions_to_check.remove("is_admin")
+        for user_permission in permissions_to_check.copy():
+            if member[user_permission]:
+                permissions_to_check.remove(user_permission)
     return len(permissions_to_check) == 0, permissions_to_check
 
 
@@ -97,7 +145,7 @@ def permissions(*perms_args, **perms_kwargs):
                 res, missing_perms = check_perms(context.chat, context.user, perms.copy())
                 missing_perms_localized = [context.localize(permissions_locale[permission]) for permission in missing_perms]
                 if res:
-                    function(bot, context)
+                    return function(bot, context)
                 else:
                     context.reply(context.localize(
                         "Sorry, you can't execute this command cause you lack following permissions: {}").format(
@@ -118,7 +166,7 @@ def not_admin(function):
         if context.chat is not None:
             res, missing_perms = check_perms(context.chat, context.user, perms.copy())
             if not res:
-                function(bot, context)
+                return function(bot, context)
 
     return wrapper
 
@@ -139,7 +187,7 @@ def my_permissions(*perms_args, **perms_kwargs):
             if context.chat is not None:
                 res, missing_perms = check_perms(context.chat, bot.me, perms.copy())
                 if res:
-                    function(bot, context)
+                    return function(bot, context)
                 elif "is_admin" not in missing_perms:
                     context.reply(context.localize(
                         "Sorry, you can't execute this command cause I lack following permissions: {}").format(
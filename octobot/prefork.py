@@ -0,0 +1,182 @@
+import json
+import logging
+import multiprocessing
+import os
+import signal
+import threading
+import time
+from typing import Callable, Dict
+
+import telegram
+
+from octobot.dispatcher import shard_key
+
+logger = logging.getLogger("Prefork")
+
+
+class PreforkDispatcher:
+    """
+    Dispatcher that forks worker processes after plugins are loaded and routes updates to them by chat, so
+    CPU-bound handlers of different chats don't compete for one GIL. Every worker process handles its updates
+    with own local dispatcher created by `dispatcher_factory`. Updates are passed over pipes as JSON,
+    worker reports back when update is handled.
+
+    If worker process dies, stop event is set, updates that worker did not handle are never reported as handled.
+
+    :param bot: Bot with plugins loaded
+    :type bot: :class:`octobot.OctoBot`
+    :param workers: Amount of worker processes
+    :type workers: :class:`int`
+    :param dispatcher_factory: Function that creates and starts local dispatcher inside worker process,
+        called with `on_handled` function
+    :type dispatcher_factory: callable
+    :param after_fork: Function called inside worker process before it starts handling updates, should recreate
+        connections and threads that don't survive fork
+    :type after_fork: callable, optional
+    :param stop_event: Event that gets set when some handler raises :exc:`octobot.Halt` or worker dies
+    :type stop_event: :class:`threading.Event`, optional
+    :param on_handled: Function called with every update after it is handled by worker
+    :type on_handled: callable, optional
+    """
+
+    def __init__(self, bot, workers: int, dispatcher_factory: Callable, after_fork: Callable[[], None] = None,
+                 stop_event: threading.Event = None, on_handled: Callable[[telegram.Update], None] = None):
+        if workers < 1:
+            raise ValueError("Dispatcher needs at least one worker")
+        self.bot = bot
+        self.workers = workers
+        self.dispatcher_factory = dispatcher_factory
+        self.after_fork = after_fork
+        self.stop_event = stop_event if stop_event is not None else threading.Event()
+        self.on_handled = on_handled
+        self.processes = []
+        self.connections = []
+        self.locks = []
+        self.pending: Dict[int, telegram.Update] = {}
+        self._stopping = False
+
+    def start(self):
+        """
+        Forks worker processes. Should be called before starting threads that worker processes don't need
+        """
+        context = multiprocessing.get_context("fork")
+        for index in range(self.workers):
+            parent_connection, child_connection = context.Pipe()
+            process = context.Process(target=self._worker_main, args=(child_connection,),
+                                      name=f"UpdateWorker{index}")
+            process.start()
+            child_connection.close()
+            self.processes.append(process)
+            self.connections.append(parent_connection)
+            self.locks.append(threading.Lock())
+        # Reader threads are started after all forks, so workers don't inherit them
+        for index, connection in enumerate(self.connections):
+            threading.Thread(target=self._read_messages, args=(index, connection),
+                             name=f"UpdateWorkerReader{index}", daemon=True).start()
+        logger.info("Started %s update worker processes", self.workers)
+        return self
+
+    def put(self, item):
+        """
+        Sends update to worker process responsible for update chat
+
+        :param item: Tuple of bot and update
+        :type item: :class:`tuple`
+        """
+        update: telegram.Update = item[1]
+        index = shard_key(update) % self.workers
+        self.pending[update.update_id] = update
+        try:
+            with self.locks[index]:
+                self.connections[index].send_bytes(update.to_json().encode())
+        except OSError:
+            logger.critical("Failed to pass update to worker %s, stopping", index, exc_info=True)
+            self.stop_event.set()
+
+    def qsize(self):
+        """
+        :return: Amount of updates passed to workers and not handled yet
+        :rtype: :class:`int`
+        """
+        return len(self.pending)
+
+    def _read_messages(self, index: int, connection):
+        while True:
+            try:
+                message = connection.recv()
+            except (EOFError, OSError):
+                break
+            if message[0] == "handled":
+                update = self.pending.pop(message[1], None)
+                if update is not None and self.on_handled is not None:
+                    self.on_handled(update)
+            elif message[0] == "halt":
+                logger.info("Worker %s got Halt, setting stop event", index)
+                self.stop_event.set()
+        if not self._stopping:
+            logger.critical("Update worker %s exited unexpectedly, stopping", index)
+            self.stop_event.set()
+
+    def _worker_main(self, connection):
+        # Parent coordinates shutdown
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        signal.signal(signal.SIGTERM, signal.SIG_IGN)
+        for inherited in self.connections:
+            inherited.close()
+        if self.after_fork is not None:
+            self.after_fork()
+        send_lock = threading.Lock()
+
+        def send(message):
+            with send_lock:
+                try:
+                    connection.send(message)
+                except OSError:
+                    pass
+
+        dispatcher = self.dispatcher_factory(lambda update: send(("handled", update.update_id)))
+
+        def watch_halt():
+            dispatcher.stop_event.wait()
+            send(("halt",))
+
+        threading.Thread(target=watch_halt, name="HaltWatcher", daemon=True).start()
+        timeout = None
+        while True:
+            try:
+                data = json.loads(connection.recv_bytes())
+            except (EOFError, OSError):
+                break
+            if "stop" in data:
+                timeout = data["stop"]
+                break
+            update = telegram.Update.de_json(data, self.bot)
+            self.bot.insert_callback_data(update)
+            dispatcher.put((self.bot, update))
+        dispatcher.stop(timeout)
+        connection.close()
+        logger.info("Update worker %s exiting", os.getpid())
+
+    def stop(self, timeout: float = None):
+        """
+        Stops worker processes, they handle queued updates before exiting
+
+        :param timeout: Drain deadline in seconds for workers. Worker that did not exit in time is terminated
+        :type timeout: :class:`float`, optional
+        """
+        self._stopping = True
+        self.stop_event.set()
+        for index, connection in enumerate(self.connections):
+            try:
+                with self.locks[index]:
+                    connection.send_bytes(json.dumps({"stop": timeout}).encode())
+            except OSError:
+                pass
+        deadline = time.monotonic() + timeout + 5 if timeout is not None else None
+        for process in self.processes:
+            process.join(max(0.0, deadline - time.monotonic()) if deadline is not None else None)
+            if process.is_alive():
+                logger.warning("Worker %s did not exit in time, terminating it", process.name)
+                process.terminate()
+                process.join()
+        self.processes = []
@@ -0,0 +1,179 @@
+import logging
+import time
+from typing import Optional, Tuple
+
+from octobot.database import Database
+from settings import Settings
+
+logger = logging.getLogger("Ratelimit")
+
+USER_ABUSE = "user_abuse"
+ADMIN_ABUSE = "admin_abuse"
+#: Value of :attr:`octobot.Context.ratelimit_state` before command was checked, None means chat is not limited
+UNCHECKED = object()
+
+# KEYS: chat state, chat (or admin) GCRA key, user GCRA key, command GCRA key
+# ARGV: timeframe in seconds, chat threshold, ban time, leave on admin abuse (0/1), called by admin (0/1),
+#       user limit, command limit
+# Checks chat state, then counts command against chat, user and command limits with GCRA, limit 0 means no limit.
+# Chat over its limit is blocked, user and command TATs are only advanced if command is allowed.
+# Returns {state, 1 if state was just set else 0, 1 if command is allowed else 0}
+HIT_SCRIPT = """
+local state = redis.call('GET', KEYS[1])
+local admin = ARGV[5] == '1'
+if state == 'admin_abuse' or (state == 'user_abuse' and not admin) then
+    return {state, 0, 0}
+end
+local time = redis.call('TIME')
+local now = tonumber(time[1]) * 1000 + math.floor(tonumber(time[2]) / 1000)
+local period = tonumber(ARGV[1]) * 1000
+local function allowed(key, limit)
+    if limit <= 0 then
+        return true
+    end
+    local interval = period / limit
+    local tat = math.max(tonumber(redis.call('GET', key) or now), now)
+    return tat - now <= period - interval, tat + interval
+end
+local function advance(key, tat)
+    if tat then
+        redis.call('SET', key, math.floor(tat), 'PX', math.max(1, math.ceil(tat - now)))
+    end
+end
+local changed = 0
+local chat_ok, chat_tat = allowed(KEYS[2], tonumber(ARGV[2]))
+if chat_ok then
+    advance(KEYS[2], chat_tat)
+elseif admin and ARGV[4] == '1' then
+    redis.call('SET', KEYS[1], 'admin_abuse')
+    return {'admin_abuse', 1, 0}
+elseif not state then
+    state = 'user_abuse'
+    changed = 1
+    redis.call('SET', KEYS[1], state, 'EX', ARGV[3])
+    if not admin then
+        return {state, changed, 0}
+    end
+end
+local user_ok, user_tat = allowed(KEYS[3], tonumber(ARGV[6]))
+local command_ok, command_tat = allowed(KEYS[4], tonumber(ARGV[7]))
+if not (user_ok and command_ok) then
+    return {state or '', changed, 0}
+end
+advance(KEYS[3], user_tat)
+advance(KEYS[4], command_tat)
+return {state or '', changed, 1}
+"""
+
+
+class RateLimiter:
+    """
+    Command ratelimit engine. Every command is checked with single Redis script call, so limits are atomic and
+    shared between bot processes. All limits use GCRA, allowing `limit` commands per `messages_timeframe` seconds
+    with bursts of the same size. Limits are configured in `ratelimit` settings section:
+
+    - chat limit: chat that called more than `messages_threshold` commands per `messages_timeframe` is blocked for
+      `ban_time` seconds (admins excluded), or permanently if the commands were called by admins and
+      `adm_abuse_leave` is set
+    - user limit: user can call `user_limit` commands per `messages_timeframe` across all chats
+    - command limit: single command can be called `command_limit` times per `messages_timeframe` in a chat
+
+    Without scripting support (fakeredis without lupa) falls back to non-atomic implementation.
+
+    :param redis: Redis connection
+    :type redis: :class:`redis.Redis`
+    """
+
+    def __init__(self, redis):
+        self.redis = redis
+        self.scripting = True
+        self._hit_script = redis.register_script(HIT_SCRIPT)
+
+    def hit(self, chat_id: int, user_id: int, command: str, admin: bool = False) -> Tuple[Optional[str], bool, bool]:
+        """
+        Counts command call, blocking chat if it is over chat limit
+
+        :param chat_id: Chat ID
+        :type chat_id: :class:`int`
+        :param user_id: ID of user that called the command
+        :type user_id: :class:`int`
+        :param command: Called command
+        :type command: :class:`str`
+        :param admin: If command was called by chat admin, admins are not affected by temporary block and
+            their calls are counted separately if `adm_abuse_leave` is set
+        :type admin: :class:`bool`
+        :return: Tuple of chat state (:data:`USER_ABUSE`, :data:`ADMIN_ABUSE` or None), if chat was blocked just now
+            and if command is allowed
+        :rtype: :class:`tuple`
+        """
+        config = Settings.ratelimit
+        chat_key = f"ratelimit_adm:{chat_id}" if admin and config.adm_abuse_leave else f"ratelimit:{chat_id}"
+        keys = [f"ratelimit_state:{chat_id}", chat_key, f"ratelimit_user:{user_id}",
+                f"ratelimit_cmd:{chat_id}:{command}"]
+        args = [config.messages_timeframe, config.messages_threshold, config.ban_time, int(config.adm_abuse_leave),
+                int(admin), config.user_limit, config.command_limit]
+        result = None
+        if self.scripting:
+            try:
+                result = self._hit_script(keys=keys, args=args)
+            except ImportError:
+                logger.warning("Redis scripting is not available, ratelimits are not atomic")
+                self.scripting = False
+        if result is None:
+            result = self._hit_fallback(keys, args)
+        state, changed, allowed = result
+        if isinstance(state, bytes):
+            state = state.decode()
+        return state or None, bool(changed), bool(allowed)
+
+    def unban(self, chat_id) -> int:
+        """
+        Removes chat block
+
+        :return: Amount of deleted keys
+        """
+        return self.redis.delete(f"ratelimit_state:{chat_id}")
+
+    def _hit_fallback(self, keys, args):
+        state_key, chat_key, user_key, command_key = keys
+        timeframe, threshold, ban_time, adm_abuse_leave, admin, user_limit, command_limit = args
+        state = self.redis.get(state_key)
+        state = state.decode() if state is not None else None
+        if state == ADMIN_ABUSE or (state == USER_ABUSE and not admin):
+            return [state, 0, 0]
+        now = time.time() * 1000
+        period = timeframe * 1000
+
+        def allowed(key, limit):
+            if limit <= 0:
+                return True, None
+            interval = period / limit
+            tat = max(float(self.redis.get(key) or now), now)
+            return tat - now <= period - interval, tat + interval
+
+        def advance(key, tat):
+            if tat is not None:
+                self.redis.set(key, int(tat), px=max(1, int(tat - now)))
+
+        changed = 0
+        chat_ok, chat_tat = allowed(chat_key, threshold)
+        if chat_ok:
+            advance(chat_key, chat_tat)
+        elif admin and adm_abuse_leave:
+            self.redis.set(state_key, ADMIN_ABUSE)
+            return [ADMIN_ABUSE, 1, 0]
+        elif state is None:
+            state, changed = USER_ABUSE, 1
+            self.redis.set(state_key, USER_ABUSE, ex=ban_time)
+            if not admin:
+                return [state, changed, 0]
+        user_ok, user_tat = allowed(user_key, user_limit)
+        command_ok, command_tat = allowed(command_key, command_limit)
+        if not (user_ok and command_ok):
+            return [state or "", changed, 0]
+        advance(user_key, user_tat)
+        advance(command_key, command_tat)
+        return [state or "", changed, 1]
+
+
+limiter = RateLimiter(Database.redis)
@@ -0,0 +1,302 @@
+import enum
+import heapq
+import itertools
+import logging
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import cachetools
+import telegram.error
+
+logger = logging.getLogger("SendQueue")
+
+
+class Priority(enum.IntEnum):
+    """
+    Send queue lanes. Lower value goes first.
+    """
+    #: Answers to callback and inline queries, user is waiting for them with spinner
+    urgent = 0
+    #: Replies to commands
+    normal = 1
+    #: Broadcasts, notifications and other messages nobody is actively waiting for
+    bulk = 2
+
+
+class TokenBucket:
+    """
+    Token bucket rate limiter. Not thread-safe, :class:`SendQueue` uses it under its own lock.
+
+    :param rate: Tokens added per second
+    :type rate: :class:`float`
+    :param capacity: Maximum amount of tokens, i.e. burst size
+    :type capacity: :class:`float`
+    """
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.blocked_until = 0
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, now: float) -> float:
+        """
+        :return: Seconds until token will be available, 0 if it is available right now
+        """
+        if now < self.blocked_until:
+            return self.blocked_until - now
+        self._refill(now)
+        if self.tokens >= 1:
+            return 0
+        return (1 - self.tokens) / self.rate
+
+    def take(self, now: float):
+        self._refill(now)
+        self.tokens -= 1
+
+    def block(self, until: float):
+        """
+        Gives out no tokens until `until`, used when Telegram asks to retry later
+        """
+        self.blocked_until = max(self.blocked_until, until)
+        self.tokens = 0
+        self.updated = until
+
+
+class _Job:
+    __slots__ = ("priority", "seq", "chat_id", "function", "args", "kwargs", "future", "retries")
+
+    def __init__(self, priority, seq, chat_id, function, args, kwargs):
+        self.priority = priority
+        self.seq = seq
+        self.chat_id = chat_id
+        self.function = function
+        self.args = args
+        self.kwargs = kwargs
+        self.future = Future()
+        self.retries = 0
+
+    def __lt__(self, other):
+        return (self.priority, self.seq) < (other.priority, other.seq)
+
+
+class SendQueue:
+    """
+    Outbound Bot API call scheduler. Keeps calls under per-chat and global Telegram flood limits instead of
+    letting them hit 429 errors, and honours :exc:`telegram.error.RetryAfter` per chat without blocking handlers.
+
+    Calls for the same chat are executed one at a time in submit order (within priority lane),
+    calls for different chats are executed in parallel by `workers` threads.
+
+    :param global_rate: Maximum calls per second for the whole bot
+    :type global_rate: :class:`float`
+    :param private_rate: Maximum calls per second for a single private chat
+    :type private_rate: :class:`float`
+    :param group_rate: Maximum calls per second for a single group chat
+    :type group_rate: :class:`float`
+    :param burst: Amount of calls that can be made to single chat without waiting
+    :type burst: :class:`int`
+    :param workers: Amount of threads making the calls
+    :type workers: :class:`int`
+    :param max_retries: How many times call is retried after RetryAfter before giving up
+    :type max_retries: :class:`int`, optional
+    """
+
+    def __init__(self, global_rate: float, private_rate: float, group_rate: float, burst: int, workers: int,
+                 max_retries: int = 3):
+        self.private_rate = private_rate
+        self.group_rate = group_rate
+        self.burst = burst
+        self.max_retries = max_retries
+        self.global_bucket = TokenBucket(global_rate, global_rate)
+        # Idle chat buckets are full anyway, so forgetting them after a while changes nothing
+        self.chat_buckets = cachetools.TTLCache(maxsize=100000, ttl=600)
+        self.executor = ThreadPoolExecutor(workers, thread_name_prefix="SendQueue")
+        # Pending jobs of every chat, ordered by lane and submit order
+        self._chats = {}
+        self._busy_chats = set()
+        # Heads of chats that can be sent now (and chat-less jobs): (priority, seq, chat_id, chat-less job)
+        self._ready = []
+        # Heads of chats waiting for chat bucket: (ready time, seq, chat_id)
+        self._waiting = []
+        self._size = 0
+        # Jobs handed to executor and not finished yet
+        self._in_flight = 0
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._running = False
+        self._thread = None
+
+    def start(self):
+        """
+        Starts scheduler thread
+        """
+        self._running = True
+        self._thread = threading.Thread(target=self._scheduler, name="SendQueueScheduler", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """
+        Sends out pending calls, waits for calls in progress and stops scheduler. Calls that get RetryAfter
+        after stop fail with it instead of being retried
+        """
+        with self._cond:
+            self._running = False
+            self._cond.notify()
+        if self._thread is not None:
+            self._thread.join()
+        self.executor.shutdown()
+
+    def submit(self, chat_id, priority: Priority, function, /, *args, **kwargs) -> Future:
+        """
+        Schedules Bot API call
+
+        :param chat_id: Chat the call sends to, used for per-chat limits. None for calls that are not bound to chat,
+            like inline query answers
+        :type chat_id: :class:`int`
+        :param priority: Lane of the call
+        :type priority: :class:`Priority`
+        :param function: Bot method to call
+        :param args: Arguments for the function
+        :param kwargs: Keyword arguments for the function
+        :return: Future with result of the call
+        :rtype: :class:`concurrent.futures.Future`
+        """
+        job = _Job(priority, next(self._seq), chat_id, function, args, kwargs)
+        with self._cond:
+            self._add(job, time.monotonic())
+            self._cond.notify()
+        return job.future
+
+    def qsize(self):
+        """
+        :return: Amount of calls waiting to be sent
+        :rtype: :class:`int`
+        """
+        return self._size
+
+    def _add(self, job: _Job, now: float):
+        self._size += 1
+        if job.chat_id is None:
+            heapq.heappush(self._ready, (job.priority, job.seq, None, job))
+            return
+        chat_jobs = self._chats.setdefault(job.chat_id, [])
+        heapq.heappush(chat_jobs, job)
+        if chat_jobs[0] is job and job.chat_id not in self._busy_chats:
+            self._schedule(job.chat_id, now)
+
+    def _chat_bucket(self, chat_id) -> TokenBucket:
+        bucket = self.chat_buckets.get(chat_id)
+        if bucket is None:
+            rate = self.group_rate if chat_id < 0 else self.private_rate
+            bucket = TokenBucket(rate, self.burst)
+        # Re-set to prolong bucket life
+        self.chat_buckets[chat_id] = bucket
+        return bucket
+
+    def _schedule(self, chat_id, now: float):
+        """
+        Puts head job of chat into ready or waiting heap. Entries of jobs that stopped being head are left in heaps
+        and skipped when they come up
+        """
+        head = self._chats[chat_id][0]
+        wait = self._chat_bucket(chat_id).wait_time(now)
+        if wait == 0:
+            heapq.heappush(self._ready, (head.priority, head.seq, chat_id, None))
+        else:
+            heapq.heappush(self._waiting, (now + wait, head.seq, chat_id))
+
+    def _is_head(self, chat_id, seq) -> bool:
+        chat_jobs = self._chats.get(chat_id)
+        return chat_jobs is not None and chat_jobs[0].seq == seq and chat_id not in self._busy_chats
+
+    def _pick(self, now):
+        """
+        Finds first job that can be sent right now
+
+        :return: Tuple of job (or None) and time to wait before something can be sent (or None if nothing is pending)
+        """
+        while self._waiting and self._waiting[0][0] <= now:
+            _, seq, chat_id = heapq.heappop(self._waiting)
+            if self._is_head(chat_id, seq):
+                self._schedule(chat_id, now)
+        global_wait = self.global_bucket.wait_time(now)
+        while self._ready and global_wait == 0:
+            _, seq, chat_id, job = heapq.heappop(self._ready)
+            if job is not None:
+                return job, 0
+            if not self._is_head(chat_id, seq):
+                continue
+            chat_jobs = self._chats[chat_id]
+            job = heapq.heappop(chat_jobs)
+            if not chat_jobs:
+                del self._chats[chat_id]
+            return job, 0
+        waits = []
+        if self._ready:
+            waits.append(global_wait)
+        if self._waiting:
+            waits.append(self._waiting[0][0] - now)
+        return None, min(waits) if waits else None
+
+    def _scheduler(self):
+        with self._cond:
+            while self._running or self._size or self._in_flight:
+                now = time.monotonic()
+                job, wait = self._pick(now)
+                if job is None:
+                    # Also wakes up when submitted job or finished call changes the picture
+                    self._cond.wait(wait)
+                    continue
+                self._size -= 1
+                self.global_bucket.take(now)
+                if job.chat_id is not None:
+                    self._chat_bucket(job.chat_id).take(now)
+                    self._busy_chats.add(job.chat_id)
+                self._in_flight += 1
+                self.executor.submit(self._execute, job)
+
+    def _execute(self, job: _Job):
+        # Retried jobs are already running
+        if job.retries == 0 and not job.future.set_running_or_notify_cancel():
+            self._finish(job)
+            return
+        try:
+            res = job.function(*job.args, **job.kwargs)
+        except telegram.error.RetryAfter as e:
+            # Scheduler keeps running until this job is finished, so job retried after stop is still sent
+            if job.retries < self.max_retries and self._running:
+                job.retries += 1
+                logger.warning("Got RetryAfter %s for chat %s, rescheduling", e.retry_after, job.chat_id)
+                self._finish(job, retry_after=e.retry_after)
+                return
+            job.future.set_exception(e)
+        except BaseException as e:
+            job.future.set_exception(e)
+        else:
+            job.future.set_result(res)
+        self._finish(job)
+
+    def _finish(self, job: _Job, retry_after: float = None):
+        with self._cond:
+            self._in_flight -= 1
+            now = time.monotonic()
+            if retry_after is not None:
+                if job.chat_id is not None:
+                    self._chat_bucket(job.chat_id).block(now + retry_after)
+                else:
+                    self.global_bucket.block(now + retry_after)
+            if job.chat_id is not None:
+                self._busy_chats.discard(job.chat_id)
+            if retry_after is not None:
+                self._add(job, now)
+            elif job.chat_id in self._chats:
+                self._schedule(job.chat_id, now)
+            self._cond.notify()
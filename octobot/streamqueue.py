@@ -0,0 +1,310 @@
+import json
+import logging
+import math
+import random
+import threading
+import time
+from typing import Callable, Dict, Set, Tuple
+
+import redis.exceptions
+import telegram
+
+from octobot.database import COMPARE_AND_DELETE_SCRIPT, compare_and_delete
+from octobot.dispatcher import shard_key
+
+logger = logging.getLogger("StreamQueue")
+
+GROUP_NAME = "workers"
+
+
+class StreamPublisher:
+    """
+    Puts updates into Redis Streams instead of handling them. Updates are partitioned by chat into
+    `partitions` streams, :class:`StreamConsumer` processes consume them. Has the same interface as
+    :class:`octobot.dispatcher.Dispatcher`, so update loop and webhook server can feed it.
+
+    :param redis: Redis connection
+    :type redis: :class:`redis.Redis`
+    :param partitions: Amount of partition streams
+    :type partitions: :class:`int`
+    :param prefix: Stream key prefix, partition streams are `prefix:N`
+    :type prefix: :class:`str`
+    :param max_length: Approximate maximum length of single partition stream
+    :type max_length: :class:`int`
+    :param stop_event: Event that stops update loop
+    :type stop_event: :class:`threading.Event`, optional
+    :param on_handled: Function called with every update after it is published
+    :type on_handled: callable, optional
+    """
+
+    def __init__(self, redis, partitions: int, prefix: str, max_length: int, stop_event: threading.Event = None,
+                 on_handled: Callable[[telegram.Update], None] = None):
+        self.redis = redis
+        self.partitions = partitions
+        self.prefix = prefix
+        self.max_length = max_length
+        self.stop_event = stop_event if stop_event is not None else threading.Event()
+        self.on_handled = on_handled
+
+    def put(self, item):
+        """
+        Publishes update to partition stream of update chat
+
+        :param item: Tuple of bot and update
+        :type item: :class:`tuple`
+        """
+        update: telegram.Update = item[1]
+        stream = f"{self.prefix}:{shard_key(update) % self.partitions}"
+        self.redis.xadd(stream, {"update": update.to_json()}, maxlen=self.max_length, approximate=True)
+        if self.on_handled is not None:
+            self.on_handled(update)
+
+    def qsize(self):
+        """
+        :return: Total amount of entries in partition streams, including already consumed ones that were not trimmed
+        :rtype: :class:`int`
+        """
+        return sum(self.redis.xlen(f"{self.prefix}:{partition}") for partition in range(self.partitions))
+
+    def stop(self, timeout: float = None):
+        self.stop_event.set()
+
+
+class StreamConsumer:
+    """
+    Consumes updates published by :class:`StreamPublisher` and puts them into local dispatcher.
+
+    To keep per-chat ordering, every partition is read by one consumer at a time: consumers take leases on
+    partitions, each consumer holds about `partitions / alive consumers` of them. Entries are acknowledged
+    when dispatcher finishes handling the update (pass :meth:`ack` as dispatcher `on_handled`). Owner of partition
+    claims entries that were not acknowledged for `lease_ttl` seconds, so entries that previous owner is still
+    handling after losing its lease are not handled twice. New entries of taken over partition are not read until
+    entries of previous owners are acknowledged or claimed. Entries that were delivered `max_deliveries` times
+    are dropped.
+
+    :param redis: Redis connection
+    :type redis: :class:`redis.Redis`
+    :param bot: Bot to pass updates to
+    :type bot: :class:`octobot.OctoBot`
+    :param name: Unique consumer name, like `hostname:pid`
+    :type name: :class:`str`
+    :param partitions: Amount of partition streams, has to be the same as publisher's
+    :type partitions: :class:`int`
+    :param prefix: Stream key prefix, has to be the same as publisher's
+    :type prefix: :class:`str`
+    :param lease_ttl: Partition lease TTL in seconds, partitions of dead consumer are taken over after it
+    :type lease_ttl: :class:`int`
+    :param prefetch: Maximum amount of updates waiting in local dispatcher
+    :type prefetch: :class:`int`
+    :param max_deliveries: Amount of deliveries after which entry is dropped
+    :type max_deliveries: :class:`int`
+    """
+
+    def __init__(self, redis, bot, name: str, partitions: int, prefix: str, lease_ttl: int = 15, prefetch: int = 100,
+                 max_deliveries: int = 5):
+        self.redis = redis
+        self.bot = bot
+        self.name = name
+        self.partitions = partitions
+        self.prefix = prefix
+        self.lease_ttl = lease_ttl
+        self.prefetch = prefetch
+        self.max_deliveries = max_deliveries
+        self.consumers_key = f"{prefix}:consumers"
+        self.owned: Set[int] = set()
+        self.releasing: Set[int] = set()
+        # Owned partitions that still have entries pending for other consumers
+        self.draining: Set[int] = set()
+        self.in_flight: Dict[int, int] = {}
+        self.entries: Dict[int, Tuple[int, bytes]] = {}
+        self.queue = None
+        self.stop_event = None
+        self.thread = None
+        self._lock = threading.Lock()
+        self._last_maintenance = 0
+        self._release_script = redis.register_script(COMPARE_AND_DELETE_SCRIPT)
+
+    def _stream(self, partition: int) -> str:
+        return f"{self.prefix}:{partition}"
+
+    def _lease(self, partition: int) -> str:
+        return f"{self.prefix}:{partition}:owner"
+
+    def start(self, queue, stop_event: threading.Event):
+        """
+        Starts consumer thread
+
+        :param queue: Dispatcher to put updates into
+        :param stop_event: Event that stops consumer
+        """
+        self.queue = queue
+        self.stop_event = stop_event
+        for partition in range(self.partitions):
+            try:
+                self.redis.xgroup_create(self._stream(partition), GROUP_NAME, id="0", mkstream=True)
+            except redis.exceptions.ResponseError as e:
+                if "BUSYGROUP" not in str(e):
+                    raise
+        self.thread = threading.Thread(target=self._run, name="StreamConsumer")
+        self.thread.start()
+        return self
+
+    def stop(self):
+        """
+        Waits for consumer thread to exit and releases partition leases. Call after dispatcher is stopped,
+        so entries that were not acknowledged are claimed by next owner.
+        """
+        if self.thread is not None:
+            self.thread.join()
+        for partition in self.owned:
+            self._release(partition)
+        self.owned.clear()
+        self.redis.zrem(self.consumers_key, self.name)
+
+    def ack(self, update: telegram.Update):
+        """
+        Acknowledges entry of handled update
+        """
+        with self._lock:
+            entry = self.entries.pop(update.update_id, None)
+            if entry is None:
+                return
+            partition, entry_id = entry
+            self.in_flight[partition] -= 1
+        self.redis.xack(self._stream(partition), GROUP_NAME, entry_id)
+
+    def _run(self):
+        while not self.stop_event.is_set():
+            try:
+                if time.monotonic() - self._last_maintenance > self.lease_ttl / 3:
+                    self._maintain_leases()
+                readable = self.owned - self.releasing - self.draining
+                if not readable or self.queue.qsize() >= self.prefetch:
+                    self.stop_event.wait(0.1 if readable else 1)
+                    continue
+                response = self.redis.xreadgroup(GROUP_NAME, self.name,
+                                                 {self._stream(partition): ">" for partition in readable},
+                                                 count=self.prefetch, block=1000)
+                for stream, entries in response or []:
+                    partition = int(stream.decode().rsplit(":", 1)[1])
+                    for entry_id, fields in entries:
+                        self._dispatch(partition, entry_id, fields)
+            except redis.exceptions.ConnectionError:
+                logger.warning("Lost connection to Redis, retrying", exc_info=True)
+                self.stop_event.wait(1)
+            except Exception:
+                logger.error("Stream consumer failed", exc_info=True)
+                self.stop_event.wait(1)
+
+    def _dispatch(self, partition: int, entry_id: bytes, fields: dict):
+        if self.stop_event.is_set():
+            # Left unacknowledged for next owner of partition
+            return
+        try:
+            update = telegram.Update.de_json(json.loads(fields[b"update"]), self.bot)
+        except (KeyError, ValueError, TypeError):
+            logger.error("Dropping malformed entry %s from partition %s", entry_id, partition, exc_info=True)
+            self.redis.xack(self._stream(partition), GROUP_NAME, entry_id)
+            return
+        with self._lock:
+            duplicate = update.update_id in self.entries
+            if not duplicate:
+                self.entries[update.update_id] = (partition, entry_id)
+                self.in_flight[partition] = self.in_flight.get(partition, 0) + 1
+        if duplicate:
+            # Fetcher published update again after restart, first copy is already being handled
+            self.redis.xack(self._stream(partition), GROUP_NAME, entry_id)
+            return
+        self.bot.insert_callback_data(update)
+        self.queue.put((self.bot, update))
+
+    def _maintain_leases(self):
+        self._last_maintenance = now = time.monotonic()
+        wall_time = time.time()
+        self.redis.zadd(self.consumers_key, {self.name: wall_time})
+        self.redis.zremrangebyscore(self.consumers_key, "-inf", wall_time - self.lease_ttl)
+        alive = max(1, self.redis.zcard(self.consumers_key))
+        share = math.ceil(self.partitions / alive)
+        # Renew owned leases
+        for partition in list(self.owned):
+            if self.redis.get(self._lease(partition)) == self.name.encode():
+                self.redis.expire(self._lease(partition), self.lease_ttl)
+            else:
+                logger.warning("Lost lease on partition %s", partition)
+                self.owned.discard(partition)
+                self.releasing.discard(partition)
+                self.draining.discard(partition)
+        # Hand over partitions above fair share once their updates are handled
+        active = self.owned - self.releasing
+        for partition in list(active)[share:]:
+            self.releasing.add(partition)
+        for partition in list(self.releasing):
+            with self._lock:
+                in_flight = self.in_flight.get(partition, 0)
+            if in_flight == 0:
+                self._release(partition)
+                self.owned.discard(partition)
+                self.releasing.discard(partition)
+                self.draining.discard(partition)
+        # Take free partitions up to fair share
+        free = [partition for partition in range(self.partitions) if partition not in self.owned]
+        random.shuffle(free)
+        for partition in free:
+            if len(self.owned) >= share:
+                break
+            if self.redis.set(self._lease(partition), self.name, nx=True, ex=self.lease_ttl):
+                self.owned.add(partition)
+                self.draining.add(partition)
+        # Entries of consumer that lost or released partition become claimable after lease_ttl of inactivity
+        for partition in self.owned - self.releasing:
+            self._take_over(partition)
+        for partition in list(self.draining):
+            if self._drained(partition):
+                self.draining.discard(partition)
+        logger.debug("Owning partitions %s (%s consumers alive), took %.3fs", sorted(self.owned), alive,
+                     time.monotonic() - now)
+
+    def _drained(self, partition: int) -> bool:
+        """
+        :return: If all pending entries of partition belong to this consumer, so its new entries can be read
+            without overtaking older ones
+        """
+        pending = self.redis.xpending(self._stream(partition), GROUP_NAME)
+        return all(consumer["name"] in (self.name, self.name.encode()) for consumer in pending["consumers"])
+
+    def _release(self, partition: int):
+        compare_and_delete(self._release_script, self._lease(partition), self.name)
+
+    def _take_over(self, partition: int):
+        """
+        Claims entries of partition that were delivered but not acknowledged for `lease_ttl` seconds, including own
+        ones from before restart, and dispatches them in stream order
+        """
+        stream = self._stream(partition)
+        start = "0-0"
+        claimed = []
+        while True:
+            response = self.redis.xautoclaim(stream, GROUP_NAME, self.name, self.lease_ttl * 1000, start_id=start,
+                                             count=100)
+            start, entries = response[0], response[1]
+            claimed += entries
+            if start in (b"0-0", "0-0"):
+                break
+        if not claimed:
+            return
+        deliveries = {entry["message_id"]: entry["times_delivered"]
+                      for entry in self.redis.xpending_range(stream, GROUP_NAME, "-", "+", len(claimed) + 100,
+                                                             consumername=self.name)}
+        with self._lock:
+            # Own entries that are handled for longer than lease_ttl are claimed too
+            handling = {entry_id for _, entry_id in self.entries.values()}
+        logger.info("Took over %s pending updates of partition %s", len(claimed), partition)
+        for entry_id, fields in claimed:
+            if fields is None or entry_id in handling:
+                continue
+            if deliveries.get(entry_id, 0) > self.max_deliveries:
+                logger.error("Dropping entry %s of partition %s, it was delivered %s times", entry_id, partition,
+                             deliveries[entry_id])
+                self.redis.xack(stream, GROUP_NAME, entry_id)
+                continue
+            self._dispatch(partition, entry_id, fields)
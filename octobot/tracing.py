@@ -0,0 +1,314 @@
+import bisect
+import contextvars
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger("Tracing")
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+
+def _format_labels(labelnames, labels) -> str:
+    if not labelnames:
+        return ""
+    pairs = []
+    for name, value in zip(labelnames, labels):
+        value = str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        pairs.append(f'{name}="{value}"')
+    return "{" + ",".join(pairs) + "}"
+
+
+class Counter:
+    """
+    Prometheus-style counter
+
+    :param name: Metric name
+    :type name: :class:`str`
+    :param documentation: Metric description
+    :type documentation: :class:`str`
+    :param labelnames: Label names, values are passed to :meth:`inc` in same order
+    :type labelnames: :class:`tuple`, optional
+    """
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self._values: Dict[tuple, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels, amount: float = 1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for labels, value in self._values.items():
+                lines.append(f"{self.name}{_format_labels(self.labelnames, labels)} {value}")
+        return lines
+
+
+class Histogram:
+    """
+    Prometheus-style histogram
+
+    :param name: Metric name
+    :type name: :class:`str`
+    :param documentation: Metric description
+    :type documentation: :class:`str`
+    :param labelnames: Label names, values are passed to :meth:`observe` in same order
+    :type labelnames: :class:`tuple`, optional
+    :param buckets: Upper bounds of buckets
+    :type buckets: :class:`tuple`, optional
+    """
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = (), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.buckets = tuple(buckets)
+        # labels -> [bucket counts..., sum, count]
+        self._values: Dict[tuple, list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *labels):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._values.get(labels)
+            if series is None:
+                series = self._values[labels] = [0] * (len(self.buckets) + 2)
+            if index < len(self.buckets):
+                series[index] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for labels, series in self._values.items():
+                cumulative = 0
+                for bound, amount in zip(self.buckets, series):
+                    cumulative += amount
+                    lines.append(f"{self.name}_bucket"
+                                 f"{_format_labels(self.labelnames + ('le',), labels + (bound,))} {cumulative}")
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames + ('le',), labels + ('+Inf',))} "
+                             f"{series[-1]}")
+                label_str = _format_labels(self.labelnames, labels)
+                lines.append(f"{self.name}_sum{label_str} {series[-2]}")
+                lines.append(f"{self.name}_count{label_str} {series[-1]}")
+        return lines
+
+
+class MetricsRegistry:
+    """
+    Set of metrics rendered together in Prometheus text exposition format. Besides metric objects,
+    registry takes gauge collectors - functions returning list of (labels dict, value) that are called on render.
+    """
+
+    def __init__(self):
+        self.metrics = []
+        self.gauges: List[Tuple[str, str, Callable]] = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def register_gauge(self, name: str, documentation: str, collector: Callable[[], List[Tuple[dict, float]]]):
+        """
+        :param name: Metric name
+        :param documentation: Metric description
+        :param collector: Function that returns list of tuples of labels dictionary and value
+        """
+        self.gauges.append((name, documentation, collector))
+
+    def render(self) -> str:
+        lines = []
+        for metric in self.metrics:
+            lines += metric.render()
+        for name, documentation, collector in self.gauges:
+            lines += [f"# HELP {name} {documentation}", f"# TYPE {name} gauge"]
+            try:
+                samples = collector()
+            except Exception:
+                logger.warning("Gauge collector for %s failed", name, exc_info=True)
+                continue
+            for labels, value in samples:
+                lines.append(f"{name}{_format_labels(tuple(labels.keys()), tuple(labels.values()))} {value}")
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+update_duration = registry.register(Histogram("octobot_update_duration_seconds",
+                                              "Time from update being queued to it being handled", ("update_type",)))
+update_queue_wait = registry.register(Histogram("octobot_update_queue_wait_seconds",
+                                                "Time update spent waiting in dispatcher queue"))
+context_duration = registry.register(Histogram("octobot_context_duration_seconds",
+                                               "Time spent creating update context", ("update_type",)))
+handler_duration = registry.register(Histogram("octobot_handler_duration_seconds",
+                                               "Time spent in handler", ("plugin", "command")))
+handler_errors = registry.register(Counter("octobot_handler_errors_total",
+                                           "Exceptions raised by handlers", ("plugin", "command")))
+bot_api_duration = registry.register(Histogram("octobot_bot_api_duration_seconds",
+                                               "Time spent in Bot API calls", ("method",)))
+http_duration = registry.register(Histogram("octobot_http_duration_seconds",
+                                            "Time spent in outgoing HTTP requests", ("host",)))
+slow_updates = registry.register(Counter("octobot_slow_updates_total", "Updates slower than slow update threshold"))
+skipped_updates = registry.register(Counter("octobot_skipped_updates_total",
+                                            "Updates dropped before context creation because no handler reacts to them"))
+
+
+class UpdateTrace:
+    """
+    Timings of single update. Current trace is kept in context variable, so it follows the update
+    into executor threads and coroutines.
+
+    :param update_id: Update ID
+    :type update_id: :class:`int`
+    :param queued_at: :func:`time.monotonic` time when update was put into dispatcher queue
+    :type queued_at: :class:`float`, optional
+    """
+
+    def __init__(self, update_id: int, queued_at: float = None):
+        self.update_id = update_id
+        self.started = time.monotonic()
+        self.queue_wait = self.started - queued_at if queued_at is not None else 0
+        self.update_type = "unknown"
+        self.total = 0
+        self.context_time = 0
+        self.handlers: List[Tuple[str, str, float]] = []
+        self.bot_api_time = 0
+        self.http_time = 0
+        self._lock = threading.Lock()
+
+    def add_external(self, kind: str, duration: float):
+        with self._lock:
+            if kind == "bot_api":
+                self.bot_api_time += duration
+            else:
+                self.http_time += duration
+
+    def summary(self) -> str:
+        handlers = ", ".join(f"{plugin}:{command}={duration * 1000:.0f}ms"
+                             for plugin, command, duration in self.handlers)
+        return (f"queue wait {self.queue_wait * 1000:.0f}ms, context {self.context_time * 1000:.0f}ms, "
+                f"bot api {self.bot_api_time * 1000:.0f}ms, http {self.http_time * 1000:.0f}ms, "
+                f"handlers: [{handlers}]")
+
+
+current_trace: contextvars.ContextVar[Optional[UpdateTrace]] = contextvars.ContextVar("current_trace", default=None)
+#: Functions called with every finished :class:`UpdateTrace`, used by benchmarks to collect raw timings
+trace_listeners: List[Callable[[UpdateTrace], None]] = []
+
+
+@contextmanager
+def trace_update(update_id: int, queued_at: float = None, slow_threshold: float = 0):
+    """
+    Context manager that traces update handling. Observes update metrics on exit and logs update
+    if it took longer than `slow_threshold` seconds.
+
+    :param update_id: Update ID
+    :param queued_at: :func:`time.monotonic` time when update was queued
+    :param slow_threshold: Slow update log threshold in seconds, 0 disables slow update log
+    """
+    trace = UpdateTrace(update_id, queued_at)
+    token = current_trace.set(trace)
+    try:
+        yield trace
+    finally:
+        current_trace.reset(token)
+        total = trace.total = time.monotonic() - trace.started + trace.queue_wait
+        update_duration.observe(total, trace.update_type)
+        context_duration.observe(trace.context_time, trace.update_type)
+        if queued_at is not None:
+            update_queue_wait.observe(trace.queue_wait)
+        if 0 < slow_threshold <= total:
+            slow_updates.inc()
+            logger.warning("Slow update %s (%s) took %.0fms: %s", update_id, trace.update_type, total * 1000,
+                           trace.summary())
+        for listener in trace_listeners:
+            listener(trace)
+
+
+@contextmanager
+def measure_context():
+    """
+    Measures context creation of current update
+    """
+    started = time.monotonic()
+    try:
+        yield
+    finally:
+        trace = current_trace.get()
+        if trace is not None:
+            trace.context_time += time.monotonic() - started
+
+
+@contextmanager
+def measure_handler(plugin: str, command: str):
+    """
+    Measures handler run time, tagged by plugin module and command
+    """
+    started = time.monotonic()
+    try:
+        yield
+    except Exception:
+        handler_errors.inc(plugin, command)
+        raise
+    finally:
+        duration = time.monotonic() - started
+        handler_duration.observe(duration, plugin, command)
+        trace = current_trace.get()
+        if trace is not None:
+            trace.handlers.append((plugin, command, duration))
+
+
+@contextmanager
+def measure_external(kind: str, label: str):
+    """
+    Measures Bot API (`kind` = `bot_api`, `label` = method) or upstream HTTP (`kind` = `http`, `label` = host) call
+    """
+    started = time.monotonic()
+    try:
+        yield
+    finally:
+        duration = time.monotonic() - started
+        (bot_api_duration if kind == "bot_api" else http_duration).observe(duration, label)
+        trace = current_trace.get()
+        if trace is not None:
+            trace.add_external(kind, duration)
+
+
+class MetricsRequestHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            return self.send_error(404)
+        body = self.server.registry.render().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logger.debug("%s - " + format, self.client_address[0], *args)
+
+
+class MetricsServer(ThreadingHTTPServer):
+    """
+    Serves metrics of registry on `/metrics` in Prometheus text format
+
+    :param address: Tuple of host and port to listen on
+    :type address: :class:`tuple`
+    :param metrics_registry: Registry to serve, defaults to global one
+    :type metrics_registry: :class:`MetricsRegistry`, optional
+    """
+    daemon_threads = True
+
+    def __init__(self, address, metrics_registry: MetricsRegistry = None):
+        self.registry = registry if metrics_registry is None else metrics_registry
+        super(MetricsServer, self).__init__(address, MetricsRequestHandler)
@@ -3,6 +3,7 @@ import threading
 import warnings
 import functools
 from octobot.classes.catalog import CatalogPhoto
+from octobot.database import generate_edit_id
 import types
 thread_local = threading.local()
 
@@ -19,10 +20,6 @@ def add_photo_to_text(text, photo_url):
     return text
 
 
-def generate_edit_id(message):
-    return f"emsg:{message.chat.id}:{message.message_id}"
-
-
 def path_to_module(path: str):
     return path.replace("\\", "/").replace("/", ".").replace(".py", "")
 
@@ -41,6 +38,28 @@ class AddContextDataToLoggingRecord(logging.Filter):
         return True
 
 
+class lazy_property:
+    """
+    Like :class:`functools.cached_property`, but without lock shared by all instances. Value is computed on first
+    access and stored in instance dictionary, two threads accessing it at the same time may both compute it,
+    so use only for values without side effects. Value can be overwritten by assigning to attribute.
+    """
+
+    def __init__(self, function):
+        self.function = function
+        self.name = function.__name__
+        self.__doc__ = function.__doc__
+
+    def __set_name__(self, owner, name):
+        self.name = name
+
+    def __get__(self, instance, owner=None):
+        if instance is None:
+            return self
+        value = instance.__dict__[self.name] = self.function(instance)
+        return value
+
+
 def deprecated(reason):
     def decorator(func):
         if isinstance(func, types.FunctionType):
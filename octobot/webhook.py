@@ -0,0 +1,66 @@
+import hmac
+import json
+import logging
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import telegram
+
+logger = logging.getLogger("Webhook")
+
+SECRET_TOKEN_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+
+class WebhookRequestHandler(BaseHTTPRequestHandler):
+    """
+    Handles single webhook request from Telegram. Update is parsed and put into queue, handling happens in workers.
+    """
+    server: "WebhookServer"
+
+    def do_POST(self):
+        server = self.server
+        if self.path.split("?")[0] != server.path:
+            return self.send_error(404)
+        # compare_digest only accepts ASCII strings, header can contain anything
+        if server.secret_token and not hmac.compare_digest(self.headers.get(SECRET_TOKEN_HEADER, "").encode(),
+                                                           server.secret_token.encode()):
+            logger.warning("Got webhook request from %s with invalid secret token", self.client_address[0])
+            return self.send_error(403)
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            update = telegram.Update.de_json(json.loads(self.rfile.read(length)), server.bot)
+        except (ValueError, TypeError, KeyError):
+            logger.warning("Got invalid webhook request body", exc_info=True)
+            return self.send_error(400)
+        if update is not None:
+            server.queue.put((server.bot, update))
+        self.send_response(200)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        logger.debug("%s - " + format, self.client_address[0], *args)
+
+
+class WebhookServer(ThreadingHTTPServer):
+    """
+    Built-in webhook server. Every request is handled in separate thread and only puts update into the queue,
+    so slow handlers never block accepting new updates.
+
+    :param address: Tuple of host and port to listen on
+    :type address: :class:`tuple`
+    :param bot: Bot instance
+    :type bot: :class:`octobot.OctoBot`
+    :param queue: Queue to put updates into, usually :class:`octobot.dispatcher.Dispatcher`
+    :param secret_token: Secret token that must be present in X-Telegram-Bot-Api-Secret-Token header
+    :type secret_token: :class:`str`, optional
+    :param path: Path to accept updates on, defaults to `/`
+    :type path: :class:`str`, optional
+    """
+    daemon_threads = True
+
+    def __init__(self, address, bot, queue, secret_token: str = None, path: str = "/"):
+        self.bot = bot
+        self.queue = queue
+        self.secret_token = secret_token
+        self.path = path
+        super(WebhookServer, self).__init__(address, WebhookRequestHandler)
@@ -266,12 +266,10 @@ def generate_uname_key(username):
     return f"username:{username.lower()}"
 
 
-@octobot.MessageHandler()
+@octobot.MessageHandler(update_filter=lambda update: bool(update.effective_user and update.effective_user.username))
 def username_cache(bot: octobot.OctoBot, context: octobot.Context):
     if octobot.Database.redis is None:
         return
-    if context.user.username is None or context.user.username == "":
-        return
     uname_key = generate_uname_key(context.user.username)
     if octobot.Database.redis.exists(uname_key) == 0:
         octobot.Database.redis.set(uname_key, context.user.id)
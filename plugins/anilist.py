@@ -31,12 +31,14 @@ import requests
 import telegram
 
 from octobot import Catalog, CatalogKeyArticle, OctoBot, Context, CatalogPhoto, CatalogNotFound, localizable, \
-    PluginInfo, CatalogCantGoBackwards, CatalogCantGoDeeper, UpdateType, Database
+    PluginInfo, CatalogCantGoBackwards, CatalogCantGoDeeper, UpdateType, Database, CachePolicy
 from octobot.catalogs import CatalogHandler
 from octobot.dataclass import Suggestion
 
 GRAPHQL_URL = "https://graphql.anilist.co"
 
+Database.set_cache_policy("graphql.anilist.co", CachePolicy(ttl=3600, stale_ttl=86400, negative_ttl=300))
+
 GRAPHQL_QUERY = """
 query Media($query: String, $page: Int, $perPage: Int, $type: MediaType) {
   Page(page: $page, perPage: $perPage) {
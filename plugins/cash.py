@@ -36,6 +36,7 @@ CURR_TEMPLATE = octobot.localizable("""
 <a href="http://exchangerate.host/">Powered by exchangerate.host</a>
 """)
 LOGGER = plugin.logger
+octobot.Database.set_cache_policy("api.exchangerate.host", octobot.CachePolicy(ttl=1800, stale_ttl=3600))
 
 
 def number_conv(amount):
@@ -2,7 +2,6 @@ import html
 import os
 import sys
 
-import requests
 import sentry_sdk
 import telegram
 
@@ -76,17 +75,17 @@ def feedback_handle_query(bot, ctx):
 @octobot.ChosenInlineResultHandler("feedback")
 def feedback_handle_inresult(bot, ctx):
     feedback = ' '.join(ctx.query.split()[1:])
-    r = requests.post(f"https://sentry.io/api/0/projects/{Settings.sentry.organization_slug}/"
-                      f"{Settings.sentry.project_slug}/user-feedback/",
-                      headers={
-                          "Authorization": "DSN " + Settings.sentry.dsn
-                      },
-                      json=dict(
-                          event_id=ctx.args[0],
-                          name=ctx.user.first_name,
-                          email=f"{ctx.user.id}_{ctx.user.username}@telegram.domain",
-                          comments=feedback
-                      ))
+    r = octobot.httpclient.session.post(f"https://sentry.io/api/0/projects/{Settings.sentry.organization_slug}/"
+                                        f"{Settings.sentry.project_slug}/user-feedback/",
+                                        headers={
+                                            "Authorization": "DSN " + Settings.sentry.dsn
+                                        },
+                                        json=dict(
+                                            event_id=ctx.args[0],
+                                            name=ctx.user.first_name,
+                                            email=f"{ctx.user.id}_{ctx.user.username}@telegram.domain",
+                                            comments=feedback
+                                        ))
     plugin.logger.debug(r.text)
 
 
@@ -52,12 +52,10 @@ def check_spamwatch_ban(user: telegram.User):
     return ban_data
 
 
-@octobot.MessageHandler()
+@octobot.MessageHandler(update_filter=lambda update: update.effective_chat.type == "supergroup")
 @octobot.not_admin
 @octobot.my_permissions("can_restrict_members")
 def spamwatch_handle_user(bot: octobot.OctoBot, ctx: octobot.Context):
-    if ctx.chat.type != "supergroup":
-        return
     chat_action = ctx.chat_db.get(SPAMWATCH_DB_KEY, Settings.spamwatch.default_action)
     if chat_action == "nothing":
         return
@@ -59,13 +59,11 @@ def list_bannedpacks(bot: octobot.OctoBot, context: octobot.Context):
         context.reply(context.localize("There are no stickerpacks that are banned in this chat"))
 
 
-@octobot.MessageHandler()
+@octobot.MessageHandler(update_filter=lambda update: update.message.sticker is not None)
 @octobot.not_admin
 def handle_sticker(bot: octobot.OctoBot, context: octobot.Context):
     if octobot.Database.redis is None:
         return
-    if context.update.message.sticker is None:
-        return
     packname = str(context.update.message.sticker.set_name)
     if octobot.Database.redis.sismember(create_redis_set_name(context.chat), packname) == 1:
         context.update.message.delete()
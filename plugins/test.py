@@ -53,6 +53,11 @@ def test(bot, context):
                   )
 
 
+@CommandHandler(command="asynctest", description="Test coroutine handler")
+async def test_async(bot, context):
+    await context.areply("Hello async world! " + context.query)
+
+
 @CommandHandler(command="imgtest", description="Test image handling")
 def imgtest(bot, context):
     context.reply("Test!", photo_url="https://picsum.photos/seed/test/200/200",
@@ -1,6 +1,5 @@
 import html
 
-import requests
 import telegram
 
 import octobot
@@ -34,7 +33,7 @@ def urban_query(query, index, max_amount, bot: octobot.OctoBot, ctx: octobot.Con
         return
     if index < 0:
         raise catalogs.CatalogCantGoBackwards
-    r = requests.get(apiurl, params={"term": query}).json()
+    r = octobot.httpclient.session.get(apiurl, params={"term": query}).json()
     if "list" in r and len(r["list"]) > 0:
         definitions = r["list"]
         if index > len(definitions):
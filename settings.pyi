@@ -15,7 +15,11 @@ class _Settings:
     telegram_base_file_url: str
     telegram_base_file_url_force: bool
     threads: int
+    execution_mode: str
+    async_concurrency: int
     exclude_plugins: list
+    lazy_plugins: bool
+    plugin_load_workers: int
     support_url: str
     user_agent: str
     mozamibque_here_token: str
@@ -26,9 +30,17 @@ class _Settings:
     no_image: str
     spoiler_ttl: int
     sentry: dict_sentry
+    http: dict_http
+    http_cache: dict_http_cache
     redis: dict_redis
     spamwatch: dict_spamwatch
     ratelimit: dict_ratelimit
+    send_queue: dict_send_queue
+    updates: dict_updates
+    prefork: dict_prefork
+    stream_queue: dict_stream_queue
+    tracing: dict_tracing
+    webhook: dict_webhook
     def __init__(self, settings_folder: Any = ...) -> Any: ...
     def reload_settings(self) -> Any: ...
     def update_settings(self, settings: Any) -> Any: ...
@@ -48,10 +60,23 @@ class dict_sentry(dotdict):
     organization_slug: str
     project_slug: str
 
+class dict_http(dotdict):
+    pool_size: int
+    connect_timeout: float
+    read_timeout: float
+
+class dict_http_cache(dotdict):
+    max_body_size: int
+    compress_min_size: int
+    lock_ttl: int
+
 class dict_redis(dotdict):
     host: str
     port: int
     db: int
+    local_cache: bool
+    local_cache_size: int
+    local_cache_ttl: int
 
 class dict_spamwatch(dotdict):
     api_host: str
@@ -64,3 +89,47 @@ class dict_ratelimit(dotdict):
     messages_timeframe: int
     ban_time: int
     adm_abuse_leave: bool
+    user_limit: int
+    command_limit: int
+
+class dict_send_queue(dotdict):
+    enabled: bool
+    global_rate: float
+    private_rate: float
+    group_rate: float
+    burst: int
+    workers: int
+
+class dict_updates(dotdict):
+    resume: bool
+    offset_save_interval: float
+    drain_timeout: float
+
+class dict_prefork(dotdict):
+    enabled: bool
+    workers: int
+
+class dict_stream_queue(dotdict):
+    enabled: bool
+    role: str
+    partitions: int
+    prefix: str
+    max_length: int
+    lease_ttl: int
+    prefetch: int
+    max_deliveries: int
+
+class dict_tracing(dotdict):
+    slow_update_threshold: float
+    metrics_enabled: bool
+    metrics_listen: str
+    metrics_port: int
+
+class dict_webhook(dotdict):
+    enabled: bool
+    url: str
+    listen: str
+    port: int
+    path: str
+    secret_token: str
+    max_connections: int
@@ -0,0 +1,80 @@
+import asyncio
+import logging
+import os
+import threading
+
+logging.basicConfig(level=logging.DEBUG)
+os.environ["ob_testing"] = 'true'
+import unittest
+import telegram
+
+try:
+    import octobot
+except ModuleNotFoundError:
+    import sys
+    import os
+
+    SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+    sys.path.append(os.path.dirname(SCRIPT_DIR))
+    import octobot
+from octobot.dispatcher import AsyncDispatcher, Dispatcher
+
+
+def create_update(update_id, chat_id):
+    chat = telegram.Chat(chat_id, type="supergroup")
+    return telegram.Update(update_id=update_id, message=telegram.Message(message_id=update_id, chat=chat,
+                                                                         date=None, text="hi"))
+
+
+class FakeBot:
+    def __init__(self):
+        self.handled = []
+        self.lock = threading.Lock()
+
+    def handle_update(self, bot, update, queued_at=None):
+        if update.effective_message.text == "halt":
+            raise octobot.Halt
+        with self.lock:
+            self.handled.append((threading.current_thread().name, update.effective_chat.id, update.update_id))
+
+    async def handle_update_async(self, bot, update, queued_at=None):
+        await asyncio.sleep(0)
+        self.handle_update(bot, update)
+
+
+class DispatcherTest(unittest.TestCase):
+    def test_chat_ordering(self):
+        bot = FakeBot()
+        dispatcher = Dispatcher(4).start()
+        for update_id in range(100):
+            dispatcher.put((bot, create_update(update_id, -100 - update_id % 7)))
+        dispatcher.stop()
+        self.assertEqual(len(bot.handled), 100)
+        for chat_id in range(-100, -107, -1):
+            chat_updates = [upd for upd in bot.handled if upd[1] == chat_id]
+            self.assertEqual(len({upd[0] for upd in chat_updates}), 1)
+            self.assertEqual([upd[2] for upd in chat_updates], sorted(upd[2] for upd in chat_updates))
+
+    def test_halt(self):
+        bot = FakeBot()
+        dispatcher = Dispatcher(2).start()
+        update = create_update(0, 1)
+        update.message.text = "halt"
+        dispatcher.put((bot, update))
+        self.assertTrue(dispatcher.stop_event.wait(5))
+        dispatcher.stop()
+
+    def test_async_chat_ordering(self):
+        bot = FakeBot()
+        dispatcher = AsyncDispatcher(16, 2).start()
+        for update_id in range(100):
+            dispatcher.put((bot, create_update(update_id, -100 - update_id % 7)))
+        dispatcher.stop()
+        self.assertEqual(len(bot.handled), 100)
+        for chat_id in range(-100, -107, -1):
+            chat_updates = [upd[2] for upd in bot.handled if upd[1] == chat_id]
+            self.assertEqual(chat_updates, sorted(chat_updates))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,89 @@
+import datetime
+import logging
+import os
+import types
+
+logging.basicConfig(level=logging.DEBUG)
+os.environ["ob_testing"] = 'true'
+import unittest
+import telegram
+
+try:
+    import octobot
+except ModuleNotFoundError:
+    import sys
+    import os
+
+    SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+    sys.path.append(os.path.dirname(SCRIPT_DIR))
+    import octobot
+from octobot.handlerindex import HandlerIndex
+
+
+def handler_function(bot, ctx):
+    pass
+
+
+class HandlerIndexTest(unittest.TestCase):
+    def setUp(self):
+        self.test = octobot.CommandFilter("test")(handler_function)
+        self.test_long = octobot.CommandFilter(["testing", "t2"])(handler_function)
+        self.word_swap = octobot.CommandFilter("s/", prefix="")(handler_function)
+        self.with_perms = octobot.CommandFilter("perm")(octobot.PermissionFilter("caller", "is_admin")(handler_function))
+        self.generic = octobot.ContextFilter(octobot.MessageContext)(handler_function)
+        self.index = HandlerIndex({0: [self.test, self.test_long, self.with_perms],
+                                   -1: [self.generic], 1: [self.word_swap]})
+
+    def get_handlers(self, text):
+        return self.index.get_handlers(types.SimpleNamespace(text=text))
+
+    def test_plain_text(self):
+        self.assertEqual(self.get_handlers("hello there"), [self.generic])
+
+    def test_command(self):
+        self.assertEqual(self.get_handlers("/test hi"), [self.generic, self.test])
+        self.assertEqual(self.get_handlers("/testing"), [self.generic, self.test, self.test_long])
+        self.assertEqual(self.get_handlers("/perm@test_bot"), [self.generic, self.with_perms])
+        self.assertEqual(self.get_handlers("s/a/b"), [self.generic, self.word_swap])
+
+    def test_is_relevant(self):
+        chat = telegram.Chat(1, type="supergroup")
+
+        def message(text):
+            return telegram.Update(0, message=telegram.Message(0, datetime.datetime.now(), chat, text=text))
+
+        commands_only = octobot.MessageHandler(commands_only=True)(handler_function)
+        button = octobot.InlineButtonHandler("test:")(handler_function)
+        index = HandlerIndex({0: [self.test, self.word_swap], -1: [commands_only], 1: [button]})
+        self.assertFalse(index.is_relevant(message("hello there")))
+        self.assertFalse(index.is_relevant(message(None)))
+        self.assertTrue(index.is_relevant(message("/test hi")))
+        self.assertEqual(index.get_handlers(types.SimpleNamespace(text="hello there")), [button])
+        self.assertEqual(index.get_handlers(types.SimpleNamespace(text="/test")), [commands_only, self.test, button])
+        self.assertTrue(self.index.is_relevant(message("hello there")))
+
+    def test_update_filter(self):
+        chat = telegram.Chat(1, type="supergroup")
+        stickers = octobot.MessageHandler(update_filter=lambda update: update.message.sticker is not None)(
+            handler_function)
+        index = HandlerIndex({0: [self.test, stickers]})
+        sticker = telegram.Sticker("id", "unique_id", 512, 512, False, False, "regular")
+        self.assertFalse(index.is_relevant(telegram.Update(0, message=telegram.Message(
+            0, datetime.datetime.now(), chat, text="hello there"))))
+        self.assertFalse(index.is_relevant(telegram.Update(0, edited_message=telegram.Message(
+            0, datetime.datetime.now(), chat, text="hello there"))))
+        self.assertTrue(index.is_relevant(telegram.Update(0, message=telegram.Message(
+            0, datetime.datetime.now(), chat, sticker=sticker))))
+
+    def test_default_plugins(self):
+        bot = octobot.OctoBot(["plugins.test"])
+        chat = telegram.Chat(1, type="supergroup")
+        user = telegram.User(2, "Test", False)
+        self.assertFalse(bot.handler_index.is_relevant(telegram.Update(0, message=telegram.Message(
+            0, datetime.datetime.now(), chat, from_user=user, text="hello there"))))
+        self.assertTrue(bot.handler_index.is_relevant(telegram.Update(0, message=telegram.Message(
+            0, datetime.datetime.now(), chat, from_user=user, text="/test"))))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,63 @@
+import logging
+import os
+
+logging.basicConfig(level=logging.DEBUG)
+os.environ["ob_testing"] = 'true'
+import unittest
+import fakeredis
+
+try:
+    import octobot
+except ModuleNotFoundError:
+    import sys
+    import os
+
+    SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+    sys.path.append(os.path.dirname(SCRIPT_DIR))
+    import octobot
+from octobot.offsets import UpdateOffsetTracker
+
+
+class TestUpdateOffsets(unittest.TestCase):
+    def test_watermark_and_resume(self):
+        redis = fakeredis.FakeRedis()
+        offsets = UpdateOffsetTracker(redis, 1, save_interval=0)
+        self.assertEqual([offsets.received(update_id) for update_id in (10, 11, 12, 11)], [True, True, True, False])
+        offsets.done(11)
+        offsets.done(12)
+        self.assertEqual(offsets.fetch_offset(), 13)
+        self.assertEqual(int(redis.get("update_offset:1")), 10)
+        offsets.done(10)
+        self.assertEqual(int(redis.get("update_offset:1")), 13)
+
+        resumed = UpdateOffsetTracker(redis, 1)
+        self.assertEqual(resumed.load(), 13)
+        self.assertEqual(resumed.fetch_offset(), 13)
+        self.assertFalse(resumed.received(12))
+        self.assertTrue(resumed.received(13))
+
+    def test_crash_with_queued_updates(self):
+        redis = fakeredis.FakeRedis()
+        offsets = UpdateOffsetTracker(redis, 1, save_interval=0)
+        for update_id in (10, 11, 12):
+            self.assertTrue(offsets.received(update_id))
+        offsets.persist({update_id: f'{{"update_id": {update_id}}}' for update_id in (10, 11, 12)})
+        # Received updates are confirmed to Telegram, so polling does not return them again
+        self.assertEqual(offsets.fetch_offset(), 13)
+        offsets.done(11)
+
+        # Process dies with 10 and 12 still queued
+        resumed = UpdateOffsetTracker(redis, 1)
+        self.assertEqual(resumed.load(), 10)
+        self.assertEqual(resumed.load_backlog(), ['{"update_id": 10}', '{"update_id": 12}'])
+        self.assertEqual(resumed.fetch_offset(), 13)
+        self.assertFalse(resumed.received(12))
+        resumed.done(10)
+        resumed.done(12)
+        resumed.save()
+        self.assertEqual(int(redis.get("update_offset:1")), 13)
+        self.assertEqual(UpdateOffsetTracker(redis, 1).load_backlog(), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
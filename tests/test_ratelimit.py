@@ -0,0 +1,75 @@
+import logging
+import os
+
+logging.basicConfig(level=logging.DEBUG)
+os.environ["ob_testing"] = 'true'
+import unittest
+import fakeredis
+
+try:
+    import octobot
+except ModuleNotFoundError:
+    import sys
+    import os
+
+    SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+    sys.path.append(os.path.dirname(SCRIPT_DIR))
+    import octobot
+from octobot.ratelimit import RateLimiter, ADMIN_ABUSE, USER_ABUSE
+from settings import Settings, dotdict
+
+try:
+    import lupa
+except ImportError:
+    lupa = None
+
+
+class RateLimiterTests:
+    scripting = True
+
+    def setUp(self):
+        self.limiter = RateLimiter(fakeredis.FakeRedis())
+        self.limiter.scripting = self.scripting
+        self.config = Settings.ratelimit
+
+    def tearDown(self):
+        Settings["ratelimit"] = self.config
+
+    def test_chat_block(self):
+        for _ in range(Settings.ratelimit.messages_threshold):
+            self.assertEqual(self.limiter.hit(1, 2, "test"), (None, False, True))
+        self.assertEqual(self.limiter.hit(1, 2, "test"), (USER_ABUSE, True, False))
+        self.assertEqual(self.limiter.hit(1, 3, "test"), (USER_ABUSE, False, False))
+        self.assertEqual(self.limiter.hit(1, 3, "test", admin=True), (USER_ABUSE, False, True))
+        self.assertEqual(self.limiter.hit(2, 2, "test"), (None, False, True))
+        self.limiter.unban(1)
+        self.assertEqual(self.limiter.hit(1, 2, "test"), (USER_ABUSE, True, False))
+
+    def test_admin_abuse(self):
+        for _ in range(Settings.ratelimit.messages_threshold):
+            self.assertEqual(self.limiter.hit(1, 2, "test", admin=True), (None, False, True))
+        self.assertEqual(self.limiter.hit(1, 2, "test", admin=True), (ADMIN_ABUSE, True, False))
+        self.assertEqual(self.limiter.hit(1, 3, "test"), (ADMIN_ABUSE, False, False))
+
+    def test_user_and_command_limits(self):
+        Settings["ratelimit"] = dotdict(self.config, user_limit=2, command_limit=1)
+        self.assertTrue(self.limiter.hit(1, 2, "test")[2])
+        self.assertFalse(self.limiter.hit(1, 3, "test")[2])
+        self.assertTrue(self.limiter.hit(1, 2, "other")[2])
+        self.assertFalse(self.limiter.hit(2, 2, "test")[2])
+        self.assertTrue(self.limiter.hit(2, 3, "test")[2])
+
+
+@unittest.skipUnless(lupa, "lupa is required to run Redis scripts in fakeredis")
+class ScriptRateLimiterTestCase(RateLimiterTests, unittest.TestCase):
+    def test_uses_script(self):
+        self.limiter.hit(1, 2, "test")
+        self.assertTrue(self.limiter.scripting)
+
+
+class FallbackRateLimiterTestCase(RateLimiterTests, unittest.TestCase):
+    scripting = False
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,80 @@
+import logging
+import os
+import threading
+import time
+
+logging.basicConfig(level=logging.DEBUG)
+os.environ["ob_testing"] = 'true'
+import unittest
+import telegram.error
+
+try:
+    import octobot
+except ModuleNotFoundError:
+    import sys
+    import os
+
+    SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+    sys.path.append(os.path.dirname(SCRIPT_DIR))
+    import octobot
+from octobot.sendqueue import Priority, SendQueue
+
+
+class FakeApi:
+    def __init__(self, retry_after_on=None):
+        self.sent = []
+        self.lock = threading.Lock()
+        self.retry_after_on = retry_after_on
+
+    def send_message(self, chat_id, text):
+        if (chat_id, text) == self.retry_after_on:
+            self.retry_after_on = None
+            raise telegram.error.RetryAfter(0.1)
+        with self.lock:
+            self.sent.append((chat_id, text))
+        return text
+
+
+class TestSendQueue(unittest.TestCase):
+    def test_chat_order_and_retry_after(self):
+        api = FakeApi(retry_after_on=(-1, 1))
+        queue = SendQueue(global_rate=1000, private_rate=1000, group_rate=1000, burst=10, workers=4).start()
+        futures = [queue.submit(chat_id, Priority.normal, api.send_message, chat_id, i)
+                   for i in range(5) for chat_id in (-1, 2)]
+        self.assertEqual([future.result(timeout=5) for future in futures], [i for i in range(5) for _ in range(2)])
+        queue.stop()
+        for chat_id in (-1, 2):
+            self.assertEqual([text for chat, text in api.sent if chat == chat_id], list(range(5)))
+
+    def test_priority(self):
+        api = FakeApi()
+        queue = SendQueue(global_rate=1000, private_rate=1000, group_rate=1000, burst=10, workers=1)
+        queue.submit(1, Priority.bulk, api.send_message, 1, "bulk")
+        queue.submit(None, Priority.urgent, api.send_message, None, "urgent")
+        queue.start().stop()
+        self.assertEqual(api.sent, [(None, "urgent"), (1, "bulk")])
+
+    def test_retry_after_during_stop(self):
+        started = threading.Event()
+        release = threading.Event()
+
+        def send_message():
+            started.set()
+            release.wait(5)
+            raise telegram.error.RetryAfter(10)
+
+        queue = SendQueue(global_rate=1000, private_rate=1000, group_rate=1000, burst=10, workers=1).start()
+        future = queue.submit(1, Priority.normal, send_message)
+        self.assertTrue(started.wait(5))
+        stopper = threading.Thread(target=queue.stop)
+        stopper.start()
+        while queue._running:
+            time.sleep(0.01)
+        release.set()
+        self.assertIsInstance(future.exception(timeout=5), telegram.error.RetryAfter)
+        stopper.join(5)
+        self.assertFalse(stopper.is_alive())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,3 +1,4 @@
+import asyncio
 import datetime
 import logging
 import os
@@ -38,6 +39,55 @@ class TestOctoBot(unittest.TestCase):
             [telegram.InlineKeyboardButton(callback_data="test:", text="Change text")]
         ]))
 
+    @unittest.mock.patch("octobot.context.Context.reply")
+    def test_asyncCmdHandle(self, reply):
+        bot = octobot.OctoBot(["plugins.test"])
+        update = telegram.Update(update_id=0,
+                                 message=telegram.Message(
+                                     message_id=0,
+                                     from_user=USER,
+                                     chat=CHAT,
+                                     text="/asynctest hi",
+                                     date=datetime.datetime.now()
+                                 ))
+        asyncio.run(bot.handle_update_async(bot, update))
+        reply.assert_called_with("Hello async world! hi")
+        reply.reset_mock()
+        bot.handle_update(bot, update)
+        reply.assert_called_with("Hello async world! hi")
+
+    @unittest.mock.patch("octobot.lazyplugins.save_manifest")
+    @unittest.mock.patch("octobot.context.Context.reply")
+    def test_lazyCmdHandle(self, reply, save_manifest):
+        bot = octobot.OctoBot(["plugins.test"])
+        manifest = {"plugins.test": octobot.lazyplugins.describe_plugin(bot.plugins["plugins.test"])}
+        with unittest.mock.patch("octobot.lazyplugins.load_manifest", return_value=manifest):
+            bot.load_plugins({"exclude": [], "load_order": ["plugins.test"]}, lazy=True)
+        self.assertIn("plugins.test", bot.lazy_handlers)
+        update = telegram.Update(update_id=0,
+                                 message=telegram.Message(
+                                     message_id=0,
+                                     from_user=USER,
+                                     chat=CHAT,
+                                     text="/testing hi",
+                                     date=datetime.datetime.now()
+                                 ))
+        bot.handle_update(bot, update)
+        self.assertIn("plugins.test", bot.lazy_handlers)
+        update = telegram.Update(update_id=0,
+                                 message=telegram.Message(
+                                     message_id=0,
+                                     from_user=USER,
+                                     chat=CHAT,
+                                     text="/test hi",
+                                     date=datetime.datetime.now()
+                                 ))
+        bot.handle_update(bot, update)
+        self.assertNotIn("plugins.test", bot.lazy_handlers)
+        reply.assert_called_with("Hello world! hi", reply_markup=telegram.InlineKeyboardMarkup([
+            [telegram.InlineKeyboardButton(callback_data="test:", text="Change text")]
+        ]))
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,279 @@
+"""
+Replays synthetic update stream through OctoBot.handle_update and reports throughput, per-stage latency and allocations.
+
+Bot runs in DRY_RUN mode with stubbed Bot API, against fakeredis (default) or local Redis (--redis).
+Only base plugins and plugins.test are loaded, so no upstream HTTP requests are made.
+
+Usage: python utils/benchmark.py [--updates 5000] [--workers 0 [--rate 0]] [--redis] [--allocations] [--json out.json]
+"""
+import argparse
+import gc
+import json
+import logging
+import os
+import random
+import statistics
+import sys
+import threading
+import time
+import tracemalloc
+
+if not os.path.exists("octobot"):
+    os.chdir("..")
+
+parser = argparse.ArgumentParser(description="Replay synthetic updates through OctoBot and measure it")
+parser.add_argument("--updates", type=int, default=5000, help="Amount of updates to replay")
+parser.add_argument("--warmup", type=int, default=500, help="Amount of updates to replay before measuring")
+parser.add_argument("--workers", type=int, default=0,
+                    help="Replay through Dispatcher with that many workers instead of calling handle_update directly")
+parser.add_argument("--rate", type=float, default=0,
+                    help="Feed updates at this rate (updates per second) instead of all at once, used with --workers")
+parser.add_argument("--users", type=int, default=1000, help="Amount of distinct users sending updates")
+parser.add_argument("--chats", type=int, default=50, help="Amount of distinct group chats")
+parser.add_argument("--api-latency", type=float, default=0, help="Simulated Bot API call latency in milliseconds")
+parser.add_argument("--redis", action="store_true", help="Use local Redis from settings instead of fakeredis")
+parser.add_argument("--allocations", action="store_true",
+                    help="Also replay stream with tracemalloc enabled and report memory allocated per update")
+parser.add_argument("--seed", type=int, default=0, help="Random seed for update stream")
+parser.add_argument("--json", help="Save results to this file")
+parser.add_argument("--compare", help="Compare results with ones previously saved with --json")
+args = parser.parse_args()
+
+os.environ["DRY_RUN"] = "1"
+if not args.redis:
+    os.environ["ob_testing"] = "true"
+logging.basicConfig(level=logging.WARNING)
+
+try:
+    import octobot
+except ModuleNotFoundError:
+    sys.path.append(os.getcwd())
+    import octobot
+import telegram
+import telegram.ext
+
+from octobot import tracing
+from octobot.dispatcher import Dispatcher
+
+STAGES = ("total", "queue_wait", "context", "handlers", "bot_api", "http")
+BOT_USER = {"id": 4, "is_bot": True, "first_name": "Benchmark", "username": "bench_bot"}
+
+
+class StubRequest:
+    """
+    Stands in for PTB Request, answers Bot API calls locally without network
+    """
+
+    def __init__(self, latency: float = 0):
+        self.latency = latency
+        self.message_id = 1000000
+        self.lock = threading.Lock()
+        self.calls = 0
+
+    def post(self, url, data=None, timeout=None):
+        endpoint = url.rsplit("/", 1)[1]
+        with self.lock:
+            self.calls += 1
+            self.message_id += 1
+            message_id = self.message_id
+        if self.latency:
+            time.sleep(self.latency)
+        if endpoint == "getMe":
+            return BOT_USER
+        if endpoint == "getChatAdministrators":
+            return []
+        if (endpoint.startswith("send") or endpoint.startswith("edit")) and "chat_id" in data:
+            chat_id = int(data["chat_id"])
+            return {"message_id": data.get("message_id", message_id), "date": int(time.time()),
+                    "chat": {"id": chat_id, "type": "supergroup" if chat_id < 0 else "private"},
+                    "from": BOT_USER, "text": data.get("text") or data.get("caption") or ""}
+        return True
+
+
+class UpdateStream:
+    """
+    Generates realistic mix of updates: commands, group chatter, paginated inline queries,
+    button presses and edits of previously sent commands
+    """
+    KINDS = (("command", 30), ("chatter", 35), ("inline", 15), ("callback", 10), ("edit", 10))
+    COMMANDS = ("/test hi", "/helloworld", "/asynctest hey", "/catalogtesta cats", "/start")
+    CHATTER = ("hi", "lol", "does anyone know how to use this bot", "/notacommand", "ok", "👍",
+               "test test test", "what about /test?")
+
+    def __init__(self, bot, users: int, chats: int, seed: int):
+        self.bot = bot
+        self.random = random.Random(seed)
+        self.users = [{"id": 100000 + i, "is_bot": False, "first_name": f"User {i}",
+                       "language_code": self.random.choice(("en", "ru", "de", None))} for i in range(users)]
+        self.groups = [{"id": -1001000000000 - i, "type": "supergroup", "title": f"Group {i}"} for i in range(chats)]
+        self.update_id = 0
+        self.message_id = 0
+        self.sent_commands = []
+        self.kinds = [kind for kind, _ in self.KINDS]
+        self.weights = [weight for _, weight in self.KINDS]
+
+    def _message(self, text, user, chat):
+        self.message_id += 1
+        return {"message_id": self.message_id, "date": int(time.time()), "chat": chat, "from": user, "text": text}
+
+    def _chat(self, user):
+        if self.random.random() < 0.3:
+            return {"id": user["id"], "type": "private", "first_name": user["first_name"]}
+        return self.random.choice(self.groups)
+
+    def generate(self, amount: int):
+        updates = []
+        for _ in range(amount):
+            self.update_id += 1
+            kind = self.random.choices(self.kinds, self.weights)[0]
+            if kind == "edit" and not self.sent_commands:
+                kind = "command"
+            user = self.random.choice(self.users)
+            update = {"update_id": self.update_id}
+            if kind == "command":
+                message = self._message(self.random.choice(self.COMMANDS), user, self._chat(user))
+                self.sent_commands.append(message)
+                self.sent_commands = self.sent_commands[-100:]
+                update["message"] = message
+            elif kind == "chatter":
+                update["message"] = self._message(self.random.choice(self.CHATTER), user,
+                                                  self.random.choice(self.groups))
+            elif kind == "inline":
+                update["inline_query"] = {"id": str(self.update_id), "from": user, "query": "catalogtesta cats",
+                                          "offset": self.random.choice(("", "5", "10"))}
+            elif kind == "callback":
+                keyboard = self.bot.callback_data_cache.process_keyboard(telegram.InlineKeyboardMarkup(
+                    [[telegram.InlineKeyboardButton("Change text", callback_data="test:")]]))
+                message = self._message("Hello world!", BOT_USER, self._chat(user))
+                message["reply_markup"] = keyboard.to_dict()
+                update["callback_query"] = {"id": str(self.update_id), "from": user, "chat_instance": "bench",
+                                            "message": message,
+                                            "data": keyboard.inline_keyboard[0][0].callback_data}
+            else:
+                message = dict(self.random.choice(self.sent_commands), edit_date=int(time.time()))
+                update["edited_message"] = message
+            updates.append(update)
+        return updates
+
+    def parse(self, updates):
+        parsed = []
+        for update in updates:
+            update = telegram.Update.de_json(update, self.bot)
+            if update.callback_query is not None:
+                self.bot.insert_callback_data(update)
+            parsed.append(update)
+        return parsed
+
+
+def create_bot(api_latency: float):
+    bot = octobot.OctoBot(["plugins.test"])
+    telegram.ext.ExtBot.__init__(bot, "123456:" + "A" * 35, arbitrary_callback_data=True,
+                                 request=StubRequest(api_latency))
+    bot.me = telegram.User.de_json(BOT_USER, bot)
+    return bot
+
+
+def replay(bot, updates, workers: int, rate: float = 0):
+    started = time.perf_counter()
+    if workers > 0:
+        dispatcher = Dispatcher(workers).start()
+        for i, update in enumerate(updates):
+            if rate > 0:
+                delay = started + i / rate - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+            dispatcher.put((bot, update))
+        dispatcher.stop()
+    else:
+        for update in updates:
+            bot.handle_update(bot, update)
+    return time.perf_counter() - started
+
+
+def percentiles(samples):
+    samples = sorted(samples)
+    if not samples:
+        return {}
+
+    def pick(fraction):
+        return samples[min(len(samples) - 1, int(len(samples) * fraction))] * 1000
+
+    return {"p50": pick(0.5), "p90": pick(0.9), "p99": pick(0.99), "max": samples[-1] * 1000,
+            "mean": statistics.fmean(samples) * 1000}
+
+
+def measure_allocations(bot, updates):
+    tracemalloc.start()
+    peaks = []
+    baseline = tracemalloc.get_traced_memory()[0]
+    for update in updates:
+        before = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+        bot.handle_update(bot, update)
+        peaks.append(tracemalloc.get_traced_memory()[1] - before)
+    retained = tracemalloc.get_traced_memory()[0] - baseline
+    tracemalloc.stop()
+    return {"peak_kib_per_update": statistics.fmean(peaks) / 1024,
+            "retained_bytes_per_update": retained / len(updates)}
+
+
+def main():
+    bot = create_bot(args.api_latency / 1000)
+    stream = UpdateStream(bot, args.users, args.chats, args.seed)
+    replay(bot, stream.parse(stream.generate(args.warmup)), args.workers)
+
+    traces = []
+    tracing.trace_listeners.append(traces.append)
+    updates = stream.parse(stream.generate(args.updates))
+    gc_before = sum(stat["collections"] for stat in gc.get_stats())
+    api_calls_before = bot.request.calls
+    elapsed = replay(bot, updates, args.workers, args.rate)
+    gc_collections = sum(stat["collections"] for stat in gc.get_stats()) - gc_before
+    tracing.trace_listeners.remove(traces.append)
+
+    stage_samples = {stage: [] for stage in STAGES}
+    for trace in traces:
+        stage_samples["total"].append(trace.total)
+        stage_samples["queue_wait"].append(trace.queue_wait)
+        stage_samples["context"].append(trace.context_time)
+        stage_samples["handlers"].append(sum(duration for _, _, duration in trace.handlers))
+        stage_samples["bot_api"].append(trace.bot_api_time)
+        stage_samples["http"].append(trace.http_time)
+    results = {
+        "updates": len(updates),
+        "workers": args.workers,
+        "updates_per_second": len(updates) / elapsed,
+        "bot_api_calls_per_update": (bot.request.calls - api_calls_before) / len(updates),
+        "gc_collections_per_1k_updates": gc_collections * 1000 / len(updates),
+        "stages_ms": {stage: percentiles(samples) for stage, samples in stage_samples.items()},
+    }
+    if args.allocations:
+        results["allocations"] = measure_allocations(bot, stream.parse(stream.generate(min(args.updates, 1000))))
+
+    print(f"Replayed {results['updates']} updates in {elapsed:.2f}s "
+          f"({'direct' if args.workers == 0 else str(args.workers) + ' workers'})")
+    print(f"Throughput: {results['updates_per_second']:.1f} updates/s")
+    print(f"Bot API calls per update: {results['bot_api_calls_per_update']:.2f}")
+    print(f"GC collections per 1k updates: {results['gc_collections_per_1k_updates']:.1f}")
+    print(f"{'stage':<12}{'p50':>10}{'p90':>10}{'p99':>10}{'max':>10}{'mean':>10}  (ms)")
+    for stage, values in results["stages_ms"].items():
+        print(f"{stage:<12}" + "".join(f"{values.get(key, 0):>10.3f}" for key in ("p50", "p90", "p99", "max", "mean")))
+    if "allocations" in results:
+        print(f"Peak allocated per update: {results['allocations']['peak_kib_per_update']:.1f} KiB, "
+              f"retained per update: {results['allocations']['retained_bytes_per_update']:.0f} B")
+    if args.compare:
+        with open(args.compare) as f:
+            previous = json.load(f)
+        print("Compared to", args.compare)
+        print(f"  updates/s: {previous['updates_per_second']:.1f} -> {results['updates_per_second']:.1f} "
+              f"({(results['updates_per_second'] / previous['updates_per_second'] - 1) * 100:+.1f}%)")
+        for key in ("p50", "p99"):
+            before, after = previous["stages_ms"]["total"][key], results["stages_ms"]["total"][key]
+            print(f"  total {key}: {before:.3f}ms -> {after:.3f}ms ({(after / before - 1) * 100:+.1f}%)")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()